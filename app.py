@@ -1,29 +1,29 @@
-import openai
 import os
 import streamlit as st
-from deta import Deta
-import bcrypt
 import datetime
-from datetime import date
-from jinja2 import Environment, PackageLoader, select_autoescape, FileSystemLoader
-from dotenv import load_dotenv
-from pathlib import Path
-from pathlib import Path
-import requests
-import json
-import random
-from PIL import Image
 from streamlit_lottie import st_lottie
 from streamlit_option_menu import option_menu
+import assets
+import metrics
+from events import EventLog, recent_logins
+from feed import Feed, recipe_key
+from nutrition import annotate, summary
+from passwords import LoginThrottle, TooManyAttempts, check_password, hash_password, needs_rehash
+from storage import TRIM, shared_base
+from write_behind import WriteBehindQueue
+from response_cache import ResponseCache
+from prompts import build_system_prompt, build_user_prompt, request_options
+from recipe_flow import RecipeFlow
+# openai (generation_service), bcrypt (passwords workers) and httpx (storage)
+# are imported on first use by the pages that need them
 if 'is_authenticated' not in st.session_state:
     st.session_state.is_authenticated = False
-image = Image.open('nutrilogo.png')
 
 st.set_page_config(page_title='NutriVeg', page_icon='nutrilogo.png')
 
 # Load .env file
-load_dotenv()
-st.sidebar.image(image, width=275)
+assets.load_env()
+st.sidebar.image(assets.logo_bytes(), width=275)
 hide_streamlit_style = """
 <style>
 footer {
@@ -42,21 +42,57 @@ footer:after {
 """
 
 st.markdown(hide_streamlit_style, unsafe_allow_html=True)
-# Set up OpenAI API key
-client = openai.OpenAI(api_key=st.secrets['OPENAI_API_KEY'])
-
-# Set up Deta
-DETA_KEY = st.secrets['DETA_KEY']
-deta = Deta(DETA_KEY)
-db = deta.Base('user')
-recipes_db = deta.Base('recipes')
-
-
-
-def hash_password(password):
-    salt = bcrypt.gensalt()
-    hashed_password = bcrypt.hashpw(password.encode('utf-8'), salt)
-    return hashed_password.decode('utf-8')  # Decode bytes to string
+# Set up OpenAI API key; the shared generation service starts on first use
+def get_generation():
+    from generation_service import get_generation_service
+    return get_generation_service(st.secrets['OPENAI_API_KEY'])
+
+# Recipe requests are split into this many parallel single-recipe calls
+RECIPE_FAN_OUT = int(os.getenv('RECIPE_FAN_OUT', '2'))
+# Recipes shown per request, from the community recipes first and OpenAI for the rest
+RECIPE_SLOTS = int(os.getenv('RECIPE_SLOTS', str(RECIPE_FAN_OUT)))
+
+# Set up storage: Deta by default, or a local SQLite file with STORAGE_BACKEND = "sqlite"
+STORAGE_BACKEND = st.secrets.get('STORAGE_BACKEND', 'deta')
+DETA_KEY = st.secrets.get('DETA_KEY')
+SQLITE_PATH = st.secrets.get('SQLITE_PATH', 'nutriveg.db')
+# Bases and their pooled HTTP client are opened once per process, not on every rerun
+db = shared_base('user', STORAGE_BACKEND, deta_key=DETA_KEY, sqlite_path=SQLITE_PATH)
+recipes_db = shared_base('recipes', STORAGE_BACKEND, deta_key=DETA_KEY, sqlite_path=SQLITE_PATH)
+RECENT_LOGINS = int(st.secrets.get('RECENT_LOGINS', 5))
+# Users who see the metrics debug panel in the sidebar
+ADMIN_USERS = {u.strip() for u in st.secrets.get('ADMIN_USERS', '').split(',') if u.strip()}
+# Sampled response logs and the other INFO lines of the app's modules go to stderr
+metrics.configure_logging()
+# /metrics endpoint and metrics file, when METRICS_PORT or METRICS_PATH is set
+metrics.start_exporters()
+
+# Background writers so uploads and login bookkeeping do not wait on the database
+@st.cache_resource
+def get_recipe_writer():
+    writer = WriteBehindQueue(recipes_db, name='recipes-writer')
+    metrics.add_collector('recipes_writer', writer.stats)
+    return writer
+
+@st.cache_resource
+def get_user_writer():
+    writer = WriteBehindQueue(db, name='user-writer')
+    metrics.add_collector('user_writer', writer.stats)
+    return writer
+
+# Login and page visit events, shared by every session of this process
+@st.cache_resource
+def get_event_log():
+    return EventLog(lambda name: shared_base(name, STORAGE_BACKEND, deta_key=DETA_KEY, sqlite_path=SQLITE_PATH),
+                    rotation=st.secrets.get('EVENT_ROTATION', 'month'),
+                    retention_days=int(st.secrets.get('EVENT_RETENTION_DAYS', 90)))
+
+
+
+# Failed login counts shared by every session
+@st.cache_resource
+def get_login_throttle():
+    return LoginThrottle()
 
 # Function to insert a new user with dietary information
 def insert_user(email, username, password,dietary_restrictions):
@@ -71,23 +107,35 @@ def insert_user(email, username, password,dietary_restrictions):
 
         'dietary_restrictions': dietary_restrictions,
         'responses': [],
-        'history': []
+        'recent_logins': []
     })
 
 
-# Function to authenticate a user
+# Function to authenticate a user; raises TooManyAttempts after repeated failures
+@metrics.timed('stage_seconds', stage='login')
 def authenticate_user(username, password, page_visited):
+    throttle = get_login_throttle()
+    throttle.check(username)
     user = db.get(username)
-    if user and bcrypt.checkpw(password.encode('utf-8'), user['password'].encode('utf-8')):
-        # Ensure 'history' key exists or create it
-        user['history'] = user.get('history', [])
-
-        # Update login history for the specific page
-        login_time = str(datetime.datetime.now())
-        user['history'].append({'login_time': login_time, 'page_visited': page_visited})
-
-        db.put(user)
+    # bcrypt runs in the password worker pool, not on the script thread
+    if user and check_password(password, user['password']):
+        throttle.succeeded(username)
+        # The full login history goes to the event log; the user record only
+        # keeps a short summary so it stays small
+        event = get_event_log().record(username, 'login', page_visited=page_visited)
+        login = {'login_time': event['timestamp'], 'page_visited': page_visited}
+        user['recent_logins'] = recent_logins(user, login, RECENT_LOGINS)
+        updates = {'recent_logins': user['recent_logins']}
+        # Records from before the event log still carry the unbounded history list
+        if 'history' in user:
+            updates['history'] = TRIM
+            del user['history']
+        # Upgrade hashes made with a lower work factor than the current setting
+        if needs_rehash(user['password']):
+            user['password'] = updates['password'] = hash_password(password)
+        get_user_writer().update(updates, username)
         return user
+    throttle.failed(username)
     return None
 
 def sign_up():
@@ -113,7 +161,11 @@ def login():
         password = st.text_input(':blue[Password]', placeholder='Enter Your Password', type='password')
 
         if st.form_submit_button('Log In'):
-            user = authenticate_user(username, password, "Dashboard")
+            try:
+                user = authenticate_user(username, password, "Dashboard")
+            except TooManyAttempts as e:
+                st.error(str(e))
+                return None
             if user:
                 st.session_state.is_authenticated = True
                 st.success(f"Welcome back, {user['username']}! Last login: {datetime.datetime.now()}")
@@ -128,138 +180,38 @@ def login():
 
 
 
-# Chat-based language model system messages
-system_messages = """
-Provide personalized vegan recipes(atleast two) based on:
-1. dietary preferences
-2. dietary restrictions
-3. Available ingredients.
-4. Cooking time(in minutes)
-5. Cooking Equipments Available
-6. Type of meal
-7. Number of servings
-8. Cuisine type
-
-Number of ingredients outside of the available ingredients shouldn't be more. Try to stay within the limit of available ingedients. 
-Cooking time should be within the limit mentioned with available ingredients. Lesser the cooking time, the better.
-Should take the available cooking equipments into consideration.
-Should take the available cooking equipments into consideration.
-Food should not contain ingredients that does not align with dietary restrictions.
-Ensure to include the following elements in the recipe suggestions:
-1. Recipe Name
-2. Ingredients
-3. Instructions
-4. Cooking Time(in minutes)
-
-Response should be in the following JSON Format
-
-{
-"responses":[
-    {
-    "name": <name of recipe>,
-    "ingredients": <list of ingredients>,
-    "instructions": <instructions>
-    "cooking_time": <cooking time>,
-    "servings": <servings>,
-    }]
-}
-
-Example:
-For 
-Dietary preferences: High Protein; 
-Dietary Restrictions: No sugar; 
-Available ingredients: Oats, banana, blueberry, strawberry, almond milk, cocoa powder, cashew nuts, peanut butter
-Type of meal: Breakfast
-Cooking time: 15
-Cooking Equipments Available: Blender
-Number of servings: 3
-Cuisine type: None
-
-
-Response should be like the following
-
-{
-"responses":[
-    {
-    "name": "Protein-Packed Berry Smoothie Bowl",
-    "ingredients": ["1 cup oats", "1 banana", "1/2 cup blueberries", "1/2 cup strawberries", "1 cup almond milk", "1 tbsp cocoa powder", "2 tbsp cashew nuts", "2 tbsp peanut butter"],
-    "instructions": "1. In a blender, combine oats, banana, blueberries, strawberries, almond milk, cocoa powder, cashew nuts, and peanut butter.
-2. Blend until smooth and creamy.
-3. Pour the smoothie into bowls.
-4. Top with additional berries, cashew nuts, and a drizzle of peanut butter.
-5. Serve and enjoy!",
-    "cooking_time": "15 minutes",
-    "servings": 3
-    },
-    { "name": "Protein-Packed Banana Smoothie Bowl",
-        "ingredients": [ "1 cup oats", "1 banana", "1 cup blueberries", "1 cup strawberries", "1 cup almond milk", "2 tbsp cocoa powder", "2 tbsp cashew nuts", "2 tbsp peanut butter" ],
-        "instructions": "1. In a blender, combine oats, banana, blueberries, strawberries, almond milk, cocoa powder, cashew nuts, and peanut butter.
-2. Blend until smooth and creamy.
-3. Pour the mixture into bowls.
-4. Optional: Top with additional banana slices, blueberries, strawberries, and cashew nuts.
-5. Serve immediately and enjoy!",
-        "cooking_time": "15 minutes",
-        "servings": 3
-    },
-    { 
-        "name": "Protein-Packed Banana Muffins",
-        "ingredients": ["1 cup oats", "1 scoop protein powder", "1/2 cup almond milk", "1/4 cup cashews", "1/4 cup cocoa powder", "1 banana", "2 tbsp peanut butter"],
-        "instructions": "1. Preheat the oven to 350°F (175°C). Grease a muffin tin or line with cupcake liners.
-2. In a blender, combine oats, protein powder, almond milk, cashews, cocoa powder, banana, and peanut butter.
-3. Blend until smooth and creamy.
-4. Pour the mixture into a mixing bowl.
-5. Add additional oats or almond milk if needed to adjust the consistency.
-6. Spoon the batter into the prepared muffin tin, filling each cup about 3/4 full.
-7. Optional: Top with additional cashews or banana slices.
-8. Bake for 12-15 minutes, or until a toothpick inserted into the center of a muffin comes out clean.
-9. Remove from the oven and let cool for a few minutes before transferring to a wire rack to cool completely.
-10. Serve and enjoy!",
-        "cooking_time": "17 minutes",
-        "servings": 2
-        }
-
-]
-}
-
-"""
+# Chat-based language model system messages; PROMPT_VARIANT is 'full' (with the
+# few-shot example), 'compact' or 'json_mode', see prompts.py
+PROMPT_VARIANT = os.getenv('PROMPT_VARIANT', 'compact')
+system_messages = build_system_prompt(PROMPT_VARIANT)
 
 
 
-# Function to load Lottie file from URL
-def load_lottieurl(url: str):
-    r = requests.get(url)
-    if r.status_code != 200:
-        return None
-    return r.json()
+# Responses shared by every session; RESPONSE_CACHE_PATH adds a SQLite tier that survives restarts
+@st.cache_resource
+def get_response_cache():
+    cache = ResponseCache(sqlite_path=os.getenv('RESPONSE_CACHE_PATH'))
+    metrics.add_collector('response_cache', cache.stats)
+    return cache
 
+# Random recipes generated ahead of time for "Try Something New", shared by every session
+@st.cache_resource
+def get_random_pool():
+    from recipe_pool import RecipePool
+    pool = RecipePool(get_generation(), system_messages, request_options(PROMPT_VARIANT))
+    metrics.add_collector('random_pool', pool.stats)
+    return pool
 
-
-def display_recipe(recipe):
-    st.header(recipe['name'])
-    st.subheader('Ingredients')
-    ingredients = "\n".join("- " + i for i in recipe['ingredients'])
-    st.write(ingredients)
-    st.subheader('Instructions')
-    st.write(recipe["instructions"])
-    st.write("⏰ Cooking time: " + recipe["cooking_time"])
-    st.write("Servings: " + str(recipe["servings"]))
-    st.divider()
-
-
-# Now you can use the json_file_path in your Streamlit app or other parts of your code.
-def get_personalized_recipes(prompt):
-    # Call OpenAI API for recipe suggestions
-    completion = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": system_messages},
-            {"role": "user", "content": prompt}
-        ]
-    )
-    return completion.choices[0].message.content
+# Community recipes first, then the response cache, then OpenAI; see recipe_flow.py
+def get_recipe_flow():
+    return RecipeFlow(get_generation, system_messages, request_options(PROMPT_VARIANT), get_response_cache,
+                      variant=PROMPT_VARIANT, slots=RECIPE_SLOTS, get_local_first=get_local_first,
+                      get_pool=get_random_pool)
 
 # Main part of the Streamlit app
 def recipe_generator(username):
+    # Start filling the random recipe pool before the button is pressed
+    get_random_pool()
     st.subheader("Personalized Vegan Recipes Based on Your Preferences")
 
     # User input for recipe generation
@@ -284,41 +236,48 @@ def recipe_generator(username):
     cuisine_type = st.text_input("Cuisine Type:")
 
 
-    user_prompt = f"""Provide personalized vegan recipes based on 
-    dietary preferences: {dietary_preferences},
-    Restrictions: {restrictions},
-    Available Ingredients: {available_ingredients},
-    Type: {meal_type},
-    Cooking Time: {cooking_time} minutes,
-    Cooking Styles: {cooking_styles},
-    Cuisine Type: {cuisine_type},
-    Servings: {servings}."""
 
+    form_fields = {
+        'dietary_preferences': dietary_preferences,
+        'restrictions': restrictions,
+        'available_ingredients': available_ingredients,
+        'meal_type': meal_type,
+        'cooking_time': cooking_time,
+        'cooking_styles': cooking_styles,
+        'cuisine_type': cuisine_type,
+        'servings': servings,
+    }
+    user_prompt = build_user_prompt(form_fields)
+
+    flow = get_recipe_flow()
     if st.button("Generate Recipe Suggestions"):
         if dietary_preferences and available_ingredients:
-            # Get personalized recipes from OpenAI
-            recipe_suggestions = get_personalized_recipes(user_prompt)
-            print("Received JSON response:", recipe_suggestions)
-            st.success("Recommended Recipes:")
-            try:
-                recipes = json.loads(recipe_suggestions, strict=False)
-                for recipe in recipes["responses"]:
-                    display_recipe(recipe)
-            except json.JSONDecodeError as e:
-                st.error(f"Error decoding JSON: {e}")
+            # Kept on the user record for the nightly batch recommendations
+            if st.session_state.get('saved_preferences') != dietary_preferences:
+                get_user_writer().update({'dietary_preferences': dietary_preferences}, username)
+                st.session_state.saved_preferences = dietary_preferences
+            flow.generate(form_fields, user_prompt)
         else:
             st.warning("Please fill in the required details.")
 
         # "Try Something New" option to generate a random recipe
     if st.button("Try Something New"):
-        random_prompt = "Generate a random vegan recipe"
-        random_recipe = get_personalized_recipes(random_prompt)
-        st.success("Random Recipe:")
-        try:
-            random_recipe_data = json.loads(random_recipe, strict=False)
-            display_recipe(random_recipe_data["responses"][0])
-        except json.JSONDecodeError as e:
-            st.error(f"Error decoding JSON: {e}")
+        flow.random_recipe()
+
+
+# Debug panel with this process's latencies, counters and resource stats
+def display_metrics_panel():
+    snapshot = metrics.snapshot()
+    with st.expander("Metrics"):
+        if snapshot['latencies']:
+            st.caption("Latency by stage")
+            st.table(snapshot['latencies'])
+        if snapshot['counters']:
+            st.caption("Counters")
+            st.table(snapshot['counters'])
+        st.caption("Caches, pools and services")
+        st.json(snapshot['gauges'], expanded=False)
+        st.download_button("Download Prometheus metrics", metrics.render(), file_name="nutriveg.prom")
 
         
 # Display the signup form in the sidebar
@@ -339,42 +298,105 @@ with st.sidebar:
         if placeholder.button("Logout"):
             st.session_state.is_authenticated = False
             placeholder.empty()
+    if st.session_state.is_authenticated and st.session_state.get('username') in ADMIN_USERS:
+        display_metrics_panel()
     
           
 
+# Full-text search over community recipes, built once per process and updated on every upload
+@st.cache_resource
+def get_recipe_search():
+    from search_index import build_from_base
+    return build_from_base(recipes_db)
+
+# Serves community recipes that cover the request before asking OpenAI
+@st.cache_resource
+def get_local_first():
+    from local_first import LocalFirst
+    local_first = LocalFirst(get_recipe_search())
+    metrics.add_collector('local_first', local_first.stats)
+    return local_first
+
 # Function to insert a new recipe
 def insert_recipe(username, title, ingredients, recipe_content):
     timestamp = str(datetime.datetime.now())
-    return recipes_db.put({'username': username, 'title': title, 'ingredients': ingredients, 'recipe': recipe_content, 'timestamp': timestamp})
+    # Time ordered key so the feed can page newest-first; written in the background
+    recipe = get_recipe_writer().put({'key': recipe_key(), 'username': username, 'title': title, 'ingredients': ingredients, 'recipe': recipe_content, 'timestamp': timestamp})
+    # Searchable and matchable by local-first immediately
+    get_recipe_search().add(recipe)
+    return recipe
+
+# The pages of the feed this session has loaded so far
+def get_feed():
+    if 'feed' not in st.session_state:
+        st.session_state.feed = Feed()
+    return st.session_state.feed
+
+def load_more_recipes():
+    get_feed().load_more(recipes_db)
+
+def refresh_feed():
+    get_feed().reset()
+
+def display_feed_recipe(recipe, nutrition=None):
+    st.markdown(f"**{recipe['username']}**:\n## {recipe['title']}\n### Ingredients\n{recipe['ingredients']}\n"
+                f"### Instructions\n{recipe['recipe']}")
+    macros = summary(nutrition)
+    if macros:
+        st.caption(macros)
+    st.divider()
 
-# Function to get all recipes
-def get_all_recipes():
-    recipes = recipes_db.fetch().items
-    print(recipes)
-    return recipes
+# A page of recipes is annotated with nutrition in one batch
+@metrics.timed('stage_seconds', stage='render_feed')
+def display_feed_recipes(recipes):
+    for recipe, nutrition in zip(recipes, annotate(recipes)):
+        display_feed_recipe(recipe, nutrition)
+
+SEARCH_RESULTS = 20
+
+# Ranked matches from the search index; the base is not fetched
+def display_search_results(query, author, dates):
+    since = until = None
+    if dates:
+        since = datetime.datetime.combine(dates[0], datetime.time.min)
+        until = datetime.datetime.combine(dates[-1], datetime.time.min) + datetime.timedelta(days=1)
+    with metrics.timed('stage_seconds', stage='search'):
+        recipes = get_recipe_search().search_recipes(query, SEARCH_RESULTS, username=author or None,
+                                                     since=since, until=until, prefix=True)
+    if not recipes:
+        st.info("No recipes match your search.")
+    display_feed_recipes(recipes)
 
 # Main part of the Streamlit app
 def recipe_social_media():
 
-    # Display all recipes
     st.title("Recipes Feed")
-    recipes = get_all_recipes()
-    for recipe in recipes[::-1]:
-        st.write(f"**{recipe['username']}**:")
-        st.header(recipe['title'])
-        st.subheader('Ingredients')
-        st.write(recipe['ingredients'])
-        st.subheader('Instructions')
-        st.write(recipe['recipe'])
-        
-        st.divider()
+    query = st.text_input("Search recipes", placeholder="Title, ingredient or step, e.g. tofu curry or chick*")
+    author_col, date_col = st.columns(2)
+    author = author_col.text_input("Shared by", placeholder="Any user").strip()
+    dates = date_col.date_input("Shared between", value=(), format="YYYY-MM-DD")
+    if query.strip() or author or dates:
+        display_search_results(query, author, dates)
+        return
+
+    # Display recipes, newest first, one page at a time
+    feed = get_feed()
+    if not feed.pages:
+        feed.load_more(recipes_db)
+    st.button("Refresh", on_click=refresh_feed)
+    display_feed_recipes(feed.visible_recipes())
+    if not feed.exhausted:
+        st.button("Load more", on_click=load_more_recipes)
 
 def upload_recipes(username):
     title = st.text_input("Title")
     ingredients = st.text_area("Ingredients: ", key = 'ingredients')
     recipe_content = st.text_area("Recipe Content:", key = 'recipe_content')
     if st.button("Upload Recipe"):
-        insert_recipe(username=username, ingredients=ingredients, title=title, recipe_content=recipe_content)
+        recipe = insert_recipe(username=username, ingredients=ingredients, title=title, recipe_content=recipe_content)
+        # Show the new recipe at the top of this session's feed, even before it is written
+        get_feed().pin(recipe)
+        refresh_feed()
         st.success("Recipe uploaded successfully!")
 
 
@@ -388,22 +410,27 @@ if __name__ == "__main__":
         icons=['house', 'chat-dots','people-fill','upload', 'telephone'], 
         menu_icon="cast", default_index=0, orientation="horizontal")
 
+    # Record a page visit when a logged in user switches pages, not on every rerun
+    if st.session_state.is_authenticated and st.session_state.get('last_page') != selected_horizontal:
+        get_event_log().record(st.session_state.username, 'page_visit', page_visited=selected_horizontal)
+        st.session_state.last_page = selected_horizontal
 
-    # Load Lottie file for animation (replace with your actual Lottie URL)
-    lottie_hello = load_lottieurl("https://lottie.host/6729af09-07c8-4adb-a768-3a2f366834b3/WO1501fN3r.json")
 
     # Content based on selected option
     if selected_horizontal == "Home":
-        st_lottie(
-            lottie_hello,
-            speed=1,
-            reverse=False,
-            loop=True,
-            quality="low",  # medium; high
-            height=300,
-            width=300,
-            key=None,
-        )
+        # Bundled Lottie animation, read once per process
+        lottie_hello = assets.lottie_hello()
+        if lottie_hello:
+            st_lottie(
+                lottie_hello,
+                speed=1,
+                reverse=False,
+                loop=True,
+                quality="low",  # medium; high
+                height=300,
+                width=300,
+                key=None,
+            )
 
         st.header("Overview")
         st.markdown("""An AI-powered vegan recipe app catering to personalized preferences, restrictions, and ingredient availability, doubling as a social platform for users to share, review, and like recipes.
@@ -0,0 +1,83 @@
+# assets.py
+#
+# Static assets loaded once per process instead of on every Streamlit rerun.
+# The Home page animation is bundled as assets/lottie_hello.json; only if
+# that file is missing is it downloaded and saved there. A failed download
+# is not remembered, so the next render tries again.
+#
+#   python assets.py    # replace the bundled Lottie file with LOTTIE_URL
+
+import json
+import os
+import threading
+from functools import lru_cache
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+LOGO_PATH = os.path.join(ROOT, 'nutrilogo.png')
+LOTTIE_PATH = os.path.join(ROOT, 'assets', 'lottie_hello.json')
+LOTTIE_URL = 'https://lottie.host/6729af09-07c8-4adb-a768-3a2f366834b3/WO1501fN3r.json'
+
+_env_lock = threading.Lock()
+_env_loaded = False
+_lottie_lock = threading.Lock()
+_lottie = {}
+
+
+# load_dotenv once per process; reruns skip it
+def load_env():
+    global _env_loaded
+    with _env_lock:
+        if not _env_loaded:
+            from dotenv import load_dotenv
+            load_dotenv()
+            _env_loaded = True
+
+
+@lru_cache(maxsize=None)
+def logo_bytes():
+    with open(LOGO_PATH, 'rb') as f:
+        return f.read()
+
+
+def _download_lottie(url, path, timeout):
+    import requests
+    r = requests.get(url, timeout=timeout)
+    if r.status_code != 200:
+        return None
+    data = r.json()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+    return data
+
+
+# Animation JSON for st_lottie, or None when it is neither bundled nor downloadable
+def lottie_hello(path=LOTTIE_PATH, url=LOTTIE_URL, timeout=5):
+    data = _lottie.get(path)
+    if data is not None:
+        return data
+    with _lottie_lock:
+        if path not in _lottie:
+            try:
+                if os.path.exists(path):
+                    with open(path) as f:
+                        data = json.load(f)
+                else:
+                    data = _download_lottie(url, path, timeout)
+            except Exception:
+                data = None
+            # Only successes are kept; a failure is retried on the next call
+            if data is not None:
+                _lottie[path] = data
+        return _lottie.get(path)
+
+
+if __name__ == '__main__':
+    try:
+        saved = _download_lottie(LOTTIE_URL, LOTTIE_PATH, 30)
+    except Exception as e:
+        saved = None
+        print(e)
+    print('Saved' if saved else 'Download failed', LOTTIE_PATH)
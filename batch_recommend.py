@@ -0,0 +1,180 @@
+# batch_recommend.py
+#
+# Nightly batch job: score every user profile against the recipe catalog in
+# one sparse users x recipes product (computed in row chunks) and write the
+# top-k recipes per user to a compressed .npz file. Recipes containing an
+# ingredient from the user's dietary_restrictions are excluded.
+#
+#   python batch_recommend.py --users users.csv --out recommendations.npz
+#   python batch_recommend.py --from-deta --out recommendations.npz --workers 4
+#   python batch_recommend.py --from-deta --backend sqlite --sqlite-path nutriveg.db
+
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from catalog import RECIPE_NAMES, RECIPE_INGREDIENTS
+from exclusions import ExclusionIndex
+from recommender import MODEL_PATH, load_or_fit, top_k
+from storage import open_base
+
+logger = logging.getLogger(__name__)
+
+# Set in each worker process by _init_worker
+_worker_model = None
+_worker_exclusions = None
+
+
+# Query text of a stored user: the dietary preferences last entered in the
+# Dashboard form plus the ingredients of any saved recipe responses. Profiles
+# read from a file can give dietary_preferences directly.
+def profile_text(profile):
+    parts = [str(profile.get('dietary_preferences') or '')]
+    for response in profile.get('responses') or ():
+        if isinstance(response, dict):
+            ingredients = response.get('ingredients') or ''
+            parts.append(' '.join(ingredients) if isinstance(ingredients, list) else str(ingredients))
+        else:
+            parts.append(str(response))
+    return ' '.join(p for p in parts if p.strip())
+
+
+def profile_restrictions(profile):
+    return str(profile.get('dietary_restrictions') or '')
+
+
+# Load user profiles from a .csv, .json (list of objects) or .jsonl file
+def read_profiles(path):
+    if path.endswith('.csv'):
+        with open(path, newline='', encoding='utf-8') as f:
+            return list(csv.DictReader(f))
+    with open(path, encoding='utf-8') as f:
+        if path.endswith('.jsonl'):
+            return [json.loads(line) for line in f if line.strip()]
+        return json.load(f)
+
+
+# Page through the `user` base instead of relying on a single fetch()
+def fetch_profiles(base):
+    profiles = []
+    response = base.fetch()
+    profiles.extend(response.items)
+    while response.last:
+        response = base.fetch(last=response.last)
+        profiles.extend(response.items)
+    return profiles
+
+
+# Top-k recipe indices and scores for every row of a users x terms query matrix.
+# Excluded recipes are never returned; missing slots are padded with -1.
+def score_chunk(model, exclusions, queries, restrictions, k):
+    scores = (queries @ model.recipe_matrix.T).toarray()
+    for row, text in enumerate(restrictions):
+        scores[row, exclusions.mask(text)] = -np.inf
+    indices = np.full((scores.shape[0], k), -1, dtype=np.int32)
+    best = np.zeros((scores.shape[0], k), dtype=np.float32)
+    for row in range(scores.shape[0]):
+        picked = top_k(scores[row], k)
+        picked = picked[scores[row, picked] > -np.inf]
+        indices[row, :len(picked)] = picked
+        best[row, :len(picked)] = scores[row, picked]
+    return indices, best
+
+
+# Workers get the caller's model and catalog, so any number of workers
+# scores exactly what workers=1 does
+def _init_worker(model, recipe_ingredients):
+    global _worker_model, _worker_exclusions
+    _worker_model = model
+    _worker_exclusions = ExclusionIndex(recipe_ingredients)
+
+
+def _score_in_worker(args):
+    queries, restrictions, k = args
+    return score_chunk(_worker_model, _worker_exclusions, queries, restrictions, k)
+
+
+# Score all profiles; chunks are spread across processes when workers > 1.
+# Profiles with no query text would all get the same catalog order top-k,
+# so they are reported; with require_text=True they are an error instead.
+def recommend_all(model, profiles, k=5, chunk_size=2048, workers=1, recipe_ingredients=RECIPE_INGREDIENTS,
+                  require_text=False):
+    texts = [profile_text(p) for p in profiles]
+    empty = sum(1 for text in texts if not text)
+    if empty:
+        message = (f'{empty} of {len(profiles)} profiles have no dietary preferences or saved responses; '
+                   'their recommendations are not personalized')
+        if require_text:
+            raise ValueError(message)
+        logger.warning(message)
+    queries = model.vectorizer.transform(texts).tocsr()
+    restrictions = [profile_restrictions(p) for p in profiles]
+    chunks = [(queries[start:start + chunk_size], restrictions[start:start + chunk_size], k)
+              for start in range(0, queries.shape[0], chunk_size)]
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(model, list(recipe_ingredients))) as pool:
+            results = list(pool.map(_score_in_worker, chunks))
+    else:
+        exclusions = ExclusionIndex(recipe_ingredients)
+        results = [score_chunk(model, exclusions, *chunk) for chunk in chunks]
+    if not results:
+        return np.empty((0, k), dtype=np.int32), np.empty((0, k), dtype=np.float32)
+    indices = np.concatenate([r[0] for r in results])
+    scores = np.concatenate([r[1] for r in results])
+    return indices, scores
+
+
+def write_recommendations(path, usernames, recipe_names, indices, scores):
+    np.savez_compressed(path,
+                        usernames=np.asarray(usernames, dtype=str),
+                        recipe_names=np.asarray(recipe_names, dtype=str),
+                        indices=indices,
+                        scores=scores)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Precompute recipe recommendations for many users.')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--users', help='.csv, .json or .jsonl file of user profiles')
+    source.add_argument('--from-deta', action='store_true', help='read profiles from the user base')
+    parser.add_argument('--backend', default='deta', choices=['deta', 'sqlite'], help='storage backend of the user base')
+    parser.add_argument('--sqlite-path', default='nutriveg.db', help='database file for the sqlite backend')
+    parser.add_argument('--out', default='recommendations.npz', help='output .npz file')
+    parser.add_argument('-k', type=int, default=5, help='recipes per user')
+    parser.add_argument('--chunk-size', type=int, default=2048, help='users scored per sparse product')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='worker processes')
+    parser.add_argument('--model', default=MODEL_PATH, help='saved recommender model')
+    parser.add_argument('--require-text', action='store_true',
+                        help='fail instead of warning when a profile has no query text')
+    args = parser.parse_args(argv)
+    logging.basicConfig(format='%(levelname)s %(message)s')
+
+    if args.from_deta:
+        deta_key = os.getenv('DETA_KEY')
+        if args.backend == 'deta' and not deta_key:
+            parser.error('DETA_KEY must be set to read from Deta')
+        profiles = fetch_profiles(open_base('user', args.backend, deta_key=deta_key, sqlite_path=args.sqlite_path))
+    else:
+        profiles = read_profiles(args.users)
+
+    model = load_or_fit(RECIPE_NAMES, RECIPE_INGREDIENTS, path=args.model)
+    try:
+        indices, scores = recommend_all(model, profiles, k=args.k, chunk_size=args.chunk_size,
+                                        workers=args.workers, require_text=args.require_text)
+    except ValueError as e:
+        parser.exit(1, f'{e}\n')
+    usernames = [p.get('username') or p.get('key') or '' for p in profiles]
+    write_recommendations(args.out, usernames, model.recipe_names, indices, scores)
+    print(f'Wrote top-{args.k} recommendations for {len(profiles)} users to {args.out}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
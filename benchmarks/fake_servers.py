@@ -0,0 +1,321 @@
+# benchmarks/fake_servers.py
+#
+# Local stand-ins for the services the app calls, so load tests never touch
+# the real APIs or spend money:
+#   - an OpenAI compatible /v1/chat/completions (plain and streamed) that
+#     answers with synthetic recipes in the "responses" JSON format
+#   - a Deta Base compatible HTTP API (items, query) kept in memory
+# Both add a configurable latency with jitter and can inject errors (429s
+# with Retry-After, 500s) at a given rate. They speak HTTP/1.1 keep-alive.
+#
+#   python benchmarks/fake_servers.py --openai-port 8001 --deta-port 8002 --latency 0.2 --error-rate 0.05
+#
+# then point the app at them with OPENAI_BASE_URL=http://127.0.0.1:8001/v1 and
+# DETA_BASE_URL=http://127.0.0.1:8002/v1.
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+import synthetic
+
+
+class FaultConfig:
+    """Latency and error injection shared by a server's handler threads."""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    def delay(self):
+        with self._lock:
+            self.requests += 1
+            delay = self.latency + self._rng.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    # Status code to fail this request with, or None
+    def fault(self):
+        with self._lock:
+            if self._rng.random() >= self.error_rate:
+                return None
+            self.errors += 1
+            return self._rng.choice([429, 500])
+
+    def stats(self):
+        return {'requests': self.requests, 'injected_errors': self.errors}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    config = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'null') if length else None
+
+    def _json(self, status, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    # Apply the latency, then fail the request if an error is injected
+    def _faulted(self):
+        self.config.delay()
+        status = self.config.fault()
+        if status is None:
+            return False
+        headers = {'Retry-After': '0.05'} if status == 429 else None
+        self._json(status, {'error': {'message': 'injected fault', 'type': 'fake_server'}}, headers)
+        return True
+
+
+class OpenAIHandler(_Handler):
+    # Seconds between streamed chunks
+    chunk_delay = 0.0
+    chunk_size = 40
+    _counter = 0
+    _counter_lock = threading.Lock()
+
+    @classmethod
+    def _seed(cls):
+        with cls._counter_lock:
+            cls._counter += 1
+            return cls._counter
+
+    def do_POST(self):
+        body = self._body() or {}
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            return self._json(404, {'error': {'message': 'not found'}})
+        if self._faulted():
+            return
+        messages = body.get('messages', [])
+        prompt = messages[-1]['content'] if messages else ''
+        n_recipes = 1 if 'exactly one recipe' in prompt else 2
+        content = synthetic.make_llm_response(n_recipes, seed=self._seed())
+        prompt_tokens = sum(len(m.get('content', '')) for m in messages) // 4
+        usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': len(content) // 4,
+                 'total_tokens': prompt_tokens + len(content) // 4}
+        model = body.get('model', 'gpt-3.5-turbo')
+        if body.get('stream'):
+            try:
+                return self._stream(content, model)
+            except (BrokenPipeError, ConnectionResetError):
+                # The client cancelled the stream
+                self.close_connection = True
+                return
+        self._json(200, {
+            'id': 'chatcmpl-fake', 'object': 'chat.completion', 'created': int(time.time()), 'model': model,
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+            'usage': usage,
+        })
+
+    def _chunk(self, data):
+        self.wfile.write(f'{len(data):x}\r\n'.encode('ascii') + data + b'\r\n')
+        self.wfile.flush()
+
+    def _event(self, model, delta, finish_reason=None):
+        chunk = {'id': 'chatcmpl-fake', 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                 'model': model, 'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]}
+        self._chunk(f'data: {json.dumps(chunk)}\n\n'.encode('utf-8'))
+
+    def _stream(self, content, model):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        self._event(model, {'role': 'assistant', 'content': ''})
+        for start in range(0, len(content), self.chunk_size):
+            if self.chunk_delay:
+                time.sleep(self.chunk_delay)
+            self._event(model, {'content': content[start:start + self.chunk_size]})
+        self._event(model, {}, 'stop')
+        self._chunk(b'data: [DONE]\n\n')
+        self.wfile.write(b'0\r\n\r\n')
+        self.wfile.flush()
+
+
+_OPERATORS = {
+    'lt': lambda a, b: a is not None and a < b,
+    'lte': lambda a, b: a is not None and a <= b,
+    'gt': lambda a, b: a is not None and a > b,
+    'gte': lambda a, b: a is not None and a >= b,
+    'ne': lambda a, b: a != b,
+    'pfx': lambda a, b: isinstance(a, str) and a.startswith(b),
+    'contains': lambda a, b: a is not None and b in a,
+}
+
+
+def _matches(item, conditions):
+    for field, value in conditions.items():
+        name, _, operator = field.partition('?')
+        if not (_OPERATORS[operator] if operator else (lambda a, b: a == b))(item.get(name), value):
+            return False
+    return True
+
+
+class DetaHandler(_Handler):
+    """Items live in `bases`: {base name: {key: item}}, sorted by key on query."""
+
+    bases = {}
+    lock = threading.Lock()
+
+    def _route(self):
+        # /v1/<project>/<base>/items[/<key>] or /v1/<project>/<base>/query
+        parts = self.path.split('?')[0].strip('/').split('/')
+        if len(parts) < 4 or parts[0] != 'v1':
+            return None, None, None
+        base, action = parts[2], parts[3]
+        key = unquote(parts[4]) if len(parts) > 4 else None
+        return self.bases.setdefault(base, {}), action, key
+
+    def _handle(self, method):
+        if not self.headers.get('X-API-Key'):
+            return self._json(401, {'errors': ['Unauthorized']})
+        body = self._body() if method in ('PUT', 'POST', 'PATCH') else None
+        items, action, key = self._route()
+        if items is None:
+            return self._json(404, {'errors': ['Not found']})
+        if self._faulted():
+            return
+        with self.lock:
+            if action == 'items' and method == 'PUT':
+                processed = []
+                for item in body.get('items', []):
+                    item = dict(item)
+                    item.setdefault('key', f'{random.getrandbits(48):012x}')
+                    items[item['key']] = item
+                    processed.append(item)
+                return self._json(207, {'processed': {'items': processed}})
+            if action == 'items' and key is not None and method == 'GET':
+                if key not in items:
+                    return self._json(404, {'key': key})
+                return self._json(200, items[key])
+            if action == 'items' and key is not None and method == 'PATCH':
+                if key not in items:
+                    return self._json(404, {'errors': ['Key not found']})
+                items[key].update(body.get('set', {}))
+                for field in body.get('delete', []):
+                    items[key].pop(field, None)
+                return self._json(200, {'key': key})
+            if action == 'items' and key is not None and method == 'DELETE':
+                items.pop(key, None)
+                return self._json(200, {'key': key})
+            if action == 'query' and method == 'POST':
+                return self._query(items, body or {})
+        return self._json(405, {'errors': ['Method not allowed']})
+
+    def _query(self, items, body):
+        query = body.get('query') or [{}]
+        limit = body.get('limit', 1000)
+        last = body.get('last')
+        matched = [items[k] for k in sorted(items)
+                   if (last is None or k > last) and any(_matches(items[k], q) for q in query)]
+        page = matched[:limit]
+        more = len(matched) > limit
+        return self._json(200, {'paging': {'size': len(page), 'last': page[-1]['key'] if more else None},
+                                'items': page})
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PATCH(self):
+        self._handle('PATCH')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+
+class FakeServer:
+    """One stand-in server on a background thread; use as a context manager."""
+
+    def __init__(self, handler, port=0, **fault_options):
+        self.config = FaultConfig(**fault_options)
+        # Each server gets its own handler subclass so state is not shared
+        attributes = {'config': self.config}
+        if issubclass(handler, DetaHandler):
+            attributes.update(bases={}, lock=threading.Lock())
+        self.handler = type(handler.__name__, (handler,), attributes)
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), self.handler)
+        self.httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name=f'fake-{handler.__name__}',
+                                        daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}/v1'
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stats(self):
+        return self.config.stats()
+
+
+def fake_openai(port=0, chunk_delay=0.0, **fault_options):
+    server = FakeServer(OpenAIHandler, port, **fault_options)
+    server.handler.chunk_delay = chunk_delay
+    return server
+
+
+def fake_deta(port=0, **fault_options):
+    return FakeServer(DetaHandler, port, **fault_options)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the fake OpenAI and Deta servers.')
+    parser.add_argument('--openai-port', type=int, default=8001)
+    parser.add_argument('--deta-port', type=int, default=8002)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every request')
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests failed with 429/500')
+    parser.add_argument('--chunk-delay', type=float, default=0.0, help='seconds between streamed chunks')
+    args = parser.parse_args(argv)
+    faults = {'latency': args.latency, 'jitter': args.jitter, 'error_rate': args.error_rate}
+    with fake_openai(args.openai_port, args.chunk_delay, **faults) as openai_server, \
+            fake_deta(args.deta_port, **faults) as deta_server:
+        print(f'OpenAI: {openai_server.url}\nDeta:   {deta_server.url}')
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+# benchmarks/load.py
+#
+# Load generator: many concurrent simulated sessions run the app's request
+# paths against the fake OpenAI and Deta servers (fake_servers.py), with
+# the same shared clients, storage bases and generation service the app
+# uses. Each session picks operations from MIX:
+#   login     user get, bcrypt check in the password pool, login update
+#   feed      one page of the Recipes Feed with nutrition
+#   search    full-text search over the community recipes
+#   generate  local-first matching, then streamed OpenAI recipes for the rest;
+#             a --popular share of them submit the same preset form, which
+#             the generation service coalesces into one upstream call
+# and the run reports p50/p95/p99 latency, throughput and errors per
+# operation, optionally against the stored baseline.
+#
+#   python benchmarks/load.py --sessions 32 --duration 20 --openai-latency 0.3 --deta-latency 0.02
+#   python benchmarks/load.py --error-rate 0.05 --compare
+
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(1, ROOT)
+
+import report  # noqa: E402
+import synthetic  # noqa: E402
+from fake_servers import fake_deta, fake_openai  # noqa: E402
+
+MIX = {'login': 0.15, 'feed': 0.40, 'search': 0.25, 'generate': 0.20}
+PASSWORD = 'benchmark-password'
+DETA_KEY = 'bench_benchmarkkey'
+
+
+class Environment:
+    """The app's shared resources, pointed at the fake servers."""
+
+    def __init__(self, openai_url, deta_url, users, recipes, slots=2):
+        import storage
+        from feed import recipe_key
+        from generation_service import GenerationService
+        from local_first import LocalFirst
+        from passwords import hash_password
+        from search_index import build_from_base
+        import prompts
+
+        storage.DETA_BASE_URL = deta_url
+        os.environ['OPENAI_BASE_URL'] = openai_url
+        self.users = storage.shared_base('user', 'deta', deta_key=DETA_KEY)
+        self.recipes = storage.shared_base('recipes', 'deta', deta_key=DETA_KEY)
+        hashed = hash_password(PASSWORD, rounds=4)
+        self._put_all(self.users, synthetic.make_users(users, password_hash=hashed))
+        self._put_all(self.recipes, [dict(r, key=recipe_key()) for r in synthetic.make_recipes(recipes)])
+        self.search = build_from_base(self.recipes)
+        self.local_first = LocalFirst(self.search)
+        self.generation = GenerationService('sk-benchmark', requests_per_minute=10 ** 6,
+                                            tokens_per_minute=10 ** 9, max_concurrency=16)
+        self.system = prompts.build_system_prompt('compact')
+        self.options = prompts.request_options('compact')
+        self.n_users = users
+        self.slots = slots
+        self.popular = 0.0
+        self.preset = synthetic.make_forms(1, seed=-1)[0]
+
+    @staticmethod
+    def _put_all(base, items):
+        from storage import PUT_MANY_LIMIT
+        for start in range(0, len(items), PUT_MANY_LIMIT):
+            base.put_many(items[start:start + PUT_MANY_LIMIT])
+
+    def close(self):
+        self.generation.close()
+        os.environ.pop('OPENAI_BASE_URL', None)
+
+
+class Session:
+    """One simulated user running operations back to back."""
+
+    def __init__(self, env, seed):
+        from feed import Feed
+        self.env = env
+        self.rng = random.Random(seed)
+        self.feed = Feed()
+        self.forms = synthetic.make_forms(20, seed=seed)
+        self.username = f'user{self.rng.randrange(env.n_users)}'
+
+    def login(self):
+        from events import recent_logins
+        from passwords import check_password
+        user = self.env.users.get(self.username)
+        if not user or not check_password(PASSWORD, user['password']):
+            raise RuntimeError('login failed')
+        login = {'login_time': str(time.time()), 'page_visited': 'Dashboard'}
+        self.env.users.update({'recent_logins': recent_logins(user, login)}, self.username)
+
+    def feed_page(self):
+        from nutrition import annotate
+        if self.feed.exhausted or len(self.feed.pages) >= 5:
+            self.feed.reset()
+        annotate(self.feed.load_more(self.env.recipes))
+
+    def search(self):
+        form = self.rng.choice(self.forms)
+        words = form['available_ingredients'].split(',')[0].split()
+        self.env.search.search_recipes(' '.join(words), 20, prefix=True)
+
+    def generate(self):
+        from generation_service import fan_out_prompts
+        from prompts import build_user_prompt
+        from response_cache import request_key
+        popular = self.rng.random() < self.env.popular
+        form = self.env.preset if popular else self.rng.choice(self.forms)
+        local = self.env.local_first.match(form['available_ingredients'], form['restrictions'],
+                                           form['cooking_time'], k=self.env.slots)
+        remaining = self.env.slots - len(local)
+        generated = []
+        if remaining:
+            generated = list(self.env.generation.iter_recipes(
+                self.env.system, fan_out_prompts(build_user_prompt(form), remaining), self.env.options,
+                key=f'{request_key(form)}:{remaining}'))
+        self.env.local_first.record(len(local), len(generated))
+
+    OPERATIONS = {'login': login, 'feed': feed_page, 'search': search, 'generate': generate}
+
+
+def run_sessions(env, sessions, duration, think_time, seed=0):
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+    names, weights = list(MIX), list(MIX.values())
+
+    def worker(index):
+        session = Session(env, seed + index)
+        while time.monotonic() < deadline:
+            name = session.rng.choices(names, weights)[0]
+            start = time.perf_counter()
+            try:
+                Session.OPERATIONS[name](session)
+                failed = False
+            except Exception:
+                failed = True
+            elapsed = time.perf_counter() - start
+            with lock:
+                if failed:
+                    errors[name] += 1
+                else:
+                    samples[name].append(elapsed)
+            if think_time:
+                time.sleep(session.rng.uniform(0, 2 * think_time))
+
+    threads = [threading.Thread(target=worker, args=(i,), name=f'session-{i}') for i in range(sessions)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    results = {name: report.summarize(samples[name], elapsed, errors[name]) for name in names}
+    everything = [s for name in names for s in samples[name]]
+    results['all'] = report.summarize(everything, elapsed, sum(errors.values()))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Drive concurrent simulated sessions against fake services.')
+    parser.add_argument('--sessions', type=int, default=16, help='concurrent simulated sessions')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds to run')
+    parser.add_argument('--think-time', type=float, default=0.0, help='mean pause between operations')
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--recipes', type=int, default=2000)
+    parser.add_argument('--openai-latency', type=float, default=0.2)
+    parser.add_argument('--deta-latency', type=float, default=0.01)
+    parser.add_argument('--jitter', type=float, default=0.0, help='+/- seconds added to both latencies')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of fake requests failed with 429/500')
+    parser.add_argument('--popular', type=float, default=0.0,
+                        help='share of generate operations that submit the same preset form')
+    parser.add_argument('--baseline', default=report.BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--compare', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    with fake_openai(latency=args.openai_latency, jitter=args.jitter) as openai_server, \
+            fake_deta(latency=args.deta_latency, jitter=args.jitter) as deta_server:
+        env = Environment(openai_server.url, deta_server.url, args.users, args.recipes)
+        env.popular = args.popular
+        # Faults are only injected once the data is loaded
+        openai_server.config.error_rate = deta_server.config.error_rate = args.error_rate
+        try:
+            results = run_sessions(env, args.sessions, args.duration, args.think_time)
+        finally:
+            env.close()
+        report.print_table(results, f'Load: {args.sessions} sessions for {args.duration:.0f}s')
+        print(f'local answer rate: {env.local_first.stats()["local_answer_rate"]:.0%}  '
+              f'single flight: {env.generation.flights.stats()}')
+        print(f'fake OpenAI: {openai_server.stats()}  fake Deta: {deta_server.stats()}')
+
+    if args.save_baseline:
+        settings = {k: v for k, v in vars(args).items() if k not in ('baseline', 'save_baseline', 'compare')}
+        report.save_baseline('load', results, args.baseline, settings)
+        print(f'Saved the load baseline to {args.baseline}')
+    if args.compare and not report.print_comparison('load', results, args.baseline, args.tolerance):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,205 @@
+# benchmarks/micro.py
+#
+# Microbenchmarks of the app's hot paths on synthetic data:
+#   recommender        recipe.py: exclusion mask + inverted index top-k over the catalog
+#   prompt_to_parse    build_user_prompt -> generation service -> json.loads,
+#                      against the fake OpenAI server
+#   stream_first_recipe  time until the first streamed recipe is parsed
+#   stream_parse       ResponsesStreamParser over a chunked answer
+#   parse_repair       recipe_parser on a fenced answer with trailing commas
+#   app_rerun          app.py script run with nothing to display (AppTest)
+#   display_recipe_x20 the same run displaying 20 recipes with nutrition
+#   feed_page          Feed.load_more on SQLite + nutrition for the page
+#   feed_search        full-text search over the community recipes
+#
+#   python benchmarks/micro.py --catalog 20000 --recipes 5000
+#   python benchmarks/micro.py --save-baseline
+#   python benchmarks/micro.py --compare --tolerance 0.25
+
+import argparse
+import datetime
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(1, ROOT)
+
+import report  # noqa: E402
+import synthetic  # noqa: E402
+from fake_servers import fake_openai  # noqa: E402
+
+
+def measure(fn, repeat, warmup=2):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def bench_recommender(catalog_size, repeat):
+    from exclusions import ExclusionIndex
+    from recommender import RecipeRecommender
+    from retrieval import InvertedIndex
+
+    names, ingredients = synthetic.make_catalog(catalog_size)
+    index = InvertedIndex.from_recommender(RecipeRecommender().fit(names, ingredients))
+    exclusions = ExclusionIndex(ingredients)
+    forms = synthetic.make_forms(repeat + 2, seed=1)
+    queries = iter(forms * 2)
+
+    def query():
+        form = next(queries)
+        index.search(form['dietary_preferences'] + ' ' + form['available_ingredients'], k=5,
+                     exclude=exclusions.mask(form['restrictions']))
+    return measure(query, repeat)
+
+
+def bench_generation(repeat, latency):
+    import prompts
+    from generation_service import GenerationService, fan_out_prompts
+    from recipe_parser import parse_response
+
+    results = {}
+    with fake_openai(latency=latency) as server:
+        os.environ['OPENAI_BASE_URL'] = server.url
+        service = GenerationService('sk-benchmark', requests_per_minute=10 ** 6, tokens_per_minute=10 ** 9)
+        try:
+            system = prompts.build_system_prompt('compact')
+            options = prompts.request_options('compact')
+            forms = iter(synthetic.make_forms(repeat + 2, seed=2) * 2)
+
+            def prompt_to_parse():
+                parse_response(service.generate(system, prompts.build_user_prompt(next(forms)), options))
+            results['prompt_to_parse'] = measure(prompt_to_parse, repeat)
+
+            def first_recipe():
+                stream = service.iter_recipes(system, fan_out_prompts(prompts.build_user_prompt(next(forms)), 2),
+                                              options)
+                next(stream)
+                stream.close()
+            results['stream_first_recipe'] = measure(first_recipe, repeat)
+        finally:
+            service.close()
+            os.environ.pop('OPENAI_BASE_URL', None)
+    return results
+
+
+def bench_stream_parse(repeat):
+    from streaming import ResponsesStreamParser
+
+    text = synthetic.make_llm_response(4)
+    chunks = [text[i:i + 24] for i in range(0, len(text), 24)]
+
+    def parse():
+        parser = ResponsesStreamParser()
+        for chunk in chunks:
+            parser.feed(chunk)
+    return measure(parse, repeat)
+
+
+def bench_parse_repair(repeat):
+    from recipe_parser import parse_response
+
+    text = '```json\n' + synthetic.make_llm_response(4).replace('}', ',}') + '\n```'
+    return measure(lambda: parse_response(text), repeat)
+
+
+_DISPLAY = '''
+from recipe_flow import display_recipe
+for _recipe in st.session_state.get('bench_recipes', []):
+    display_recipe(_recipe)
+'''
+
+
+# app.py run under AppTest with the menu disabled, displaying n recipes
+def bench_display(repeat, n_recipes, db_path):
+    from streamlit.testing.v1 import AppTest
+
+    with open(os.path.join(ROOT, 'app.py')) as f:
+        code = f.read().replace('if __name__ == "__main__":', 'if False:') + _DISPLAY
+    recipes = json.loads(synthetic.make_llm_response(n_recipes, seed=3))['responses']
+    cwd = os.getcwd()
+    os.chdir(ROOT)
+    try:
+        at = AppTest.from_string(code, default_timeout=60)
+        at.secrets['OPENAI_API_KEY'] = 'sk-benchmark'
+        at.secrets['STORAGE_BACKEND'] = 'sqlite'
+        at.secrets['SQLITE_PATH'] = db_path
+        empty = measure(at.run, repeat)
+        at.session_state['bench_recipes'] = recipes
+        full = measure(at.run, repeat)
+    finally:
+        os.chdir(cwd)
+    return {'app_rerun': empty, f'display_recipe_x{n_recipes}': full}
+
+
+def bench_feed(recipes_count, repeat, db_path):
+    from feed import Feed, recipe_key
+    from nutrition import annotate
+    from search_index import build_from_base
+    from storage import PUT_MANY_LIMIT, SQLiteStorage
+
+    base = SQLiteStorage(db_path, 'recipes')
+    recipes = synthetic.make_recipes(recipes_count)
+    items = [dict(r, key=recipe_key(datetime.datetime.fromisoformat(r['timestamp']))) for r in recipes]
+    for start in range(0, len(items), PUT_MANY_LIMIT):
+        base.put_many(items[start:start + PUT_MANY_LIMIT])
+
+    def page():
+        feed = Feed()
+        for _ in range(3):
+            annotate(feed.load_more(base))
+    results = {'feed_page': [s / 3 for s in measure(page, repeat)]}
+
+    start = time.perf_counter()
+    index = build_from_base(base)
+    results['search_build'] = [time.perf_counter() - start]
+    queries = iter([f['available_ingredients'].split(',')[0] for f in synthetic.make_forms(repeat + 2, seed=4)] * 2)
+    results['feed_search'] = measure(lambda: index.search(next(queries), k=20, prefix=True), repeat)
+    return results
+
+
+def run(args):
+    samples = {}
+    samples['recommender'] = bench_recommender(args.catalog, args.repeat)
+    samples.update(bench_generation(max(5, args.repeat // 10), args.openai_latency))
+    samples['stream_parse'] = bench_stream_parse(args.repeat)
+    samples['parse_repair'] = bench_parse_repair(args.repeat)
+    with tempfile.TemporaryDirectory() as tmp:
+        samples.update(bench_feed(args.recipes, args.repeat, os.path.join(tmp, 'feed.db')))
+        samples.update(bench_display(max(5, args.repeat // 20), 20, os.path.join(tmp, 'app.db')))
+    return {name: report.summarize(values) for name, values in samples.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Microbenchmarks of the app hot paths.')
+    parser.add_argument('--catalog', type=int, default=20000, help='recipes in the recommender catalog')
+    parser.add_argument('--recipes', type=int, default=5000, help='community recipes in the feed')
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--openai-latency', type=float, default=0.0, help='fake OpenAI latency in seconds')
+    parser.add_argument('--baseline', default=report.BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--compare', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    report.print_table(results, 'Microbenchmarks')
+    if args.save_baseline:
+        settings = {'catalog': args.catalog, 'recipes': args.recipes, 'repeat': args.repeat}
+        report.save_baseline('micro', results, args.baseline, settings)
+        print(f'Saved the micro baseline to {args.baseline}')
+    if args.compare and not report.print_comparison('micro', results, args.baseline, args.tolerance):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
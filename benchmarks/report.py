@@ -0,0 +1,85 @@
+# benchmarks/report.py
+#
+# Latency summaries and the stored baseline shared by micro.py and load.py.
+# A baseline is a JSON file with one section per suite ("micro", "load"),
+# each mapping a benchmark name to its summary; compare() flags every
+# benchmark whose p50 or p95 got worse than the baseline by more than the
+# tolerance.
+
+import json
+import os
+import platform
+
+import numpy as np
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+COMPARED = ('p50_ms', 'p95_ms')
+
+
+# Samples in seconds -> count, percentiles and throughput in milliseconds
+def summarize(samples, elapsed=None, errors=0):
+    samples = np.asarray(samples, dtype=np.float64) * 1000
+    summary = {'count': int(len(samples)), 'errors': int(errors)}
+    if len(samples):
+        p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+        summary.update(p50_ms=round(float(p50), 3), p95_ms=round(float(p95), 3), p99_ms=round(float(p99), 3),
+                       mean_ms=round(float(samples.mean()), 3), max_ms=round(float(samples.max()), 3))
+    if elapsed:
+        summary['throughput_per_s'] = round(len(samples) / elapsed, 2)
+    return summary
+
+
+def print_table(results, title=None):
+    if title:
+        print(title)
+    print(f"{'benchmark':<28}{'count':>8}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'ops/s':>10}{'errors':>8}")
+    for name, s in results.items():
+        print(f"{name:<28}{s['count']:>8}{s.get('p50_ms', 0):>11.3f}{s.get('p95_ms', 0):>11.3f}"
+              f"{s.get('p99_ms', 0):>11.3f}{s.get('throughput_per_s', '-'):>10}{s.get('errors', 0):>8}")
+
+
+def load_baseline(path=BASELINE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+# Replace one suite's section of the baseline, keeping the others
+def save_baseline(suite, results, path=BASELINE_PATH, settings=None):
+    baseline = load_baseline(path)
+    baseline[suite] = {'machine': platform.platform(), 'python': platform.python_version(),
+                       'settings': settings or {}, 'results': results}
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+# Messages for the benchmarks that regressed: empty when all are within
+# tolerance, None when the baseline has no section for the suite
+def compare(suite, results, path=BASELINE_PATH, tolerance=0.25):
+    section = load_baseline(path).get(suite)
+    if not section:
+        return None
+    regressions = []
+    for name, summary in results.items():
+        before = section['results'].get(name)
+        if before is None:
+            continue
+        for metric in COMPARED:
+            old, new = before.get(metric), summary.get(metric)
+            if old and new and new > old * (1 + tolerance):
+                regressions.append(f'{name} {metric}: {old:.3f} -> {new:.3f} (+{(new / old - 1) * 100:.0f}%)')
+    return regressions
+
+
+def print_comparison(suite, results, path=BASELINE_PATH, tolerance=0.25):
+    regressions = compare(suite, results, path, tolerance)
+    if regressions is None:
+        print(f'No {suite} baseline in {path}; save one with --save-baseline')
+        return True
+    if not regressions:
+        print(f'No regressions against the {suite} baseline (tolerance {tolerance:.0%})')
+    for line in regressions:
+        print(f'  REGRESSION {line}')
+    return not regressions
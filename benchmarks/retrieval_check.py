@@ -0,0 +1,86 @@
+# benchmarks/retrieval_check.py
+#
+# Checks that the inverted index in retrieval.py answers every query with
+# the same top-k as the full cosine scan it replaces in recipe.py
+# (RecipeRecommender.recommend), with and without an exclusion mask, and
+# that it is not slower. Scores may differ by float rounding only; ties are
+# broken by catalog order in both. Exits with status 1 on any mismatch or
+# when the index is slower than the scan.
+#
+#   python benchmarks/retrieval_check.py --catalog 3000 20000 --queries 200
+
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(1, ROOT)
+
+import synthetic  # noqa: E402
+
+# Largest score difference still counted as the same score
+TOLERANCE = 1e-12
+
+
+# Same recipes in the same order, or only reordered among equal scores
+def same_results(expected, actual, tolerance=TOLERANCE):
+    if len(expected) != len(actual):
+        return False
+    for (expected_doc, expected_score), (doc, score) in zip(expected, actual):
+        if abs(expected_score - score) > tolerance:
+            return False
+        if doc != expected_doc and not any(abs(s - score) <= tolerance for d, s in expected if d == doc):
+            return False
+    return True
+
+
+def check(catalog_size, n_queries, k=5):
+    from exclusions import ExclusionIndex
+    from recommender import RecipeRecommender
+    from retrieval import InvertedIndex
+
+    names, ingredients = synthetic.make_catalog(catalog_size)
+    recommender = RecipeRecommender().fit(names, ingredients)
+    index = InvertedIndex.from_recommender(recommender)
+    exclusions = ExclusionIndex(ingredients)
+    mismatches = []
+    seconds = {'scan': 0.0, 'index': 0.0}
+    for form in synthetic.make_forms(n_queries, seed=catalog_size):
+        texts = [form['dietary_preferences'] + ' ' + form['available_ingredients'], form['available_ingredients']]
+        for text in texts:
+            for exclude in (None, exclusions.mask(form['restrictions'])):
+                start = time.perf_counter()
+                expected = recommender.recommend(text, k, None if exclude is None else exclude.copy())
+                seconds['scan'] += time.perf_counter() - start
+                start = time.perf_counter()
+                actual = index.search(text, k, exclude)
+                seconds['index'] += time.perf_counter() - start
+                if not same_results(expected, actual):
+                    mismatches.append((text, expected, actual))
+    return mismatches, seconds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check the inverted index against the cosine scan.')
+    parser.add_argument('--catalog', type=int, nargs='+', default=[3000, 20000], help='catalog sizes')
+    parser.add_argument('--queries', type=int, default=200, help='forms per catalog; each gives 4 queries')
+    args = parser.parse_args(argv)
+    failed = False
+
+    for size in args.catalog:
+        mismatches, seconds = check(size, args.queries)
+        queries = args.queries * 4
+        print(f"catalog {size}: {len(mismatches)}/{queries} mismatches, "
+              f"scan {seconds['scan'] / queries * 1000:.2f} ms, index {seconds['index'] / queries * 1000:.2f} ms")
+        for text, expected, actual in mismatches[:3]:
+            print(f'  {text!r}\n    scan:  {expected}\n    index: {actual}')
+        if mismatches or seconds['index'] > seconds['scan']:
+            failed = True
+
+    print('FAIL' if failed else 'OK')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,123 @@
+# benchmarks/startup.py
+#
+# Startup benchmark for app.py. It measures, each in a fresh interpreter:
+#   - the time to import everything app.py imports at module level, and
+#     checks that none of the heavy modules sneak back into that set
+#   - the cold run and the rerun time of the whole script, using
+#     Streamlit's AppTest with the local SQLite storage backend
+# and exits with status 1 when a measurement is over its budget.
+#
+#   python benchmarks/startup.py --import-budget-ms 1500 --rerun-budget-ms 250
+
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(ROOT, 'app.py')
+
+# Only the pages that need these may import them
+LAZY_MODULES = ['openai', 'httpx', 'bcrypt', 'sklearn', 'scipy', 'PIL', 'jinja2']
+
+_IMPORT_PROBE = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'loaded': [m for m in {lazy!r} if m in sys.modules]}}))
+"""
+
+_RERUN_PROBE = """
+import json, os, sys, time
+sys.path.insert(0, {root!r})
+os.chdir({root!r})
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({app!r}, default_timeout=60)
+at.secrets['OPENAI_API_KEY'] = 'sk-benchmark'
+at.secrets['STORAGE_BACKEND'] = 'sqlite'
+at.secrets['SQLITE_PATH'] = {db!r}
+start = time.perf_counter()
+at.run()
+cold = time.perf_counter() - start
+reruns = []
+for _ in range({runs}):
+    start = time.perf_counter()
+    at.run()
+    reruns.append(time.perf_counter() - start)
+reruns.sort()
+print(json.dumps({{'cold': cold, 'rerun': reruns[len(reruns) // 2],
+                   'errors': [str(e.value) for e in at.exception]}}))
+"""
+
+
+# Top level modules imported by app.py outside of any function
+def app_imports(path=APP):
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            modules.append(node.module)
+    return list(dict.fromkeys(modules))
+
+
+def _probe(code):
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, cwd=ROOT)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else 'probe failed')
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def measure_imports():
+    return _probe(_IMPORT_PROBE.format(root=ROOT, modules=app_imports(), lazy=LAZY_MODULES))
+
+
+def measure_reruns(runs=5):
+    with tempfile.TemporaryDirectory() as tmp:
+        return _probe(_RERUN_PROBE.format(root=ROOT, app=APP, db=os.path.join(tmp, 'bench.db'), runs=runs))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check app.py import and rerun time against a budget.')
+    parser.add_argument('--import-budget-ms', type=float, default=1500)
+    parser.add_argument('--rerun-budget-ms', type=float, default=250)
+    parser.add_argument('--runs', type=int, default=5, help='reruns to take the median of')
+    args = parser.parse_args(argv)
+    failed = False
+
+    imports = measure_imports()
+    import_ms = imports['seconds'] * 1000
+    print(f'imports: {import_ms:.0f} ms (budget {args.import_budget_ms:.0f} ms)')
+    if import_ms > args.import_budget_ms:
+        failed = True
+    if imports['loaded']:
+        print(f"  eagerly imported: {', '.join(imports['loaded'])}")
+        failed = True
+
+    try:
+        reruns = measure_reruns(args.runs)
+    except (RuntimeError, ValueError) as e:
+        print(f'rerun: skipped ({e})')
+    else:
+        rerun_ms = reruns['rerun'] * 1000
+        print(f"cold run: {reruns['cold'] * 1000:.0f} ms")
+        print(f'rerun: {rerun_ms:.0f} ms median (budget {args.rerun_budget_ms:.0f} ms)')
+        for error in reruns['errors']:
+            print(f'  app error: {error}')
+        if rerun_ms > args.rerun_budget_ms or reruns['errors']:
+            failed = True
+
+    print('FAIL' if failed else 'OK')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
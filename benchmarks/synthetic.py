@@ -0,0 +1,113 @@
+# benchmarks/synthetic.py
+#
+# Deterministic synthetic data for the benchmarks: community recipes shaped
+# like the `recipes` base items, users shaped like the `user` base items,
+# recipe generator form fields, and LLM answers in the "responses" JSON
+# format. Every generator takes a seed so runs are comparable.
+
+import datetime
+import json
+import random
+
+INGREDIENTS = [
+    'tofu', 'tempeh', 'chickpeas', 'lentils', 'black beans', 'quinoa', 'brown rice', 'pasta', 'oats',
+    'sweet potatoes', 'potatoes', 'tomatoes', 'onions', 'garlic', 'ginger', 'carrots', 'bell peppers',
+    'broccoli', 'spinach', 'kale', 'mushrooms', 'zucchini', 'eggplant', 'avocado', 'bananas', 'blueberries',
+    'coconut milk', 'almond milk', 'peanut butter', 'tahini', 'soy sauce', 'curry paste', 'maple syrup',
+    'olive oil', 'cumin', 'turmeric', 'paprika', 'lemon juice', 'cilantro', 'basil', 'walnuts', 'cashews',
+]
+AMOUNTS = ['1 cup', '1/2 cup', '2 tbsp', '1 tsp', '1 can', '200g', '2', '3 cloves', '1 1/2 cups', '']
+DISHES = ['Curry', 'Stir-Fry', 'Salad', 'Bowl', 'Soup', 'Stew', 'Tacos', 'Pasta', 'Smoothie', 'Wrap']
+STEPS = ['Chop the vegetables.', 'Heat the oil in a pan.', 'Simmer for 15 minutes.', 'Season to taste.',
+         'Blend until smooth.', 'Roast at 200C for 25 minutes.', 'Toss everything together.',
+         'Serve warm with rice.', 'Garnish with fresh herbs.']
+PREFERENCES = ['high protein', 'low fat', 'gluten free', 'spicy', 'quick meals', 'comfort food',
+               'low carb', 'kid friendly', 'asian', 'mediterranean']
+RESTRICTIONS = ['', '', '', 'soy-free', 'nut allergy', 'gluten free', 'no sugar', 'nightshade-free']
+MEAL_TYPES = ['Breakfast', 'Lunch', 'Dinner']
+STYLES = ['Airfryer', 'Stove', 'Oven', 'Grill', 'Blender']
+
+
+def _ingredient_line(rng):
+    amount = rng.choice(AMOUNTS)
+    return f'{amount} {rng.choice(INGREDIENTS)}'.strip()
+
+
+def make_recipe_response(rng):
+    main = rng.choice(INGREDIENTS)
+    return {
+        'name': f'{main.title()} {rng.choice(DISHES)}',
+        'ingredients': [_ingredient_line(rng) for _ in range(rng.randint(4, 10))],
+        'instructions': ' '.join(rng.sample(STEPS, 4)),
+        'cooking_time': f'{rng.randint(10, 60)} minutes',
+        'servings': rng.randint(1, 6),
+    }
+
+
+# Community recipes as stored by insert_recipe, oldest first
+def make_recipes(n, seed=0, users=200, start=datetime.datetime(2023, 1, 1)):
+    rng = random.Random(seed)
+    recipes = []
+    for i in range(n):
+        response = make_recipe_response(rng)
+        when = start + datetime.timedelta(minutes=17 * i)
+        recipes.append({
+            'username': f'user{rng.randrange(users)}',
+            'title': response['name'],
+            'ingredients': ', '.join(response['ingredients']),
+            'recipe': response['instructions'],
+            'timestamp': str(when),
+        })
+    return recipes
+
+
+# User records as insert_user writes them; dietary_preferences is only set
+# once a user has submitted the Dashboard form, so a share of them lack it
+def make_users(n, seed=0, password_hash='$2b$04$' + 'x' * 53, with_preferences=0.5):
+    rng = random.Random(seed)
+    users = []
+    for i in range(n):
+        user = {
+            'key': f'user{i}',
+            'username': f'user{i}',
+            'password': password_hash,
+            'date_joined': str(datetime.datetime(2023, 1, 1) + datetime.timedelta(hours=i)),
+            'dietary_restrictions': rng.choice(RESTRICTIONS),
+            'responses': [],
+            'recent_logins': [],
+        }
+        if rng.random() < with_preferences:
+            user['dietary_preferences'] = ', '.join(rng.sample(PREFERENCES, 2))
+        users.append(user)
+    return users
+
+
+# Fields of the Dashboard recipe generator form
+def make_forms(n, seed=0):
+    rng = random.Random(seed)
+    return [{
+        'dietary_preferences': ', '.join(rng.sample(PREFERENCES, 2)),
+        'restrictions': rng.choice(RESTRICTIONS),
+        'available_ingredients': ', '.join(rng.sample(INGREDIENTS, rng.randint(3, 8))),
+        'meal_type': rng.choice(MEAL_TYPES),
+        'cooking_time': rng.choice([15, 30, 45, 60]),
+        'cooking_styles': rng.sample(STYLES, rng.randint(1, 2)),
+        'cuisine_type': rng.choice(['', 'Indian', 'Thai', 'Italian', 'Mexican']),
+        'servings': rng.randint(1, 6),
+    } for _ in range(n)]
+
+
+# An answer in the JSON format the prompts ask for
+def make_llm_response(n_recipes=2, seed=0):
+    rng = random.Random(seed)
+    return json.dumps({'responses': [make_recipe_response(rng) for _ in range(n_recipes)]}, indent=2)
+
+
+# Catalog columns (names, comma separated ingredients) for the recommender
+def make_catalog(n, seed=0):
+    rng = random.Random(seed)
+    names, ingredients = [], []
+    for i in range(n):
+        names.append(f'{rng.choice(INGREDIENTS).title()} {rng.choice(DISHES)} {i}')
+        ingredients.append(', '.join(rng.sample(INGREDIENTS, rng.randint(3, 8))))
+    return names, ingredients
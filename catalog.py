@@ -0,0 +1,12 @@
+# catalog.py
+#
+# Recipe catalog used by the recommender in recipe.py and the batch job.
+
+RECIPE_NAMES = ['Vegan Pasta', 'Quinoa Salad', 'Sweet Potato Curry', 'Chickpea Stir-Fry']
+
+RECIPE_INGREDIENTS = [
+    'pasta, tomato sauce, vegetables',
+    'quinoa, vegetables, vinaigrette',
+    'sweet potato, coconut milk, curry paste',
+    'chickpeas, vegetables, soy sauce'
+]
@@ -0,0 +1,20 @@
+# durations.py
+#
+# Cooking times written as text, as LLM answers and community recipes give
+# them, turned into minutes. Shared by the recipe parser, the search index
+# and local-first matching.
+
+import re
+
+_MINUTES = re.compile(r'(\d+(?:\.\d+)?)\s*(h|hr|hrs|hour|hours|m|min|mins|minute|minutes)\b')
+
+
+# '1 hour 15 minutes' -> 75; None when there is no time in the text
+def parse_minutes(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    total, found = 0.0, False
+    for amount, unit in _MINUTES.findall(str(value or '').lower()):
+        total += float(amount) * (60 if unit.startswith('h') else 1)
+        found = True
+    return total if found else None
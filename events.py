@@ -0,0 +1,151 @@
+# events.py
+#
+# Append-only log of login and page visit events, kept out of the user
+# record. Events are partitioned by time into one base per period
+# (events_202611 for monthly rotation) and keyed by user and time inside a
+# partition, so a user's events sort together. Writes go through a
+# write-behind queue that sends them with put_many; every event expires
+# after the retention period. When the partition rotates, the writers of
+# older partitions are closed and expired events are pruned from backends
+# that do not drop them by themselves (SQLite).
+
+import datetime
+import logging
+import secrets
+import threading
+
+from storage import PUT_MANY_LIMIT
+from write_behind import WriteBehindQueue
+
+logger = logging.getLogger(__name__)
+
+PARTITION_FORMATS = {'month': '%Y%m', 'day': '%Y%m%d'}
+
+
+class EventLog:
+    """Buffered, time partitioned event store on top of a storage backend."""
+
+    def __init__(self, open_base, rotation='month', retention_days=90, batch_size=PUT_MANY_LIMIT,
+                 flush_interval=5.0):
+        # open_base(name) returns a storage.Storage for that base
+        self._open_base = open_base
+        self.partition_format = PARTITION_FORMATS[rotation]
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._bases = {}
+        self._writers = {}
+        self._lock = threading.Lock()
+
+    def partition(self, when):
+        return 'events_' + when.strftime(self.partition_format)
+
+    def _base(self, name):
+        with self._lock:
+            if name not in self._bases:
+                self._bases[name] = self._open_base(name)
+            return self._bases[name]
+
+    @property
+    def expire_in(self):
+        return self.retention_days * 24 * 3600 if self.retention_days else None
+
+    # One background writer per partition; each batches its events into
+    # put_many calls. Opening a newer partition retires the older writers.
+    def _writer(self, name):
+        base = self._base(name)
+        with self._lock:
+            writer = self._writers.get(name)
+            if writer is not None:
+                return writer
+            writer = self._writers[name] = WriteBehindQueue(base, batch_size=self.batch_size,
+                                                            flush_interval=self.flush_interval,
+                                                            expire_in=self.expire_in, name=f'events-{name}')
+            # Partition names sort by time
+            retired = [self._writers.pop(old) for old in list(self._writers) if old < name]
+        threading.Thread(target=self._rotate, args=(retired,), name='events-rotate', daemon=True).start()
+        return writer
+
+    # Flush and stop the retired writers, then prune expired events
+    def _rotate(self, retired):
+        for writer in retired:
+            writer.close()
+        try:
+            self.prune()
+        except Exception:
+            logger.exception('Pruning expired events failed')
+
+    def record(self, username, kind, **fields):
+        now = datetime.datetime.now()
+        event = dict(fields, username=username, kind=kind, timestamp=str(now))
+        event['key'] = f'{username}:{now.isoformat()}:{secrets.token_hex(2)}'
+        name = self.partition(now)
+        try:
+            self._writer(name).put(event)
+        except RuntimeError:
+            # Its writer was retired by a rotation in the meantime
+            self._base(name).put(event, expire_in=self.expire_in)
+        return event
+
+    # Partitions that can hold events from since to until, oldest first;
+    # on backends that can list their bases, only the ones that exist
+    def _partitions(self, since, until):
+        names, day = [], since
+        while day.date() <= until.date():
+            name = self.partition(day)
+            if name not in names:
+                names.append(name)
+            day += datetime.timedelta(days=1)
+        existing = self._existing_partitions()
+        return names if existing is None else [name for name in names if name in existing]
+
+    # Every partition in the backend, or None when it cannot list them (Deta)
+    def _existing_partitions(self):
+        base = self._base(self.partition(datetime.datetime.now()))
+        if not hasattr(base, 'list_bases'):
+            return None
+        return set(base.list_bases('events_'))
+
+    # Delete expired events from every existing partition on backends that
+    # keep them (SQLite); Deta expires items by itself. Runs on every
+    # rotation; returns the number of events deleted.
+    def prune(self):
+        if not self.retention_days:
+            return 0
+        existing = self._existing_partitions()
+        deleted = 0
+        for name in sorted(existing or ()):
+            base = self._base(name)
+            if hasattr(base, 'prune_expired'):
+                deleted += base.prune_expired()
+        if deleted:
+            logger.info('Pruned %d expired events', deleted)
+        return deleted
+
+    # Write out every queued event and stop the writers
+    def close(self):
+        with self._lock:
+            writers = list(self._writers.values())
+            self._writers.clear()
+        for writer in writers:
+            writer.close()
+
+    # A user's events between since and until (datetimes), oldest first
+    def events_for(self, username, since, until=None):
+        until = until or datetime.datetime.now()
+        events = []
+        for name in self._partitions(since, until):
+            base = self._base(name)
+            response = base.fetch({'username': username})
+            events.extend(response.items)
+            while response.last:
+                response = base.fetch({'username': username}, last=response.last)
+                events.extend(response.items)
+        start, end = str(since), str(until)
+        return sorted((e for e in events if start <= e['timestamp'] <= end), key=lambda e: e['timestamp'])
+
+
+# Keep the newest `limit` logins on the user record
+def recent_logins(user, login, limit=5):
+    logins = (user.get('recent_logins') or []) + [login]
+    return logins[-limit:]
@@ -0,0 +1,114 @@
+# exclusions.py
+#
+# Hard exclusion of recipes containing restricted or vulnerable ingredients.
+#
+# Ingredients are parsed to canonical ids (see ingredients.py) and the
+# catalog is stored as a recipe x ingredient boolean matrix packed into
+# one bitset per ingredient (np.packbits along the recipe axis). Excluding a
+# restriction ORs the bitsets of every ingredient it covers, so the cost is
+# a few N/8 byte vector operations regardless of how the recipes are scored.
+
+import re
+from functools import lru_cache
+
+import numpy as np
+
+from ingredients import TABLE, canonical_name, parse_batch
+
+# Restriction -> ingredients that fall under it. Matching is on whole words,
+# so 'soy' also catches 'soy sauce' without listing it.
+SYNONYM_GROUPS = {
+    'soy': ['tofu', 'tempeh', 'edamame', 'miso', 'soybean', 'soybeans', 'tamari'],
+    'gluten': ['wheat', 'pasta', 'bread', 'seitan', 'flour', 'couscous', 'barley', 'rye', 'soy sauce'],
+    'wheat': ['pasta', 'bread', 'seitan', 'flour', 'couscous', 'soy sauce'],
+    'nut': ['nuts', 'almond', 'almonds', 'cashew', 'cashews', 'walnut', 'walnuts', 'pecan', 'pecans',
+            'hazelnut', 'hazelnuts', 'pistachio', 'pistachios', 'almond milk', 'cashew nuts'],
+    'peanut': ['peanuts', 'peanut butter'],
+    'sesame': ['tahini', 'sesame oil', 'sesame seeds'],
+    'coconut': ['coconut milk', 'coconut oil', 'coconut cream'],
+    'sugar': ['maple syrup', 'agave', 'brown sugar', 'cane sugar'],
+    'nightshade': ['tomato', 'tomatoes', 'tomato sauce', 'potato', 'potatoes', 'eggplant', 'bell pepper',
+                   'chili', 'curry paste'],
+    'legume': ['chickpeas', 'lentils', 'beans', 'peas', 'peanuts', 'soybeans'],
+}
+SYNONYM_GROUPS['nuts'] = SYNONYM_GROUPS['nut']
+SYNONYM_GROUPS['peanuts'] = SYNONYM_GROUPS['peanut']
+SYNONYM_GROUPS['legumes'] = SYNONYM_GROUPS['legume']
+
+_SPLIT = re.compile(r'[,;/\n]|\band\b')
+_PREFIXES = ('allergic to ', 'allergy to ', 'no ', 'without ', 'avoid ', 'free of ')
+_SUFFIXES = ('-free', ' free', ' allergy', ' allergies', ' intolerance')
+
+
+def normalize_ingredient(name):
+    return ' '.join(name.lower().split())
+
+
+# 'Soy-free, no sugar' -> ['soy', 'sugar']
+def parse_restrictions(text):
+    terms = []
+    for part in _SPLIT.split((text or '').lower()):
+        term = part.strip(' .')
+        for prefix in _PREFIXES:
+            if term.startswith(prefix):
+                term = term[len(prefix):]
+        for suffix in _SUFFIXES:
+            if term.endswith(suffix):
+                term = term[:-len(suffix)]
+        term = normalize_ingredient(term)
+        if term:
+            terms.append(term)
+    return terms
+
+
+def _contains_word(ingredient, word):
+    return re.search(r'\b' + re.escape(word) + r'\b', ingredient) is not None
+
+
+class ExclusionIndex:
+    """Packed recipe x ingredient bitsets answering exclusion masks."""
+
+    def __init__(self, recipe_ingredients=(), indptr=None, ids=None):
+        if indptr is None:
+            batch = parse_batch(recipe_ingredients)
+            indptr, ids = batch.indptr, batch.ids
+        self.n_recipes = len(indptr) - 1
+        # One bitset per distinct ingredient id of this catalog
+        ingredient_ids, columns = np.unique(ids, return_inverse=True)
+        self.ingredients = [TABLE.name(i) for i in ingredient_ids]
+        recipes = np.repeat(np.arange(self.n_recipes, dtype=np.int64), np.diff(indptr))
+        # Set bits directly so the unpacked matrix is never materialised
+        self.bits = np.zeros((len(self.ingredients), (self.n_recipes + 7) // 8), dtype=np.uint8)
+        np.bitwise_or.at(self.bits, (columns.astype(np.int64), recipes >> 3),
+                         (0x80 >> (recipes & 7)).astype(np.uint8))
+        self._term_ids = lru_cache(maxsize=4096)(self._resolve_term)
+        self._masks = lru_cache(maxsize=1024)(self._mask_for_terms)
+
+    # From ingredient ids that are already parsed, one sequence per recipe
+    @classmethod
+    def from_ids(cls, recipe_ids):
+        indptr = np.cumsum([0] + [len(ids) for ids in recipe_ids], dtype=np.int64)
+        ids = np.fromiter((i for ids in recipe_ids for i in ids), dtype=np.int32, count=int(indptr[-1]))
+        return cls(indptr=indptr, ids=ids)
+
+    # Ingredient ids covered by one restriction term, including its synonym group
+    def _resolve_term(self, term):
+        words = {canonical_name(word) for word in [term] + SYNONYM_GROUPS.get(term, [])} - {''}
+        return tuple(i for i, name in enumerate(self.ingredients)
+                     if any(_contains_word(name, word) for word in words))
+
+    def _mask_for_terms(self, terms):
+        ids = sorted({i for term in terms for i in self._term_ids(term)})
+        if ids:
+            packed = np.bitwise_or.reduce(self.bits[ids], axis=0)
+            mask = np.unpackbits(packed, count=self.n_recipes).astype(bool)
+        else:
+            mask = np.zeros(self.n_recipes, dtype=bool)
+        # Masks are cached and shared between callers
+        mask.flags.writeable = False
+        return mask
+
+    # Boolean array of recipes to exclude for the given restriction strings
+    def mask(self, *restrictions):
+        terms = tuple(sorted({t for text in restrictions for t in parse_restrictions(text)}))
+        return self._masks(terms)
@@ -0,0 +1,128 @@
+# feed.py
+#
+# Cursor paginated Recipes Feed. Recipe keys are built from an inverted
+# timestamp, so the base's ascending key order is already newest-first and
+# each page is one fetch(limit, last) call; nothing is loaded or reversed
+# beyond the pages the user has asked for. Recipes saved before this with
+# random keys sort out of order until they are re-keyed, once, with
+#
+#   python feed.py --dry-run                  # count them
+#   python feed.py                            # re-key the Deta base (DETA_KEY)
+#   python feed.py --backend sqlite --sqlite-path nutriveg.db
+
+import argparse
+import datetime
+import os
+import secrets
+import sys
+
+PAGE_SIZE = int(os.getenv('FEED_PAGE_SIZE', '10'))
+
+# Microseconds up to the year 2286; keeps every key the same width
+_MAX_MICROS = 10 ** 16 - 1
+
+
+# Key that sorts newer recipes first, e.g. '8297413624783120a41f'
+def recipe_key(when=None):
+    when = when or datetime.datetime.now()
+    micros = int(when.timestamp() * 1_000_000)
+    return f'{_MAX_MICROS - micros:016d}{secrets.token_hex(2)}'
+
+
+def is_feed_key(key):
+    return len(key) == 20 and key[:16].isdigit()
+
+
+# Upload time of a feed key, in seconds since the epoch
+def key_time(key):
+    return (_MAX_MICROS - int(key[:16])) / 1_000_000
+
+
+class Feed:
+    """Pages of the feed fetched so far by one session."""
+
+    def __init__(self, page_size=PAGE_SIZE):
+        self.page_size = page_size
+        self.pages = []
+        self.last = None
+        self.exhausted = False
+        # Recipes this session uploaded that may not be written yet
+        self.pinned = []
+
+    # Pinned recipes, then every fetched page; pins that a fetch has since
+    # returned are dropped
+    def visible_recipes(self):
+        fetched = [recipe for page in self.pages for recipe in page]
+        keys = {recipe['key'] for recipe in fetched}
+        self.pinned = [recipe for recipe in self.pinned if recipe['key'] not in keys]
+        return self.pinned + fetched
+
+    # Show a just uploaded recipe first until a fetch returns it
+    def pin(self, recipe):
+        self.pinned.insert(0, recipe)
+
+    def load_more(self, base):
+        if self.exhausted:
+            return []
+        response = base.fetch(limit=self.page_size, last=self.last)
+        self.pages.append(response.items)
+        self.last = response.last
+        self.exhausted = not response.last
+        return response.items
+
+    # Start again from the newest page; pinned recipes stay
+    def reset(self):
+        self.pages = []
+        self.last = None
+        self.exhausted = False
+
+
+# Recipes saved with random keys, which sort out of timestamp order
+def legacy_recipes(base):
+    response = base.fetch()
+    legacy = [r for r in response.items if not is_feed_key(r['key'])]
+    while response.last:
+        response = base.fetch(last=response.last)
+        legacy.extend(r for r in response.items if not is_feed_key(r['key']))
+    return legacy
+
+
+# One-off migration: re-key recipes saved with random keys so they sort by
+# timestamp. Recipes without a readable timestamp keep their key; returns
+# (migrated, skipped).
+def migrate_legacy_keys(base, dry_run=False):
+    migrated = skipped = 0
+    for recipe in legacy_recipes(base):
+        old_key = recipe['key']
+        try:
+            when = datetime.datetime.fromisoformat(recipe['timestamp'])
+        except (KeyError, ValueError):
+            skipped += 1
+            continue
+        if not dry_run:
+            base.put(dict(recipe, key=recipe_key(when)))
+            base.delete(old_key)
+        migrated += 1
+    return migrated, skipped
+
+
+def main(argv=None):
+    from storage import open_base
+    parser = argparse.ArgumentParser(description='Re-key legacy recipes so the feed lists them newest-first.')
+    parser.add_argument('--backend', default='deta', choices=['deta', 'sqlite'], help='storage backend of the recipes base')
+    parser.add_argument('--sqlite-path', default='nutriveg.db', help='database file for the sqlite backend')
+    parser.add_argument('--dry-run', action='store_true', help='count the recipes to re-key without changing them')
+    args = parser.parse_args(argv)
+
+    deta_key = os.getenv('DETA_KEY')
+    if args.backend == 'deta' and not deta_key:
+        parser.error('DETA_KEY must be set to migrate the Deta base')
+    base = open_base('recipes', args.backend, deta_key=deta_key, sqlite_path=args.sqlite_path)
+    migrated, skipped = migrate_legacy_keys(base, dry_run=args.dry_run)
+    print(f"{'Would re-key' if args.dry_run else 'Re-keyed'} {migrated} recipes; "
+          f'{skipped} without a readable timestamp were left as they are')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
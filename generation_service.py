@@ -0,0 +1,332 @@
+# generation_service.py
+#
+# Process wide asyncio service for OpenAI recipe generation. It runs one
+# event loop in a background thread that every Streamlit session submits
+# to, so the rate limits and the concurrency pool are shared by the whole
+# server rather than by each script run. Each call goes through a request
+# and a token bucket matched to the API quota, runs under a timeout and is
+# retried with exponential backoff and full jitter on 429s, timeouts,
+# connection errors and 5xx responses. Calls given a key are coalesced:
+# identical requests made while one is running share its upstream call
+# (see single_flight.py).
+
+import asyncio
+import concurrent.futures
+import logging
+import os
+import queue
+import random
+import threading
+import time
+
+import httpx
+import openai
+
+import metrics
+import prompts
+import resources
+from recipe_parser import InvalidRecipe, coerce_recipe
+from single_flight import SingleFlight
+from streaming import ResponsesStreamParser
+
+logger = logging.getLogger(__name__)
+
+MODEL = 'gpt-3.5-turbo'
+
+# Appended to the user prompt when one request is split into several smaller ones
+FAN_OUT_HINTS = [
+    'Keep it quick and simple.',
+    'Make it a heartier, more filling dish.',
+    'Use as many of the available ingredients as possible.',
+    'Try a different cooking technique from the usual one.',
+]
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+    asyncio.TimeoutError,
+)
+
+_DONE = object()
+
+
+# Queue-like end of _fan_out that publishes recipes to a single flight; the
+# flight is finished by the future's done callback, which also carries errors
+class _FlightSink:
+    def __init__(self, flight):
+        self.flight = flight
+
+    def put(self, item):
+        if item is not _DONE:
+            self.flight.publish(item)
+
+
+class TokenBucket:
+    """Async token bucket refilled continuously at `rate` tokens per second."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount=1):
+        amount = min(amount, self.capacity)
+        # Waiters queue on the lock so a large request is not starved by small ones
+        async with self._lock:
+            self._refill()
+            while self.tokens < amount:
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= amount
+
+
+# Full jitter: sleep a random time up to the exponential cap
+def backoff_delay(attempt, base=0.5, max_delay=20.0):
+    return random.uniform(0, min(max_delay, base * 2 ** attempt))
+
+
+def _retry_after(error):
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+# Split one prompt into n smaller prompts asking for one distinct recipe each
+def fan_out_prompts(prompt, n):
+    if n <= 1:
+        return [prompt]
+    return [f'{prompt}\nReturn exactly one recipe in "responses". This is suggestion {i + 1} of {n}: '
+            f'{FAN_OUT_HINTS[i % len(FAN_OUT_HINTS)]}' for i in range(n)]
+
+
+def estimate_tokens(*texts, completion_tokens=800):
+    return sum(len(t) for t in texts) // 4 + completion_tokens
+
+
+class GenerationService:
+    """Rate limited, retrying OpenAI client running on a background event loop."""
+
+    def __init__(self, api_key, requests_per_minute=3500, tokens_per_minute=90000,
+                 max_concurrency=8, timeout=60.0, max_retries=4):
+        # One pooled keep-alive HTTP client for every request of this process
+        self.http_client = httpx.AsyncClient(limits=resources.http_limits(), timeout=timeout)
+        self.client = openai.AsyncOpenAI(api_key=api_key, max_retries=0, http_client=self.http_client)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name='generation-service', daemon=True)
+        self._thread.start()
+        # Loop bound primitives are created on the loop itself
+        self._run(self._setup(requests_per_minute, tokens_per_minute))
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost_usd = 0.0
+        self.flights = SingleFlight()
+
+    async def _setup(self, requests_per_minute, tokens_per_minute):
+        self.request_bucket = TokenBucket(requests_per_minute / 60, max(1, requests_per_minute // 60))
+        self.token_bucket = TokenBucket(tokens_per_minute / 60, max(1, tokens_per_minute // 6))
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    def _run(self, coro, timeout=None):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    # Token usage from the API when it is reported, counted locally otherwise
+    def _record_usage(self, system, prompt, completion_text, usage=None):
+        if usage is not None:
+            prompt_tokens, completion_tokens = usage.prompt_tokens, usage.completion_tokens
+        else:
+            prompt_tokens = prompts.count_message_tokens(self._messages(system, prompt), MODEL)
+            completion_tokens = prompts.count_tokens(completion_text, MODEL)
+        cost = prompts.cost(prompt_tokens, completion_tokens, MODEL)
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.cost_usd += cost
+        source = 'usage' if usage is not None else 'counted'
+        metrics.inc('openai_tokens_total', prompt_tokens, kind='prompt', source=source)
+        metrics.inc('openai_tokens_total', completion_tokens, kind='completion', source=source)
+        metrics.inc('openai_cost_usd_total', cost)
+
+    def _messages(self, system, prompt):
+        return [{'role': 'system', 'content': system}, {'role': 'user', 'content': prompt}]
+
+    # mode labels the call's metrics: 'complete' or 'stream'
+    async def _with_retries(self, system, prompt, call, can_retry=lambda: True, mode='complete'):
+        for attempt in range(self.max_retries + 1):
+            with metrics.timed('openai_wait_seconds', mode=mode):
+                await self.request_bucket.acquire()
+                await self.token_bucket.acquire(estimate_tokens(system, prompt))
+            try:
+                async with self.semaphore:
+                    self.calls += 1
+                    with metrics.timed('openai_seconds', mode=mode):
+                        return await asyncio.wait_for(call(), self.timeout)
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries or not can_retry():
+                    self.failures += 1
+                    raise
+                self.retries += 1
+                metrics.inc('openai_retries_total', mode=mode, error=type(e).__name__)
+                delay = _retry_after(e) or backoff_delay(attempt)
+                logger.warning('OpenAI call failed (%s), retrying in %.1fs', type(e).__name__, delay)
+                await asyncio.sleep(delay)
+
+    async def agenerate(self, system, prompt, options=None):
+        async def call():
+            completion = await self.client.chat.completions.create(
+                model=MODEL, messages=self._messages(system, prompt), **(options or {}))
+            text = completion.choices[0].message.content
+            self._record_usage(system, prompt, text, completion.usage)
+            return text
+        return await self._with_retries(system, prompt, call)
+
+    # Stream one completion, putting each finished recipe on out; retried only
+    # while nothing has been emitted so the caller never sees duplicates
+    async def _stream_recipes(self, system, prompt, out, options=None):
+        emitted = 0
+
+        async def call():
+            nonlocal emitted
+            start = time.perf_counter()
+            parser = ResponsesStreamParser()
+            stream = await self.client.chat.completions.create(
+                model=MODEL, messages=self._messages(system, prompt), stream=True, **(options or {}))
+            try:
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        for element in parser.feed(chunk.choices[0].delta.content):
+                            try:
+                                recipe = coerce_recipe(element)
+                            except InvalidRecipe as e:
+                                logger.warning('Dropping invalid streamed recipe: %s', e)
+                                metrics.inc('recipes_invalid_total')
+                                continue
+                            if not emitted:
+                                metrics.observe('openai_first_recipe_seconds', time.perf_counter() - start)
+                            emitted += 1
+                            out.put(recipe.as_dict())
+            finally:
+                await stream.response.aclose()
+                self._record_usage(system, prompt, parser.text)
+            return emitted
+        return await self._with_retries(system, prompt, call, can_retry=lambda: emitted == 0, mode='stream')
+
+    async def _fan_out(self, system, prompts, out, options=None):
+        try:
+            results = await asyncio.gather(*(self._stream_recipes(system, p, out, options) for p in prompts),
+                                           return_exceptions=True)
+            errors = [r for r in results if isinstance(r, BaseException)]
+            for error in errors:
+                logger.warning('Recipe request failed: %r', error)
+            # Partial results are still useful; only fail when every request did
+            if errors and len(errors) == len(results):
+                raise errors[0]
+        finally:
+            out.put(_DONE)
+
+    # Blocking helpers for script code. With a key, concurrent calls for the
+    # same key share one upstream request.
+    def generate(self, system, prompt, options=None, key=None):
+        if key is None:
+            return self._run(self.agenerate(system, prompt, options))
+
+        def start(flight):
+            future = asyncio.run_coroutine_threadsafe(self.agenerate(system, prompt, options), self.loop)
+
+            def done(future):
+                if future.cancelled():
+                    flight.finish()
+                elif future.exception() is not None:
+                    flight.finish(future.exception())
+                else:
+                    flight.publish(future.result())
+                    flight.finish()
+            future.add_done_callback(done)
+            return future.cancel
+        with self.flights.join(key, start) as reader:
+            for text in reader:
+                return text
+        # The flight was cancelled before it produced an answer, as a
+        # cancelled call without a key would be
+        raise concurrent.futures.CancelledError(f'generation for {key!r} was cancelled')
+
+    # Run the prompts in parallel and yield recipes as they complete, in
+    # whatever order they finish. Closing the iterator cancels the requests;
+    # with a key, only once every caller sharing them has closed its iterator.
+    def iter_recipes(self, system, prompts, options=None, key=None):
+        if key is None:
+            return self._iter_recipes(system, prompts, options)
+
+        def start(flight):
+            future = asyncio.run_coroutine_threadsafe(self._fan_out(system, prompts, _FlightSink(flight), options),
+                                                      self.loop)
+            future.add_done_callback(
+                lambda future: flight.finish(None if future.cancelled() else future.exception()))
+            return future.cancel
+        return self.flights.join(key, start)
+
+    def _iter_recipes(self, system, prompts, options=None):
+        out = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(self._fan_out(system, prompts, out, options), self.loop)
+        try:
+            while True:
+                item = out.get()
+                if item is _DONE:
+                    break
+                yield item
+            future.result()
+        finally:
+            future.cancel()
+
+    def stats(self):
+        return {'calls': self.calls, 'retries': self.retries, 'failures': self.failures,
+                'max_concurrency': self.max_concurrency, 'prompt_tokens': self.prompt_tokens,
+                'completion_tokens': self.completion_tokens, 'cost_usd': round(self.cost_usd, 6),
+                'single_flight': self.flights.stats(), 'pool': resources.pool_stats(self.http_client)}
+
+    # Cancel requests still running (e.g. from abandoned streams), then close the client
+    async def _shutdown(self):
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.client.close()
+        await self.loop.shutdown_asyncgens()
+
+    # Close the HTTP connections and stop the event loop
+    def close(self, timeout=10.0):
+        if not self.loop.is_running():
+            return
+        try:
+            self._run(self._shutdown(), timeout)
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout)
+
+
+# The shared service for this process, created on first use
+def get_generation_service(api_key):
+    return resources.get('openai', lambda: GenerationService(
+        api_key,
+        requests_per_minute=int(os.getenv('OPENAI_RPM', '3500')),
+        tokens_per_minute=int(os.getenv('OPENAI_TPM', '90000')),
+        max_concurrency=int(os.getenv('OPENAI_MAX_CONCURRENCY', '8')),
+        timeout=float(os.getenv('OPENAI_TIMEOUT', '60')),
+    ), close=lambda service: service.close(), stats=lambda service: service.stats())
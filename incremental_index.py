@@ -0,0 +1,275 @@
+# incremental_index.py
+#
+# TF-IDF index over community recipes that accepts new documents without a
+# refit. Documents are stored as raw term counts in small immutable segments
+# and IDF is applied at query time, so refreshing IDF only recomputes the
+# document norms; nothing is re-tokenized.
+#
+# Every change publishes a new immutable Snapshot. Readers take
+# `index.snapshot` once and keep serving from that consistent version while
+# the writer builds the next one.
+#
+# CommunityIndex keeps one over the recipes base current by polling it for
+# keys it has not seen, newest first, so an upload from any process becomes
+# searchable within COMMUNITY_SYNC_INTERVAL seconds of being written.
+# recipe.py recommends from it next to the fixed catalog.
+
+import os
+import threading
+import time
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from exclusions import ExclusionIndex
+from feed import is_feed_key, key_time
+from ingredients import ingredient_ids
+from recommender import top_k
+
+SYNC_INTERVAL = float(os.getenv('COMMUNITY_SYNC_INTERVAL', '5'))
+# Writes are queued before they reach the base, so one can land after a
+# newer key was already seen; known keys younger than this do not end a poll
+SYNC_LOOKBACK = float(os.getenv('COMMUNITY_SYNC_LOOKBACK', '120'))
+SYNC_PAGE_SIZE = 100
+# Candidates taken from the index before restrictions are applied
+CANDIDATES = 50
+
+
+class Snapshot:
+    """Immutable, versioned view of the index that readers search."""
+
+    def __init__(self, version, segments, keys, idf, norms):
+        self.version = version
+        self.segments = segments
+        self.keys = keys
+        self.idf = idf
+        self.norms = norms
+
+    def __len__(self):
+        return len(self.keys)
+
+    # Return [(key, score), ...] for the k documents most similar to the query counts
+    def search_counts(self, term_ids, counts, k=5):
+        if not self.keys:
+            return []
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        counts = np.asarray(counts, dtype=np.float64)
+        known = term_ids < len(self.idf)
+        term_ids, counts = term_ids[known], counts[known]
+        query = counts * self.idf[term_ids]
+        query_norm = np.linalg.norm(query)
+        if query_norm == 0:
+            return []
+        # doc . query = sum(count_d * idf * count_q * idf); divide by both norms for cosine
+        query = query * self.idf[term_ids] / query_norm
+        scores = []
+        for segment, norms in zip(self.segments, self.norms):
+            in_segment = term_ids < segment.shape[1]
+            dots = segment[:, term_ids[in_segment]] @ query[in_segment]
+            scores.append(np.divide(dots, norms, out=np.zeros_like(dots), where=norms > 0))
+        scores = np.concatenate(scores)
+        return [(self.keys[i], float(scores[i])) for i in top_k(scores, k) if scores[i] > 0]
+
+
+class IncrementalIndex:
+    """Append-only TF-IDF index with lazily refreshed IDF."""
+
+    def __init__(self, refresh_ratio=0.1, refresh_interval=300, max_segments=16):
+        self.analyzer = TfidfVectorizer(stop_words='english').build_analyzer()
+        self.vocabulary = {}
+        self.df = np.zeros(0, dtype=np.int64)
+        # IDF is refreshed once this fraction of the corpus is new, or after refresh_interval seconds
+        self.refresh_ratio = refresh_ratio
+        self.refresh_interval = refresh_interval
+        self.max_segments = max_segments
+        self.added_since_refresh = 0
+        self.last_refresh = time.monotonic()
+        self._lock = threading.Lock()
+        self._keys = set()
+        self.snapshot = Snapshot(0, (), (), np.zeros(0), ())
+
+    def __len__(self):
+        return len(self.snapshot)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def _count_terms(self, text, grow):
+        counts = {}
+        for token in self.analyzer(text):
+            term = self.vocabulary.get(token)
+            if term is None:
+                if not grow:
+                    continue
+                term = self.vocabulary[token] = len(self.vocabulary)
+            counts[term] = counts.get(term, 0) + 1
+        return counts
+
+    def _idf(self, n_docs):
+        # Same smoothed IDF as TfidfVectorizer
+        return np.log((1 + n_docs) / (1 + self.df)) + 1
+
+    @staticmethod
+    def _norms(segment, idf):
+        weighted = segment.multiply(idf[:segment.shape[1]]).tocsr()
+        return np.sqrt(np.asarray(weighted.multiply(weighted).sum(axis=1)).ravel())
+
+    # Add documents as one new segment; they are searchable as soon as this
+    # returns. Keys already in the index are skipped.
+    def add_many(self, documents):
+        with self._lock:
+            documents = list({key: text for key, text in documents if key not in self._keys}.items())
+            if not documents:
+                return self.snapshot.version
+            self._keys.update(key for key, _ in documents)
+            old = self.snapshot
+            rows, cols, data = [], [], []
+            for row, (_, text) in enumerate(documents):
+                counts = self._count_terms(text, grow=True)
+                rows.extend([row] * len(counts))
+                cols.extend(counts.keys())
+                data.extend(counts.values())
+            n_terms = len(self.vocabulary)
+            self.df = np.concatenate([self.df, np.zeros(n_terms - len(self.df), dtype=np.int64)])
+            np.add.at(self.df, np.asarray(cols, dtype=np.int64), 1)
+            segment = sparse.csr_matrix((np.asarray(data, dtype=np.float64), (rows, cols)),
+                                        shape=(len(documents), n_terms))
+
+            # Existing terms keep their published IDF until the next refresh;
+            # terms first seen here get theirs now
+            n_docs = len(old) + len(documents)
+            idf = np.concatenate([old.idf, self._idf(n_docs)[len(old.idf):]])
+            keys = old.keys + tuple(key for key, _ in documents)
+            self.snapshot = Snapshot(old.version + 1, old.segments + (segment,), keys, idf,
+                                     old.norms + (self._norms(segment, idf),))
+            self.added_since_refresh += len(documents)
+            if self._refresh_due():
+                self._refresh()
+            return self.snapshot.version
+
+    def add(self, key, text):
+        return self.add_many([(key, text)])
+
+    def _refresh_due(self):
+        if len(self.snapshot.segments) > self.max_segments:
+            return True
+        if self.added_since_refresh > self.refresh_ratio * max(len(self.snapshot), 1):
+            return True
+        return time.monotonic() - self.last_refresh > self.refresh_interval and self.added_since_refresh > 0
+
+    # Recompute IDF and norms from the stored counts and merge small segments
+    def _refresh(self):
+        old = self.snapshot
+        n_terms = len(self.vocabulary)
+        segments = old.segments
+        if len(segments) > 1:
+            # Older segments were built with a smaller vocabulary; pad them with empty columns
+            widened = [s if s.shape[1] == n_terms else sparse.hstack([s, sparse.csr_matrix((s.shape[0], n_terms - s.shape[1]))])
+                       for s in segments]
+            segments = (sparse.vstack(widened).tocsr(),)
+        idf = self._idf(len(old))
+        self.snapshot = Snapshot(old.version + 1, segments, old.keys, idf,
+                                 tuple(self._norms(s, idf) for s in segments))
+        self.added_since_refresh = 0
+        self.last_refresh = time.monotonic()
+
+    # Refresh IDF now if it is due; call this from a scheduler or between requests
+    def maybe_refresh(self):
+        with self._lock:
+            if self._refresh_due():
+                self._refresh()
+        return self.snapshot.version
+
+    def refresh(self):
+        with self._lock:
+            self._refresh()
+        return self.snapshot.version
+
+    def search(self, text, k=5, snapshot=None):
+        if snapshot is None:
+            snapshot = self.snapshot
+        counts = self._count_terms(text, grow=False)
+        return snapshot.search_counts(list(counts.keys()), list(counts.values()), k)
+
+
+# Text of a community recipe as seen by the index
+def recipe_index_text(recipe):
+    return f"{recipe.get('title', '')} {recipe.get('ingredients', '')}".replace(',', ' ')
+
+
+class CommunityIndex:
+    """IncrementalIndex over the recipes base that follows new uploads."""
+
+    def __init__(self, base, interval=SYNC_INTERVAL, lookback=SYNC_LOOKBACK):
+        self.base = base
+        self.index = IncrementalIndex()
+        self.interval = interval
+        self.lookback = lookback
+        # key -> recipe and its parsed ingredient ids, for everything indexed
+        self.recipes = {}
+        self.ingredient_ids = {}
+        self.last_sync = None
+        self._sync_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.index)
+
+    # Index the recipes written since the last sync, at most once per
+    # interval unless forced; returns how many were added. The first sync
+    # reads the whole base. Searches keep using the current snapshot while a
+    # sync runs, and a caller that finds one running does not wait for it.
+    def sync(self, force=False):
+        if not force and self.last_sync is not None and time.monotonic() - self.last_sync < self.interval:
+            return 0
+        if not self._sync_lock.acquire(blocking=False):
+            return 0
+        try:
+            self.last_sync = time.monotonic()
+            if self.recipes:
+                new = self._poll()
+            else:
+                response = self.base.fetch()
+                new = list(response.items)
+                while response.last:
+                    response = self.base.fetch(last=response.last)
+                    new.extend(response.items)
+            for recipe in new:
+                self.recipes[recipe['key']] = recipe
+                self.ingredient_ids[recipe['key']] = ingredient_ids(recipe.get('ingredients'))
+            self.index.add_many((recipe['key'], recipe_index_text(recipe)) for recipe in new)
+            self.index.maybe_refresh()
+            return len(new)
+        finally:
+            self._sync_lock.release()
+
+    # Unseen recipes from the newest end of the base. Feed keys sort newest
+    # first, so paging stops at the first known one old enough that nothing
+    # written before it can still be in flight; legacy keys are skipped.
+    def _poll(self):
+        cutoff = time.time() - self.lookback
+        new = []
+        last = None
+        while True:
+            response = self.base.fetch(limit=SYNC_PAGE_SIZE, last=last)
+            for recipe in response.items:
+                key = recipe['key']
+                if not is_feed_key(key):
+                    continue
+                if key not in self.recipes:
+                    new.append(recipe)
+                elif key_time(key) < cutoff:
+                    return new
+            if not response.last:
+                return new
+            last = response.last
+
+    # Return [(recipe, score), ...] for the k community recipes most similar
+    # to the text, leaving out those the restriction strings exclude
+    def recommend(self, text, k=5, restrictions=()):
+        hits = self.index.search(text, CANDIDATES)
+        if not hits:
+            return []
+        excluded = ExclusionIndex.from_ids([self.ingredient_ids[key] for key, _ in hits]).mask(*restrictions)
+        return [(self.recipes[key], score) for (key, score), is_excluded in zip(hits, excluded)
+                if not is_excluded][:k]
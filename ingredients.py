@@ -0,0 +1,249 @@
+# ingredients.py
+#
+# Parser for free text ingredient lines: the comma strings of the catalog
+# and uploads, and LLM lines like "1 1/2 cups blueberries, rinsed". Each
+# line becomes a quantity, a unit and the id of its canonical name
+# ('blueberry'). Canonical names are interned once in an IngredientTable,
+# so consumers compare and index small integers instead of re-splitting
+# and re-normalising strings.
+#
+#   parse_ingredient('1/2 cup blueberries')  -> ParsedIngredient(0.5, 'cup', id of 'blueberry')
+#   parse_ingredients('tofu, 2 tbsp soy sauce')  -> [ParsedIngredient, ...]
+#   parse_batch(lines)  -> BatchResult of flat NumPy arrays for thousands of lines
+
+import re
+import threading
+from functools import lru_cache
+
+import numpy as np
+
+UNITS = {
+    'cup': ['cup', 'cups', 'c'],
+    'tbsp': ['tbsp', 'tbsps', 'tbs', 'tablespoon', 'tablespoons', 'T'],
+    'tsp': ['tsp', 'tsps', 'teaspoon', 'teaspoons', 't'],
+    'g': ['g', 'gram', 'grams', 'gr'],
+    'kg': ['kg', 'kgs', 'kilogram', 'kilograms'],
+    'ml': ['ml', 'milliliter', 'milliliters', 'millilitre', 'millilitres'],
+    'l': ['l', 'liter', 'liters', 'litre', 'litres'],
+    'oz': ['oz', 'ounce', 'ounces'],
+    'lb': ['lb', 'lbs', 'pound', 'pounds'],
+    'can': ['can', 'cans', 'tin', 'tins'],
+    'clove': ['clove', 'cloves'],
+    'pinch': ['pinch', 'pinches'],
+    'dash': ['dash', 'dashes'],
+    'slice': ['slice', 'slices'],
+    'handful': ['handful', 'handfuls'],
+    'bunch': ['bunch', 'bunches'],
+    'package': ['package', 'packages', 'pack', 'packs', 'packet', 'packets'],
+    'piece': ['piece', 'pieces'],
+    'sprig': ['sprig', 'sprigs'],
+    'stalk': ['stalk', 'stalks'],
+    'head': ['head', 'heads'],
+}
+# Case matters only for the one letter spoon abbreviations ('T' vs 't')
+_UNIT_ALIASES = {alias if len(alias) == 1 else alias.lower(): unit
+                 for unit, aliases in UNITS.items() for alias in aliases}
+
+# Words describing preparation or size rather than the ingredient itself
+DESCRIPTORS = frozenset('''
+chopped diced minced sliced grated shredded crushed mashed peeled drained rinsed cooked uncooked
+fresh freshly frozen dried ripe large small medium finely roughly thinly coarsely optional
+to taste divided softened melted boiled steamed toasted raw whole halved quartered cubed
+about approximately heaping level packed of plus more for serving garnish
+'''.split())
+
+# Names that mean the same ingredient
+ALIASES = {
+    'garbanzo bean': 'chickpea',
+    'chick pea': 'chickpea',
+    'aubergine': 'eggplant',
+    'courgette': 'zucchini',
+    'coriander leaf': 'cilantro',
+    'scallion': 'green onion',
+    'spring onion': 'green onion',
+    'capsicum': 'bell pepper',
+    'soya sauce': 'soy sauce',
+}
+
+# Words the plural rules below would damage
+_INVARIANT = frozenset(['molasses', 'hummus', 'couscous', 'asparagus', 'swiss', 'lemongrass', 'citrus'])
+
+_FRACTIONS = {'½': 0.5, '⅓': 1 / 3, '⅔': 2 / 3, '¼': 0.25, '¾': 0.75, '⅕': 0.2, '⅛': 0.125}
+_NUMBER = r'(?:\d+\s+\d+/\d+|\d+/\d+|\d+\s*[½⅓⅔¼¾⅕⅛]|\d+(?:\.\d+)?|[½⅓⅔¼¾⅕⅛])'
+_QUANTITY = re.compile(rf'^\s*({_NUMBER})(?:\s*(?:-|to)\s*({_NUMBER}))?\s*')
+_UNIT = re.compile(r'^([A-Za-z]+)\.?\s+')
+_PARENS = re.compile(r'\([^)]*\)')
+_WORD = re.compile(r'[a-z]+')
+_SPLIT = re.compile(r'[,;\n]')
+
+
+def singular(word):
+    if word in _INVARIANT or word.endswith(('ss', 'us', 'is')) or len(word) <= 3:
+        return word
+    if word.endswith('ies'):
+        return word[:-3] + 'y'
+    if word.endswith(('oes', 'shes', 'ches', 'xes', 'sses')):
+        return word[:-2]
+    if word.endswith('s'):
+        return word[:-1]
+    return word
+
+
+def _number(text):
+    text = text.strip()
+    if text[-1] in _FRACTIONS:
+        whole = text[:-1].strip()
+        return (float(whole) if whole else 0.0) + _FRACTIONS[text[-1]]
+    total = 0.0
+    for part in text.split():
+        if '/' in part:
+            numerator, denominator = part.split('/')
+            total += float(numerator) / float(denominator) if float(denominator) else 0.0
+        else:
+            total += float(part)
+    return total
+
+
+# 'Ripe Tomatoes (about 2)' -> 'tomato'
+def canonical_name(text):
+    words = [singular(w) for w in _WORD.findall(_PARENS.sub(' ', text.lower())) if w not in DESCRIPTORS]
+    name = ' '.join(words)
+    return ALIASES.get(name, name)
+
+
+class IngredientTable:
+    """Interned canonical ingredient names; ids are dense and never change."""
+
+    def __init__(self):
+        self.names = []
+        self.ids = {}
+        self._words = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.names)
+
+    def intern(self, name):
+        ingredient_id = self.ids.get(name)
+        if ingredient_id is None:
+            with self._lock:
+                ingredient_id = self.ids.get(name)
+                if ingredient_id is None:
+                    ingredient_id = len(self.names)
+                    self.names.append(name)
+                    self._words.append(frozenset(name.split()))
+                    self.ids[name] = ingredient_id
+        return ingredient_id
+
+    def name(self, ingredient_id):
+        return self.names[ingredient_id]
+
+    def words(self, ingredient_id):
+        return self._words[ingredient_id]
+
+    # Id of an already interned name, or None
+    def lookup(self, name):
+        return self.ids.get(canonical_name(name))
+
+
+# Shared by every consumer in the process, so ids agree between them
+TABLE = IngredientTable()
+
+
+class ParsedIngredient:
+    __slots__ = ('quantity', 'unit', 'ingredient_id', 'text')
+
+    def __init__(self, quantity, unit, ingredient_id, text):
+        self.quantity = quantity
+        self.unit = unit
+        self.ingredient_id = ingredient_id
+        self.text = text
+
+    @property
+    def name(self):
+        return TABLE.name(self.ingredient_id)
+
+    def __repr__(self):
+        return f'ParsedIngredient({self.quantity!r}, {self.unit!r}, {self.name!r})'
+
+    def __eq__(self, other):
+        return (isinstance(other, ParsedIngredient) and self.quantity == other.quantity
+                and self.unit == other.unit and self.ingredient_id == other.ingredient_id)
+
+    def __hash__(self):
+        return hash((self.quantity, self.unit, self.ingredient_id))
+
+
+# Lines repeat a lot across recipes and reruns, so parses are memoized
+@lru_cache(maxsize=65536)
+def parse_ingredient(line):
+    rest = line.strip().lstrip('-*•').strip()
+    quantity = unit = None
+    match = _QUANTITY.match(rest)
+    if match:
+        low = _number(match.group(1))
+        quantity = (low + _number(match.group(2))) / 2 if match.group(2) else low
+        rest = rest[match.end():]
+    match = _UNIT.match(rest)
+    if match:
+        word = match.group(1)
+        unit = _UNIT_ALIASES.get(word if len(word) == 1 else word.lower())
+        # A lone 'c' or 't' only counts as a unit right after a quantity
+        if unit is not None and (quantity is not None or len(word) > 1):
+            rest = rest[match.end():]
+        else:
+            unit = None
+    return ParsedIngredient(quantity, unit, TABLE.intern(canonical_name(rest)), line)
+
+
+# Comma, semicolon or newline separated text (or a list of lines). Pieces
+# that only describe the previous ingredient ('drained') are dropped.
+def parse_ingredients(value):
+    parts = value if isinstance(value, (list, tuple)) else _SPLIT.split(str(value or ''))
+    parsed = []
+    for part in parts:
+        if not str(part).strip():
+            continue
+        ingredient = parse_ingredient(str(part))
+        if ingredient.name:
+            parsed.append(ingredient)
+    return parsed
+
+
+def ingredient_ids(value):
+    return [i.ingredient_id for i in parse_ingredients(value)]
+
+
+class BatchResult:
+    """Parsed ingredients of many texts as flat arrays; text i owns [indptr[i]:indptr[i+1]]."""
+
+    def __init__(self, indptr, ids, quantities, units):
+        self.indptr = indptr
+        self.ids = ids
+        # NaN where a line has no quantity
+        self.quantities = quantities
+        # Index into UNIT_NAMES, -1 where a line has no unit
+        self.units = units
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def ids_of(self, i):
+        return self.ids[self.indptr[i]:self.indptr[i + 1]]
+
+
+UNIT_NAMES = list(UNITS)
+_UNIT_INDEX = {unit: i for i, unit in enumerate(UNIT_NAMES)}
+
+
+def parse_batch(texts):
+    indptr = [0]
+    ids, quantities, units = [], [], []
+    for text in texts:
+        for ingredient in parse_ingredients(text):
+            ids.append(ingredient.ingredient_id)
+            quantities.append(float('nan') if ingredient.quantity is None else ingredient.quantity)
+            units.append(_UNIT_INDEX.get(ingredient.unit, -1))
+        indptr.append(len(ids))
+    return BatchResult(np.asarray(indptr, dtype=np.int64), np.asarray(ids, dtype=np.int32),
+                       np.asarray(quantities, dtype=np.float64), np.asarray(units, dtype=np.int8))
@@ -0,0 +1,124 @@
+# local_first.py
+#
+# Retrieval-first answers for the recipe generator. Before anything is sent
+# to OpenAI, community recipes are scored against the form: the share of
+# each recipe's ingredients the user has available (its coverage), the
+# restrictions, which exclude a recipe outright, and the cooking time
+# limit, which excludes recipes known to take longer and ranks those whose
+# time is unknown after the rest. Recipes that clear the coverage threshold
+# are served straight away and the LLM is only asked for the slots they
+# leave empty.
+
+import logging
+import os
+import threading
+
+from exclusions import ExclusionIndex
+from ingredients import TABLE, ingredient_ids, parse_ingredients
+
+logger = logging.getLogger(__name__)
+
+COVERAGE_THRESHOLD = float(os.getenv('LOCAL_COVERAGE_THRESHOLD', '0.8'))
+# Candidates taken from the search index before coverage is checked
+CANDIDATES = int(os.getenv('LOCAL_CANDIDATES', '50'))
+
+# Assumed to be in every kitchen; they neither help nor hurt coverage
+PANTRY_STAPLES = frozenset(['salt', 'pepper', 'black pepper', 'water', 'oil', 'olive oil', 'vegetable oil'])
+
+
+# Share of the recipe's non-staple ingredient ids that are available. An
+# ingredient is also available when the words of an available one all occur
+# in its name, so 'coconut' covers 'coconut milk'.
+def coverage(recipe_ids, available_ids):
+    available_ids = set(available_ids)
+    available_words = [TABLE.words(i) for i in available_ids]
+    needed = [i for i in set(recipe_ids) if TABLE.name(i) not in PANTRY_STAPLES]
+    if not needed:
+        return 0.0
+    have = sum(1 for i in needed
+               if i in available_ids or any(words <= TABLE.words(i) for words in available_words))
+    return have / len(needed)
+
+
+# Community recipe in the shape display_recipe and the LLM responses use;
+# minutes is the time the search index read from the recipe
+def as_response(recipe, minutes=None):
+    cooking_time = recipe.get('cooking_time') or (f'{minutes:g} minutes' if minutes else 'Not given')
+    return {
+        'name': recipe.get('title') or recipe.get('name', ''),
+        'ingredients': [i.text.strip() for i in parse_ingredients(recipe.get('ingredients'))],
+        'instructions': recipe.get('recipe') or recipe.get('instructions', ''),
+        'cooking_time': cooking_time,
+        'servings': recipe.get('servings') or 'Not given',
+        'shared_by': recipe.get('username'),
+        'key': recipe.get('key'),
+    }
+
+
+class LocalFirst:
+    """Matches stored recipes to a request and counts how often they suffice."""
+
+    def __init__(self, search_index, threshold=COVERAGE_THRESHOLD, candidates=CANDIDATES):
+        # search_index is a search_index.RecipeSearchIndex over the community recipes
+        self.search_index = search_index
+        self.threshold = threshold
+        self.candidates = candidates
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.answered_locally = 0
+        self.partially_local = 0
+        self.llm_requests = 0
+        self.local_recipes = 0
+        self.generated_recipes = 0
+
+    # Up to k response-shaped recipes, best coverage first
+    def match(self, available_ingredients, restrictions='', max_minutes=None, k=2):
+        available = [i for i in ingredient_ids(available_ingredients) if TABLE.name(i) not in PANTRY_STAPLES]
+        if not available or k <= 0:
+            return []
+        # Prefix terms so 'tomato' also retrieves 'tomato sauce' and 'tomatoes'
+        words = sorted({w for i in available for w in TABLE.words(i)})
+        hits = self.search_index.search(' '.join(w + '*' for w in words), self.candidates)
+        keys = [key for key, _ in hits if self.search_index.get(key) is not None]
+        if not keys:
+            return []
+        recipe_ids = [self.search_index.ingredient_ids(key) for key in keys]
+        excluded = ExclusionIndex.from_ids(recipe_ids).mask(restrictions)
+        scored = []
+        for rank, (key, ids, is_excluded) in enumerate(zip(keys, recipe_ids, excluded)):
+            if is_excluded:
+                continue
+            # Read from cooking_time or the steps when the recipe was indexed
+            minutes = self.search_index.recipe_minutes(key)
+            if max_minutes and minutes is not None and minutes > max_minutes:
+                continue
+            score = coverage(ids, available)
+            if score >= self.threshold:
+                # Under a time limit, recipes that do not say how long they
+                # take come after those known to fit; search rank breaks ties
+                unknown = bool(max_minutes) and minutes is None
+                scored.append((unknown, -score, rank, key, minutes))
+        scored.sort(key=lambda s: s[:3])
+        return [as_response(self.search_index.get(key), minutes) for _, _, _, key, minutes in scored[:k]]
+
+    # Record how one request was answered: local recipes served and recipes generated
+    def record(self, local, generated):
+        with self._lock:
+            self.requests += 1
+            self.local_recipes += local
+            self.generated_recipes += generated
+            if local and not generated:
+                self.answered_locally += 1
+            else:
+                self.llm_requests += 1
+                if local:
+                    self.partially_local += 1
+        logger.info('Recipe request answered with %d local and %d generated recipes', local, generated)
+
+    def stats(self):
+        requests = self.requests or 1
+        return {'requests': self.requests, 'answered_locally': self.answered_locally,
+                'partially_local': self.partially_local, 'llm_requests': self.llm_requests,
+                'local_answer_rate': self.answered_locally / requests,
+                'local_recipes': self.local_recipes, 'generated_recipes': self.generated_recipes,
+                'threshold': self.threshold}
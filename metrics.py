@@ -0,0 +1,354 @@
+# metrics.py
+#
+# In-process metrics for the hot paths: counters, latency histograms with
+# fixed buckets, and collectors that report the stats() of long lived
+# objects (the OpenAI service, HTTP pools, the response cache) as gauges.
+# Everything lives in one process wide registry that renders the Prometheus
+# text format, so it can be scraped or written to a file:
+#
+#   METRICS_PORT       serve http://0.0.0.0:<port>/metrics from a thread
+#   METRICS_PATH       rewrite this file every METRICS_INTERVAL seconds
+#                      (node_exporter textfile collector format)
+#   LOG_SAMPLE_RATE    share of sampled structured log events written
+#   LOG_LEVEL          level of the app's own loggers (INFO), which
+#                      configure_logging sends to stderr
+#
+#   with metrics.timed('stage_seconds', stage='render'):
+#       display_recipe(recipe)
+#   metrics.inc('openai_tokens_total', 212, kind='prompt')
+
+import bisect
+import contextlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+
+import resources
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'nutriveg'
+# Seconds; wide enough for a sub-millisecond search and a minute long OpenAI call
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                   2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRICS_PORT = os.getenv('METRICS_PORT')
+METRICS_PATH = os.getenv('METRICS_PATH')
+METRICS_INTERVAL = float(os.getenv('METRICS_INTERVAL', '15'))
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '0.1'))
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+# Loggers of the app's modules; Streamlit leaves the root logger without
+# handlers at WARNING, so their INFO lines need a handler of their own
+APP_LOGGERS = ('metrics', 'local_first', 'generation_service', 'write_behind', 'events', 'recipe_pool',
+               'recipe_parser', 'resources')
+
+HELP = {
+    'stage_seconds': 'Time spent in each stage of a request',
+    'stage_errors_total': 'Stages that raised',
+    'db_seconds': 'Storage calls by backend, base and operation',
+    'db_errors_total': 'Storage calls that raised',
+    'openai_seconds': 'OpenAI calls, one per attempt',
+    'openai_wait_seconds': 'Time queued on the request and token buckets',
+    'openai_first_recipe_seconds': 'Time from sending a streamed request to its first complete recipe',
+    'openai_retries_total': 'OpenAI attempts retried, by error',
+    'openai_errors_total': 'OpenAI attempts that raised',
+    'openai_tokens_total': 'Tokens used, from completion.usage when reported',
+    'openai_cost_usd_total': 'Estimated OpenAI spend',
+    'llm_parse_total': 'LLM answers by parse outcome: ok, repaired, partial or failed',
+    'recipes_invalid_total': 'Streamed recipes dropped by schema validation',
+    'random_pool_pops_total': 'Try Something New requests served from the pool (hit) or not (miss)',
+    'single_flight_total': 'Keyed generation calls that started (leader) or joined (follower) an upstream call',
+}
+
+_NAME = re.compile(r'[^a-zA-Z0-9_]')
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram."""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        # counts[i] observations <= buckets[i]; the last one is +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    # Estimated quantile, interpolated inside the bucket it falls in
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+
+def _labels(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+# Nested stats dict -> flat {metric_name: number}, skipping anything not numeric
+def _flatten(prefix, value, out):
+    if isinstance(value, bool):
+        out[prefix] = int(value)
+    elif isinstance(value, (int, float)):
+        out[prefix] = value
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            _flatten(f'{prefix}_{_NAME.sub("_", str(key))}', item, out)
+    return out
+
+
+class MetricsRegistry:
+    """Counters, histograms and gauge collectors shared by every session."""
+
+    def __init__(self, prefix=PREFIX):
+        self.prefix = prefix
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, buckets=DEFAULT_BUCKETS, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    # Time the block (or decorated function) into the histogram `name`; a
+    # block that raises is still timed and also counted in <name>_errors_total
+    @contextlib.contextmanager
+    def timed(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.inc(name.removesuffix('_seconds') + '_errors_total', **labels)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    # fn() returns a (possibly nested) dict of numbers, reported as gauges
+    # named <prefix>_<name>_<key>; registering a name again replaces it
+    def add_collector(self, name, fn):
+        with self._lock:
+            self._collectors[name] = fn
+
+    def gauges(self):
+        with self._lock:
+            collectors = list(self._collectors.items())
+        out = {}
+        for name, fn in collectors:
+            try:
+                _flatten(_NAME.sub('_', name), fn(), out)
+            except Exception:
+                logger.exception('Metrics collector %s failed', name)
+        return out
+
+    # Plain dict view for the admin panel: counters, latency percentiles in
+    # milliseconds and gauges
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (h.count, h.sum, h.quantile(0.5), h.quantile(0.95), h.quantile(0.99))
+                          for key, h in self._histograms.items()}
+        latencies = []
+        for (name, labels), (count, total, p50, p95, p99) in sorted(histograms.items()):
+            latencies.append({'metric': name, **dict(labels), 'count': count,
+                              'mean_ms': round(total / count * 1000, 2) if count else None,
+                              'p50_ms': round(p50 * 1000, 2), 'p95_ms': round(p95 * 1000, 2),
+                              'p99_ms': round(p99 * 1000, 2)})
+        return {'latencies': latencies,
+                'counters': [{'metric': name, **dict(labels), 'value': value}
+                             for (name, labels), value in sorted(counters.items())],
+                'gauges': self.gauges()}
+
+    # Prometheus text exposition format
+    def render(self):
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (list(h.counts), h.sum, h.count, h.buckets))
+                                for key, h in self._histograms.items())
+        lines = []
+        described = set()
+
+        def describe(name, kind):
+            if name in described:
+                return
+            described.add(name)
+            if name in HELP:
+                lines.append(f'# HELP {self.prefix}_{name} {HELP[name]}')
+            lines.append(f'# TYPE {self.prefix}_{name} {kind}')
+
+        for (name, labels), value in counters:
+            describe(name, 'counter')
+            lines.append(f'{self.prefix}_{name}{_format_labels(labels)} {value}')
+        for (name, labels), (counts, total, count, buckets) in histograms:
+            describe(name, 'histogram')
+            cumulative = 0
+            for bound, n in zip(list(buckets) + ['+Inf'], counts):
+                cumulative += n
+                lines.append(f'{self.prefix}_{name}_bucket{_format_labels(labels, [("le", str(bound))])} '
+                             f'{cumulative}')
+            lines.append(f'{self.prefix}_{name}_sum{_format_labels(labels)} {total}')
+            lines.append(f'{self.prefix}_{name}_count{_format_labels(labels)} {count}')
+        for name, value in sorted(self.gauges().items()):
+            lines.append(f'# TYPE {self.prefix}_{name} gauge')
+            lines.append(f'{self.prefix}_{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+registry = MetricsRegistry()
+# Pools and the OpenAI service stats of the resource registry
+registry.add_collector('resources', resources.stats)
+
+
+def inc(name, amount=1, **labels):
+    registry.inc(name, amount, **labels)
+
+
+def observe(name, value, **labels):
+    registry.observe(name, value, **labels)
+
+
+def timed(name, **labels):
+    return registry.timed(name, **labels)
+
+
+def add_collector(name, fn):
+    registry.add_collector(name, fn)
+
+
+def snapshot():
+    return registry.snapshot()
+
+
+def render():
+    return registry.render()
+
+
+# Write the metrics to path atomically, so a scraper never reads half a file
+def write_file(path):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        f.write(render())
+    os.replace(tmp, path)
+
+
+# One structured JSON log line for a share of the events; rate=1 logs all
+def log_sampled(event, rate=None, **fields):
+    if random.random() >= (LOG_SAMPLE_RATE if rate is None else rate):
+        return
+    logger.info(json.dumps({'event': event, 'time': time.time(), **fields}, default=str))
+
+
+class _Exporter:
+    """The /metrics HTTP server and the file writer, whichever are configured."""
+
+    def __init__(self, port=None, path=None, interval=METRICS_INTERVAL):
+        self.httpd = None
+        self.path = path
+        self._stop = threading.Event()
+        if port:
+            from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split('?')[0] != '/metrics':
+                        self.send_error(404)
+                        return
+                    body = render().encode('utf-8')
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    pass
+
+            self.httpd = ThreadingHTTPServer(('0.0.0.0', int(port)), Handler)
+            self.httpd.daemon_threads = True
+            threading.Thread(target=self.httpd.serve_forever, name='metrics-http', daemon=True).start()
+        if path:
+            threading.Thread(target=self._write_loop, args=(interval,), name='metrics-file', daemon=True).start()
+
+    def _write_loop(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                write_file(self.path)
+            except OSError:
+                logger.exception('Writing metrics to %s failed', self.path)
+
+    def close(self):
+        self._stop.set()
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+        if self.path:
+            try:
+                write_file(self.path)
+            except OSError:
+                pass
+
+
+# Start the configured exporters once per process; a no-op when neither
+# METRICS_PORT nor METRICS_PATH is set
+def start_exporters(port=METRICS_PORT, path=METRICS_PATH):
+    if not port and not path:
+        return None
+    return resources.get('metrics-exporter', lambda: _Exporter(port, path), close=lambda e: e.close())
+
+
+# Send the app loggers' records to stderr at LOG_LEVEL, once per process;
+# they stop propagating so a configured root logger does not print them twice
+def configure_logging(level=LOG_LEVEL):
+    def configure():
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+        for name in APP_LOGGERS:
+            app_logger = logging.getLogger(name)
+            app_logger.setLevel(level)
+            app_logger.addHandler(handler)
+            app_logger.propagate = False
+        return handler
+    return resources.get('app-logging', configure)
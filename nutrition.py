@@ -0,0 +1,163 @@
+# nutrition.py
+#
+# Macros for recipes from the local nutrient table in data/nutrients.csv.
+# The table is loaded once into NumPy arrays (one row per food, nutrients
+# per 100 g), and parsed ingredient ids are resolved to table rows once per
+# id. A batch of recipes is then one pass of array operations: every
+# ingredient line is converted to grams, multiplied by its food's row and
+# summed per recipe, so a whole feed page or LLM response costs a few
+# hundred microseconds.
+#
+#   annotate([{'ingredients': ['1 cup oats', '1 banana'], 'servings': 2}])
+#   -> [{'recipe': {'kcal': 496.9, ...}, 'per_serving': {...}, 'matched': 1.0}]
+
+import csv
+import os
+import re
+from functools import lru_cache
+
+import numpy as np
+
+from ingredients import TABLE, UNIT_NAMES, canonical_name, parse_batch
+
+NUTRIENTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'nutrients.csv')
+
+NUTRIENTS = ('kcal', 'protein_g', 'carbs_g', 'fat_g', 'fiber_g')
+
+# Millilitres in one volume unit
+UNIT_ML = {'cup': 240.0, 'tbsp': 15.0, 'tsp': 5.0, 'ml': 1.0, 'l': 1000.0}
+# Grams in one unit that is a weight, or a typical amount for units that
+# weigh about the same whatever the food
+UNIT_GRAMS = {'g': 1.0, 'kg': 1000.0, 'oz': 28.35, 'lb': 453.6, 'can': 400.0, 'clove': 5.0,
+              'pinch': 0.4, 'dash': 0.6, 'handful': 30.0, 'bunch': 100.0,
+              'package': 400.0, 'sprig': 1.0}
+# Count units weigh one of the food's items (its unit_g), as does any unit
+# in neither table
+COUNT_UNITS = ('piece', 'slice', 'stalk', 'head')
+
+_SERVINGS = re.compile(r'\d+(?:\.\d+)?')
+
+
+def parse_servings(value):
+    if isinstance(value, (int, float)) and value > 0:
+        return float(value)
+    match = _SERVINGS.search(str(value or ''))
+    return float(match.group()) if match and float(match.group()) > 0 else float('nan')
+
+
+class NutrientTable:
+    """Per 100 g nutrients of the foods in the table, as NumPy arrays."""
+
+    def __init__(self, names, values, density, unit_grams):
+        self.names = names
+        # (n_foods, len(NUTRIENTS)) per 100 g
+        self.values = values
+        self.density = density
+        self.unit_grams = unit_grams
+        self.rows = {}
+        for row, name in enumerate(names):
+            self.rows.setdefault(canonical_name(name), row)
+        # Foods by number of words, longest first, for partial name matches
+        self._by_words = sorted(((frozenset(name.split()), row) for name, row in self.rows.items()),
+                                key=lambda item: -len(item[0]))
+        self.resolve = lru_cache(maxsize=None)(self._resolve)
+        # Grams or millilitres per unit of each ingredients.UNIT_NAMES entry;
+        # NaN where the unit is not of that kind
+        self._unit_grams = np.array([UNIT_GRAMS.get(u, np.nan) for u in UNIT_NAMES], dtype=np.float64)
+        self._unit_ml = np.array([UNIT_ML.get(u, np.nan) for u in UNIT_NAMES], dtype=np.float64)
+
+    @classmethod
+    def load(cls, path=NUTRIENTS_PATH):
+        names, rows = [], []
+        with open(path, newline='') as f:
+            reader = csv.DictReader(line for line in f if not line.startswith('#'))
+            for record in reader:
+                names.append(record['name'])
+                rows.append([float(record[column]) for column in NUTRIENTS + ('density_g_per_ml', 'unit_g')])
+        data = np.asarray(rows, dtype=np.float64).reshape(-1, len(NUTRIENTS) + 2)
+        return cls(names, data[:, :len(NUTRIENTS)].copy(), data[:, -2].copy(), data[:, -1].copy())
+
+    def __len__(self):
+        return len(self.names)
+
+    # Table row of an ingredient id, or -1. An exact canonical name wins,
+    # then the food with the most words that all occur in the name
+    # ('brown rice' before 'rice' for 'cooked brown rice').
+    def _resolve(self, ingredient_id):
+        name = TABLE.name(ingredient_id)
+        row = self.rows.get(name)
+        if row is not None:
+            return row
+        words = TABLE.words(ingredient_id)
+        for food_words, row in self._by_words:
+            if food_words <= words:
+                return row
+        return -1
+
+    def resolve_many(self, ingredient_ids):
+        return np.fromiter((self.resolve(int(i)) for i in ingredient_ids), dtype=np.int64,
+                           count=len(ingredient_ids))
+
+    # Grams of every parsed line: weight units convert directly, volume units
+    # through the food's density, and count units, unknown units and lines
+    # without a unit count as one of the food's items. Lines without a
+    # quantity count as one; anything still not a number counts as 0 g so
+    # one odd line cannot blank out the recipe's totals.
+    def grams(self, rows, quantities, units):
+        quantities = np.where(np.isnan(quantities), 1.0, quantities)
+        known = rows >= 0
+        safe_rows = np.where(known, rows, 0)
+        safe_units = np.where(units >= 0, units, 0)
+        weight = np.where(units >= 0, self._unit_grams[safe_units], np.nan)
+        volume = np.where(units >= 0, self._unit_ml[safe_units], np.nan) * self.density[safe_rows]
+        per_unit = np.where(np.isnan(weight), np.where(np.isnan(volume), self.unit_grams[safe_rows], volume),
+                            weight)
+        return np.nan_to_num(np.where(known, quantities * per_unit, 0.0), nan=0.0, posinf=0.0, neginf=0.0)
+
+    # Nutrient totals of each recipe: (n_recipes, len(NUTRIENTS)), plus the
+    # share of each recipe's lines that matched a food
+    def compute(self, batch):
+        rows = self.resolve_many(batch.ids)
+        grams = self.grams(rows, batch.quantities, batch.units)
+        per_line = np.nan_to_num(self.values[np.where(rows >= 0, rows, 0)] * (grams / 100.0)[:, None])
+        lines = np.diff(batch.indptr)
+        recipe_of_line = np.repeat(np.arange(len(batch)), lines)
+        totals = np.zeros((len(batch), len(NUTRIENTS)), dtype=np.float64)
+        np.add.at(totals, recipe_of_line, per_line)
+        matched = np.bincount(recipe_of_line, weights=(rows >= 0), minlength=len(batch))
+        return totals, np.divide(matched, lines, out=np.zeros(len(batch)), where=lines > 0)
+
+
+@lru_cache(maxsize=1)
+def get_table(path=NUTRIENTS_PATH):
+    return NutrientTable.load(path)
+
+
+def _as_dict(values):
+    return {name: round(float(v), 1) for name, v in zip(NUTRIENTS, values)}
+
+
+# Nutrition of a batch of recipe dicts (LLM responses or community recipes),
+# in one vectorized pass. per_serving is None when servings are unknown.
+def annotate(recipes, table=None):
+    table = table or get_table()
+    recipes = list(recipes)
+    if not recipes:
+        return []
+    totals, matched = table.compute(parse_batch([r.get('ingredients') for r in recipes]))
+    servings = np.array([parse_servings(r.get('servings')) for r in recipes])
+    per_serving = totals / servings[:, None]
+    return [{'recipe': _as_dict(totals[i]),
+             'per_serving': None if np.isnan(servings[i]) else _as_dict(per_serving[i]),
+             'matched': round(float(matched[i]), 2)}
+            for i in range(len(recipes))]
+
+
+# 'Per serving: 412 kcal · 18 g protein · 52 g carbs · 14 g fat · 9 g fiber'
+def summary(nutrition):
+    if nutrition is None or not nutrition['matched']:
+        return None
+    label, values = ('Per serving', nutrition['per_serving']) if nutrition['per_serving'] else \
+        ('Whole recipe', nutrition['recipe'])
+    return (f"{label}: {values['kcal']:.0f} kcal · {values['protein_g']:.0f} g protein · "
+            f"{values['carbs_g']:.0f} g carbs · {values['fat_g']:.0f} g fat · {values['fiber_g']:.0f} g fiber")
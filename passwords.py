@@ -0,0 +1,150 @@
+# passwords.py
+#
+# bcrypt hashing and verification in a bounded process pool, so login
+# bursts use worker processes instead of the Streamlit script threads.
+# The work factor is configurable with BCRYPT_ROUNDS; hashes made with a
+# lower cost are upgraded on the next successful login. Repeated failures
+# for one username are throttled before they reach the pool. Workers are
+# spawned, not forked, because the Streamlit server is multi-threaded.
+
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))
+POOL_SIZE = int(os.getenv('BCRYPT_WORKERS', str(max(1, (os.cpu_count() or 2) // 2))))
+# Failed attempts allowed per username inside the window before logins are refused
+MAX_FAILURES = int(os.getenv('LOGIN_MAX_FAILURES', '5'))
+FAILURE_WINDOW = float(os.getenv('LOGIN_FAILURE_WINDOW', '300'))
+# Usernames with recent failures that are tracked; the least recently failed go first
+MAX_TRACKED = int(os.getenv('LOGIN_MAX_TRACKED', '10000'))
+
+_pool = None
+_pool_lock = threading.Lock()
+# Bounds queued work so a flood cannot pile up unbounded futures
+_slots = threading.BoundedSemaphore(POOL_SIZE * 4)
+
+
+class TooManyAttempts(Exception):
+    """Raised when a username has failed to log in too often recently."""
+
+    def __init__(self, retry_after):
+        super().__init__(f'Too many failed logins, try again in {int(retry_after) + 1} seconds')
+        self.retry_after = retry_after
+
+
+# bcrypt is only imported in the worker processes
+def _hash(password, rounds):
+    import bcrypt
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check(password, hashed):
+    import bcrypt
+    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=POOL_SIZE, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def _submit(fn, *args):
+    with _slots:
+        return _get_pool().submit(fn, *args).result()
+
+
+def hash_password(password, rounds=None):
+    return _submit(_hash, password, rounds or BCRYPT_ROUNDS)
+
+
+def check_password(password, hashed):
+    return _submit(_check, password, hashed)
+
+
+# Cost factor of a '$2b$12$...' hash
+def hash_rounds(hashed):
+    try:
+        return int(hashed.split('$')[2])
+    except (IndexError, ValueError):
+        return 0
+
+
+def needs_rehash(hashed, rounds=None):
+    return hash_rounds(hashed) < (rounds or BCRYPT_ROUNDS)
+
+
+class LoginThrottle:
+    """Sliding window count of failed logins per username."""
+
+    def __init__(self, max_failures=MAX_FAILURES, window=FAILURE_WINDOW, max_tracked=MAX_TRACKED):
+        self.max_failures = max_failures
+        self.window = window
+        self.max_tracked = max_tracked
+        # Ordered from least to most recently failed
+        self._failures = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def __len__(self):
+        return len(self._failures)
+
+    def _recent(self, username, now):
+        failures = self._failures.get(username)
+        if failures is None:
+            return None
+        while failures and failures[0] <= now - self.window:
+            failures.popleft()
+        if not failures:
+            del self._failures[username]
+            return None
+        return failures
+
+    # Raise TooManyAttempts if the username is currently locked out
+    def check(self, username):
+        now = time.monotonic()
+        with self._lock:
+            failures = self._recent(username, now)
+            if failures and len(failures) >= self.max_failures:
+                raise TooManyAttempts(failures[0] + self.window - now)
+
+    def failed(self, username):
+        now = time.monotonic()
+        with self._lock:
+            failures = self._recent(username, now)
+            if failures is None:
+                failures = deque()
+            else:
+                del self._failures[username]
+            self._failures[username] = failures
+            failures.append(now)
+            self._sweep(now)
+
+    # Forget usernames whose failures are all older than the window, once
+    # per window, and the least recently failed beyond max_tracked, so a
+    # flood of distinct usernames cannot grow the table without bound
+    def _sweep(self, now):
+        if now - self._last_sweep >= self.window:
+            self._last_sweep = now
+            for username in list(self._failures):
+                self._recent(username, now)
+        while len(self._failures) > self.max_tracked:
+            del self._failures[next(iter(self._failures))]
+
+    def succeeded(self, username):
+        with self._lock:
+            self._failures.pop(username, None)
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
@@ -0,0 +1,241 @@
+# prompts.py
+#
+# Builds the system and user prompts for recipe generation from the form
+# fields and measures their size locally, so prompt variants can be
+# compared by token count and cost before they are sent.
+#
+#   python prompts.py    # token and cost report for every variant
+
+import sys
+from functools import lru_cache
+
+MODEL = 'gpt-3.5-turbo'
+
+# USD per 1K tokens (input, output)
+PRICES = {
+    'gpt-3.5-turbo': (0.0010, 0.0020),
+    'gpt-4': (0.03, 0.06),
+}
+
+# Original prompt with its three recipe few-shot example
+FULL_SYSTEM_PROMPT = """
+Provide personalized vegan recipes(atleast two) based on:
+1. dietary preferences
+2. dietary restrictions
+3. Available ingredients.
+4. Cooking time(in minutes)
+5. Cooking Equipments Available
+6. Type of meal
+7. Number of servings
+8. Cuisine type
+
+Number of ingredients outside of the available ingredients shouldn't be more. Try to stay within the limit of available ingedients. 
+Cooking time should be within the limit mentioned with available ingredients. Lesser the cooking time, the better.
+Should take the available cooking equipments into consideration.
+Food should not contain ingredients that does not align with dietary restrictions.
+Ensure to include the following elements in the recipe suggestions:
+1. Recipe Name
+2. Ingredients
+3. Instructions
+4. Cooking Time(in minutes)
+
+Response should be in the following JSON Format
+
+{
+"responses":[
+    {
+    "name": <name of recipe>,
+    "ingredients": <list of ingredients>,
+    "instructions": <instructions>
+    "cooking_time": <cooking time>,
+    "servings": <servings>,
+    }]
+}
+
+Example:
+For 
+Dietary preferences: High Protein; 
+Dietary Restrictions: No sugar; 
+Available ingredients: Oats, banana, blueberry, strawberry, almond milk, cocoa powder, cashew nuts, peanut butter
+Type of meal: Breakfast
+Cooking time: 15
+Cooking Equipments Available: Blender
+Number of servings: 3
+Cuisine type: None
+
+
+Response should be like the following
+
+{
+"responses":[
+    {
+    "name": "Protein-Packed Berry Smoothie Bowl",
+    "ingredients": ["1 cup oats", "1 banana", "1/2 cup blueberries", "1/2 cup strawberries", "1 cup almond milk", "1 tbsp cocoa powder", "2 tbsp cashew nuts", "2 tbsp peanut butter"],
+    "instructions": "1. In a blender, combine oats, banana, blueberries, strawberries, almond milk, cocoa powder, cashew nuts, and peanut butter.
+2. Blend until smooth and creamy.
+3. Pour the smoothie into bowls.
+4. Top with additional berries, cashew nuts, and a drizzle of peanut butter.
+5. Serve and enjoy!",
+    "cooking_time": "15 minutes",
+    "servings": 3
+    },
+    { "name": "Protein-Packed Banana Smoothie Bowl",
+        "ingredients": [ "1 cup oats", "1 banana", "1 cup blueberries", "1 cup strawberries", "1 cup almond milk", "2 tbsp cocoa powder", "2 tbsp cashew nuts", "2 tbsp peanut butter" ],
+        "instructions": "1. In a blender, combine oats, banana, blueberries, strawberries, almond milk, cocoa powder, cashew nuts, and peanut butter.
+2. Blend until smooth and creamy.
+3. Pour the mixture into bowls.
+4. Optional: Top with additional banana slices, blueberries, strawberries, and cashew nuts.
+5. Serve immediately and enjoy!",
+        "cooking_time": "15 minutes",
+        "servings": 3
+    },
+    { 
+        "name": "Protein-Packed Banana Muffins",
+        "ingredients": ["1 cup oats", "1 scoop protein powder", "1/2 cup almond milk", "1/4 cup cashews", "1/4 cup cocoa powder", "1 banana", "2 tbsp peanut butter"],
+        "instructions": "1. Preheat the oven to 350°F (175°C). Grease a muffin tin or line with cupcake liners.
+2. In a blender, combine oats, protein powder, almond milk, cashews, cocoa powder, banana, and peanut butter.
+3. Blend until smooth and creamy.
+4. Pour the mixture into a mixing bowl.
+5. Add additional oats or almond milk if needed to adjust the consistency.
+6. Spoon the batter into the prepared muffin tin, filling each cup about 3/4 full.
+7. Optional: Top with additional cashews or banana slices.
+8. Bake for 12-15 minutes, or until a toothpick inserted into the center of a muffin comes out clean.
+9. Remove from the oven and let cool for a few minutes before transferring to a wire rack to cool completely.
+10. Serve and enjoy!",
+        "cooking_time": "17 minutes",
+        "servings": 2
+        }
+
+]
+}
+
+"""
+
+RULES = """Suggest vegan recipes for the request, at least two unless asked for one.
+Use mostly the available ingredients; keep extra ingredients to a minimum.
+Stay within the cooking time (shorter is better) and use only the listed equipment.
+Never use ingredients that conflict with the dietary restrictions."""
+
+SCHEMA = """Reply with JSON only:
+{"responses": [{"name": str, "ingredients": [str], "instructions": str, "cooking_time": str, "servings": int}]}
+Number the instruction steps. ingredients include quantities, e.g. "1/2 cup blueberries"."""
+
+SYSTEM_PROMPTS = {
+    'full': FULL_SYSTEM_PROMPT,
+    # Same rules and output format without the few-shot example
+    'compact': RULES + '\n' + SCHEMA,
+    # Compact prompt plus OpenAI JSON mode, which guarantees parseable output
+    'json_mode': RULES + '\n' + SCHEMA,
+}
+
+# Extra chat.completions.create arguments per variant
+REQUEST_OPTIONS = {
+    'json_mode': {'response_format': {'type': 'json_object'}},
+}
+
+# Form field -> label used in the user prompt
+USER_FIELDS = [
+    ('dietary_preferences', 'Dietary preferences'),
+    ('restrictions', 'Restrictions'),
+    ('available_ingredients', 'Available ingredients'),
+    ('meal_type', 'Type'),
+    ('cooking_time', 'Cooking time (minutes)'),
+    ('cooking_styles', 'Cooking equipment'),
+    ('cuisine_type', 'Cuisine'),
+    ('servings', 'Servings'),
+]
+
+
+def build_system_prompt(variant='compact'):
+    return SYSTEM_PROMPTS[variant]
+
+
+def request_options(variant='compact'):
+    return REQUEST_OPTIONS.get(variant, {})
+
+
+# One "Label: value" line per filled in field
+def build_user_prompt(fields):
+    lines = []
+    for name, label in USER_FIELDS:
+        value = fields.get(name)
+        if isinstance(value, (list, tuple)):
+            value = ', '.join(str(v) for v in value)
+        if value not in (None, ''):
+            lines.append(f'{label}: {value}')
+    return '\n'.join(lines)
+
+
+@lru_cache(maxsize=None)
+def _encoding(model):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    # The encoding files are downloaded on first use, which fails offline
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding('cl100k_base')
+    except Exception:
+        return None
+
+
+# Token count of a piece of text; roughly 4 characters per token without tiktoken
+def count_tokens(text, model=MODEL):
+    encoding = _encoding(model)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text))
+
+
+# Tokens of a chat request, including the per-message overhead of the chat format
+def count_message_tokens(messages, model=MODEL):
+    return sum(4 + count_tokens(m['content'], model) for m in messages) + 3
+
+
+def cost(prompt_tokens, completion_tokens=0, model=MODEL):
+    input_price, output_price = PRICES.get(model, PRICES[MODEL])
+    return (prompt_tokens * input_price + completion_tokens * output_price) / 1000
+
+
+# Token and cost summary for one request
+def report(system, user, completion='', model=MODEL):
+    prompt_tokens = count_message_tokens([{'role': 'system', 'content': system},
+                                          {'role': 'user', 'content': user}], model)
+    completion_tokens = count_tokens(completion, model) if completion else 0
+    return {
+        'system_tokens': count_tokens(system, model),
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': completion_tokens,
+        'cost_usd': cost(prompt_tokens, completion_tokens, model),
+    }
+
+
+EXAMPLE_FIELDS = {
+    'dietary_preferences': 'High Protein',
+    'restrictions': 'No sugar',
+    'available_ingredients': 'Oats, banana, blueberry, strawberry, almond milk, cocoa powder, cashew nuts, peanut butter',
+    'meal_type': 'Breakfast',
+    'cooking_time': 15,
+    'cooking_styles': ['Blender'],
+    'cuisine_type': '',
+    'servings': 3,
+}
+
+
+def main():
+    user = build_user_prompt(EXAMPLE_FIELDS)
+    baseline = None
+    for variant in SYSTEM_PROMPTS:
+        result = report(build_system_prompt(variant), user)
+        baseline = baseline or result['prompt_tokens']
+        saved = 1 - result['prompt_tokens'] / baseline
+        print(f"{variant:10} {result['prompt_tokens']:6d} input tokens  ${result['cost_usd']:.5f}  ({saved:.0%} saved)")
+    if _encoding(MODEL) is None:
+        print('tiktoken is unavailable; counts are estimates', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
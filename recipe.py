@@ -2,18 +2,17 @@
 
 import streamlit as st
 import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import linear_kernel
+from catalog import RECIPE_NAMES, RECIPE_INGREDIENTS
+from exclusions import ExclusionIndex
+from incremental_index import CommunityIndex
+from recommender import load_or_fit
+from retrieval import load_or_build
+from storage import shared_base
 
 # Sample data for recipes
 recipes_data = pd.DataFrame({
-    'Recipe': ['Vegan Pasta', 'Quinoa Salad', 'Sweet Potato Curry', 'Chickpea Stir-Fry'],
-    'Ingredients': [
-        'pasta, tomato sauce, vegetables',
-        'quinoa, vegetables, vinaigrette',
-        'sweet potato, coconut milk, curry paste',
-        'chickpeas, vegetables, soy sauce'
-    ]
+    'Recipe': RECIPE_NAMES,
+    'Ingredients': RECIPE_INGREDIENTS
 })
 
 # User input for preferences
@@ -30,16 +29,34 @@ user_data = pd.DataFrame({
     'Ingredient_Vulnerability': [ingredient_vulnerability]
 })
 
-# Preprocess data
-recipes_data['text'] = recipes_data['Ingredients'].str.replace(',', ' ')
-user_data['text'] = user_data[['Dietary_Preferences', 'Restrictions', 'Ingredient_Vulnerability']].apply(lambda x: ' '.join(x), axis=1)
+# Preprocess data; restrictions and vulnerabilities exclude recipes instead of ranking them
+user_data['text'] = user_data['Dietary_Preferences']
 
-# Vectorize text data
-tfidf_vectorizer = TfidfVectorizer(stop_words='english')
-tfidf_matrix = tfidf_vectorizer.fit_transform(pd.concat([recipes_data['text'], user_data['text']]))
+# Fit the TF-IDF model on the catalog once per process and open its
+# memory-mapped inverted index; reruns only score the query terms
+@st.cache_resource
+def get_index():
+    recommender = load_or_fit(recipes_data['Recipe'], recipes_data['Ingredients'])
+    return load_or_build(recommender)
 
-# Calculate cosine similarity
-cosine_sim = linear_kernel(tfidf_matrix, tfidf_matrix)
+@st.cache_resource
+def get_exclusions():
+    return ExclusionIndex(recipes_data['Ingredients'])
+
+# Recipes shared in the app's Recipes Feed, indexed incrementally; the
+# storage settings are the ones app.py reads
+@st.cache_resource
+def get_community_index():
+    backend = st.secrets.get('STORAGE_BACKEND', 'deta')
+    deta_key = st.secrets.get('DETA_KEY')
+    if backend == 'deta' and not deta_key:
+        return None
+    base = shared_base('recipes', backend, deta_key=deta_key, sqlite_path=st.secrets.get('SQLITE_PATH', 'nutriveg.db'))
+    return CommunityIndex(base)
+
+ingredient_index = get_index()
+exclusions = get_exclusions()
+community_index = get_community_index()
 
 # Streamlit app
 st.title('Vegan Recipe Recommender')
@@ -51,20 +68,20 @@ st.sidebar.text('Restrictions: ' + restrictions)
 st.sidebar.text('Ingredient Vulnerability: ' + ingredient_vulnerability)
 
 # Recommend recipes
-user_index = user_data.index[0]
-cosine_sim_user = cosine_sim[user_index]
-similar_recipes = list(enumerate(cosine_sim_user))
-
-# Sort recipes based on similarity
-similar_recipes = sorted(similar_recipes, key=lambda x: x[1], reverse=True)
+excluded = exclusions.mask(restrictions, ingredient_vulnerability)
+similar_recipes = ingredient_index.search(user_data['text'].iloc[0], k=5, exclude=excluded)
 
 # Display recommended recipes
 st.subheader('Recommended Recipes')
-for i in range(1, min(6, len(similar_recipes))):  # Display at most 5 recipes
-    recipe_index = similar_recipes[i][0]
+for recipe_index, score in similar_recipes:  # Display at most 5 recipes
+    st.write(recipes_data['Recipe'].iloc[recipe_index])
 
-    # Check if the recipe_index is within the valid range
-    if recipe_index < len(recipes_data):
-        st.write(recipes_data['Recipe'].iloc[recipe_index])
-    else:
-        st.warning("Recipe index out of bounds.")
+# Community uploads are picked up every few seconds without refitting anything
+if community_index is not None:
+    community_index.sync()
+    community_recipes = community_index.recommend(user_data['text'].iloc[0], k=5,
+                                                  restrictions=(restrictions, ingredient_vulnerability))
+    if community_recipes:
+        st.subheader('From the Community')
+        for recipe, score in community_recipes:
+            st.write(f"{recipe.get('title', '')} (shared by {recipe.get('username', '')})")
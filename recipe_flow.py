@@ -0,0 +1,133 @@
+# recipe_flow.py
+#
+# The recipe generation flow shared by the Dashboard (app.py) and the
+# standalone generator page (app2.py). A request is answered in order from
+#   1. community recipes that cover the form, when the page has local-first
+#   2. a cached answer to the same normalized form
+#   3. recipes streamed from OpenAI, each rendered as soon as it is
+#      complete; identical forms submitted together share one generation
+# and "Try Something New" is served from the random recipe pool when the
+# page has one, generating on the spot otherwise. The generation service,
+# cache, matcher and pool are passed as getters so the page only creates
+# (and imports) them once they are needed.
+
+import json
+
+import streamlit as st
+
+import metrics
+from nutrition import annotate, summary
+from recipe_parser import parse_response
+from response_cache import request_key
+
+RANDOM_PROMPT = "Generate a random vegan recipe"
+
+
+# nutrition is the recipe's entry from nutrition.annotate; computed here when not given
+@metrics.timed('stage_seconds', stage='render_recipe')
+def display_recipe(recipe, nutrition=None):
+    st.header(recipe['name'])
+    if recipe.get('shared_by'):
+        st.caption(f"Shared by {recipe['shared_by']} in the Recipes Feed")
+    macros = summary(nutrition or annotate([recipe])[0])
+    if macros:
+        st.caption(macros)
+    st.subheader('Ingredients')
+    ingredients = "\n".join("- " + i for i in recipe['ingredients'])
+    st.write(ingredients)
+    st.subheader('Instructions')
+    st.write(recipe["instructions"])
+    st.write("⏰ Cooking time: " + recipe["cooking_time"])
+    st.write("Servings: " + str(recipe["servings"]))
+    st.divider()
+
+
+def display_recipes(recipes):
+    for recipe, nutrition in zip(recipes, annotate(recipes)):
+        display_recipe(recipe, nutrition)
+
+
+class RecipeFlow:
+    """One page's recipe generator: where answers come from and how they render."""
+
+    def __init__(self, get_generation, system, options, get_cache, variant='', slots=2,
+                 get_local_first=None, get_pool=None):
+        self.get_generation = get_generation
+        self.system = system
+        self.options = options
+        self.get_cache = get_cache
+        # Part of the single flight key, so pages with other prompts never share a call
+        self.variant = variant
+        self.slots = slots
+        self.get_local_first = get_local_first
+        self.get_pool = get_pool
+
+    # Render each recipe as soon as any of the parallel requests completes it;
+    # returns the recipes shown. Sessions streaming the same key at the same
+    # time share the requests and each render every recipe.
+    def display_streamed_recipes(self, prompt, fan_out, limit=None, key=None):
+        from generation_service import fan_out_prompts
+        recipes = []
+        stream = self.get_generation().iter_recipes(self.system, fan_out_prompts(prompt, fan_out), self.options,
+                                                    key=key)
+        for recipe in stream:
+            display_recipe(recipe)
+            recipes.append(recipe)
+            if limit is not None and len(recipes) >= limit:
+                stream.close()
+                break
+        return recipes
+
+    # Answer the form in the user_prompt; returns the recipes shown
+    def generate(self, form_fields, user_prompt):
+        st.success("Recommended Recipes:")
+        local = []
+        local_first = self.get_local_first() if self.get_local_first else None
+        if local_first is not None:
+            # Community recipes the user can already cook come first; OpenAI only fills the rest
+            with metrics.timed('stage_seconds', stage='local_match'):
+                local = local_first.match(form_fields['available_ingredients'], form_fields['restrictions'],
+                                          form_fields['cooking_time'], k=self.slots)
+            display_recipes(local)
+        remaining = self.slots - len(local)
+        generated = []
+        if remaining:
+            # Reuse a recent answer to the same form, otherwise ask OpenAI
+            cache = self.get_cache()
+            cache_key = request_key(form_fields)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                with metrics.timed('stage_seconds', stage='json_parse'):
+                    generated = parse_response(cached).responses()[:remaining]
+            # An answer cached when more local recipes matched may be too short now
+            if len(generated) == remaining:
+                display_recipes(generated)
+            else:
+                with metrics.timed('stage_seconds', stage='generate_stream'):
+                    generated = self.display_streamed_recipes(user_prompt, fan_out=remaining,
+                                                              key=f'{cache_key}:{remaining}:{self.variant}')
+                metrics.log_sampled('recipes_generated', requested=remaining, received=len(generated),
+                                    local=len(local), names=[r.get('name') for r in generated])
+                if generated:
+                    # Only responses that parsed are worth serving again
+                    cache.set(cache_key, json.dumps({"responses": generated}))
+                elif not local:
+                    st.error("Error decoding JSON: no complete recipe in the response")
+        if local_first is not None:
+            local_first.record(len(local), len(generated))
+        return local + generated
+
+    # "Try Something New": a prefetched random recipe, or one generated now
+    # when the pool has run dry or the page has none
+    def random_recipe(self):
+        st.success("Random Recipe:")
+        recipe = self.get_pool().pop() if self.get_pool else None
+        if recipe is not None:
+            display_recipe(recipe)
+            return recipe
+        # Only the first recipe is shown, so stop generating once it is complete
+        recipes = self.display_streamed_recipes(RANDOM_PROMPT, fan_out=1, limit=1)
+        if not recipes:
+            st.error("Error decoding JSON: no complete recipe in the response")
+            return None
+        return recipes[0]
@@ -0,0 +1,277 @@
+# recipe_parser.py
+#
+# Tolerant parsing of the recipe JSON the LLM returns. The text goes through
+# increasingly expensive steps and stops at the first that works:
+#   1. plain json.loads (non-strict, so raw newlines inside "instructions",
+#      as in the few-shot example, are accepted), ignoring any text after it
+#   2. the same after stripping ``` code fences and leading prose, removing
+#      trailing commas and adding missing commas between objects
+#   3. salvaging every complete element of "responses" with the streaming
+#      parser, so a cut off answer still yields its finished recipes (the
+#      one it was cut off in is dropped rather than shown half written)
+# Each recipe is checked against a JSON schema compiled once per process and
+# coerced into a Recipe (minutes and servings as numbers, ingredients as a
+# list, numbered instruction steps). Recipes that fail are dropped on their
+# own, so one bad element no longer throws away the whole, paid for, answer.
+#
+#   result = parse_response(text)
+#   result.outcome    'ok', 'repaired', 'partial' or 'failed'
+#   result.responses()  -> [{'name': ..., 'cooking_time': '15 minutes', 'servings': 3, ...}]
+
+import json
+import logging
+import re
+from functools import lru_cache
+
+import metrics
+from durations import parse_minutes
+from streaming import ResponsesStreamParser
+
+logger = logging.getLogger(__name__)
+
+# What an element of "responses" may look like before coercion
+RECIPE_SCHEMA = {
+    '$schema': 'http://json-schema.org/draft-07/schema#',
+    'type': 'object',
+    'required': ['name', 'ingredients', 'instructions'],
+    'properties': {
+        'name': {'type': 'string', 'minLength': 1, 'maxLength': 300},
+        'ingredients': {
+            'anyOf': [
+                {'type': 'array', 'minItems': 1, 'maxItems': 100,
+                 'items': {'type': ['string', 'number', 'object']}},
+                {'type': 'string', 'minLength': 1},
+            ],
+        },
+        'instructions': {
+            'anyOf': [
+                {'type': 'string', 'minLength': 1},
+                {'type': 'array', 'minItems': 1, 'items': {'type': ['string', 'number']}},
+            ],
+        },
+        'cooking_time': {'type': ['string', 'number', 'null']},
+        'servings': {'type': ['string', 'number', 'null']},
+    },
+}
+
+# Keys some answers use instead of the ones in the prompt
+FIELD_ALIASES = {'title': 'name', 'recipe_name': 'name', 'steps': 'instructions', 'method': 'instructions',
+                 'time': 'cooking_time', 'cook_time': 'cooking_time', 'total_time': 'cooking_time',
+                 'serves': 'servings', 'yield': 'servings'}
+# Parts of an ingredient given as an object, in reading order
+INGREDIENT_PARTS = ('quantity', 'amount', 'qty', 'unit', 'name', 'item', 'ingredient')
+NOT_GIVEN = 'Not given'
+
+_DECODER = json.JSONDecoder(strict=False)
+_FENCE = re.compile(r'```[a-zA-Z]*\s*(.*?)(?:```|$)', re.DOTALL)
+_BULLET = re.compile(r'^\s*(?:[-*•]|\d+[.)])\s+')
+_STEP_NUMBER = re.compile(r'^\s*(?:step\s*)?\d+[.):]', re.IGNORECASE)
+_INTEGER = re.compile(r'\d+')
+
+
+class InvalidRecipe(ValueError):
+    pass
+
+
+@lru_cache(maxsize=1)
+def validator():
+    import jsonschema
+    cls = jsonschema.validators.validator_for(RECIPE_SCHEMA)
+    cls.check_schema(RECIPE_SCHEMA)
+    return cls(RECIPE_SCHEMA)
+
+
+class Recipe:
+    """A validated recipe with typed fields."""
+
+    __slots__ = ('name', 'ingredients', 'instructions', 'minutes', 'servings', 'cooking_time')
+
+    def __init__(self, name, ingredients, instructions, minutes=None, servings=None, cooking_time=None):
+        self.name = name
+        self.ingredients = ingredients
+        self.instructions = instructions
+        # Whole minutes, or None when the answer gave no time
+        self.minutes = minutes
+        self.servings = servings
+        # Display text; '<minutes> minutes' when the time was understood
+        self.cooking_time = cooking_time or (f'{minutes} minutes' if minutes is not None else NOT_GIVEN)
+
+    def __repr__(self):
+        return f'Recipe({self.name!r}, {len(self.ingredients)} ingredients, {self.minutes!r} min)'
+
+    # The dict shape display_recipe, the response cache and nutrition use
+    def as_dict(self):
+        return {'name': self.name, 'ingredients': list(self.ingredients), 'instructions': self.instructions,
+                'cooking_time': self.cooking_time,
+                'servings': self.servings if self.servings is not None else NOT_GIVEN}
+
+
+class ParseResult:
+    def __init__(self, recipes, outcome, errors=()):
+        self.recipes = recipes
+        self.outcome = outcome
+        self.errors = list(errors)
+
+    def __len__(self):
+        return len(self.recipes)
+
+    def responses(self):
+        return [recipe.as_dict() for recipe in self.recipes]
+
+
+def strip_fences(text):
+    match = _FENCE.search(text)
+    return match.group(1) if match and '{' in match.group(1) else text
+
+
+def _start(text):
+    starts = [i for i in (text.find('{'), text.find('[')) if i >= 0]
+    return min(starts) if starts else -1
+
+
+# First JSON value in text; prose before and after it is ignored
+def _decode(text):
+    start = _start(text)
+    if start < 0:
+        raise json.JSONDecodeError('No JSON object', text, 0)
+    return _DECODER.raw_decode(text, start)[0]
+
+
+# Fix the syntax errors LLMs make, in one pass that skips string contents:
+# trailing commas are dropped and missing commas between values are added
+def repair_json(text):
+    out = []
+    depth = 0
+    in_string = escape = False
+    for char in text:
+        if in_string:
+            out.append(char)
+            if escape:
+                escape = False
+            elif char == '\\':
+                escape = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char in '}]':
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ',':
+                out.pop()
+            depth = max(depth - 1, 0)
+        elif char in '{["':
+            # '} {' or '"a" "b"' inside an array or object: a comma is missing
+            previous = next((c for c in reversed(out) if not c.isspace()), '')
+            if previous in ('}', ']', '"') and depth:
+                out.append(',')
+            if char == '"':
+                in_string = True
+            else:
+                depth += 1
+        out.append(char)
+    return ''.join(out)
+
+
+# Parse LLM JSON leniently; returns (data, 'ok' or 'repaired') or raises ValueError
+def loads(text):
+    try:
+        return _decode(text), 'ok'
+    except ValueError:
+        pass
+    text = strip_fences(text)
+    start = _start(text)
+    if start < 0:
+        raise json.JSONDecodeError('No JSON object', text, 0)
+    return _decode(repair_json(text[start:])), 'repaired'
+
+
+def _recipe_items(data):
+    if isinstance(data, dict):
+        for key in ('responses', 'recipes', 'response', 'recipe'):
+            if key in data:
+                return _recipe_items(data[key])
+        return [data] if 'name' in data or 'title' in data else []
+    if isinstance(data, list):
+        return [item for item in data if isinstance(item, dict)]
+    return []
+
+
+def _ingredient_text(value):
+    if isinstance(value, dict):
+        parts = [value[k] for k in INGREDIENT_PARTS if value.get(k) not in (None, '')]
+        value = ' '.join(str(p) for p in parts or value.values())
+    return _BULLET.sub('', str(value)).strip()
+
+
+def _ingredients(value):
+    if isinstance(value, str):
+        lines = value.splitlines() if '\n' in value.strip() else value.split(',')
+        value = lines
+    return [text for text in map(_ingredient_text, value) if text]
+
+
+def _instructions(value):
+    if isinstance(value, list):
+        steps = [str(step).strip() for step in value if str(step).strip()]
+        return '\n'.join(step if _STEP_NUMBER.match(step) else f'{i}. {step}'
+                         for i, step in enumerate(steps, 1))
+    return value.strip()
+
+
+def _servings(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(round(value)) if value > 0 else None
+    match = _INTEGER.search(str(value or ''))
+    return int(match.group()) if match and int(match.group()) > 0 else None
+
+
+# Validate one element of "responses" and coerce it into a Recipe
+def coerce_recipe(item):
+    if not isinstance(item, dict):
+        raise InvalidRecipe('recipe is not an object')
+    item = {FIELD_ALIASES.get(key, key): value for key, value in item.items()}
+    check = validator()
+    if not check.is_valid(item):
+        import jsonschema
+        error = jsonschema.exceptions.best_match(check.iter_errors(item))
+        path = '.'.join(str(p) for p in error.absolute_path) or 'recipe'
+        raise InvalidRecipe(f'{path}: {error.message}')
+    name = item['name'].strip()
+    ingredients = _ingredients(item['ingredients'])
+    instructions = _instructions(item['instructions'])
+    if not name or not ingredients or not instructions:
+        raise InvalidRecipe('empty name, ingredients or instructions')
+    minutes = parse_minutes(item.get('cooking_time'))
+    minutes = int(round(minutes)) if minutes is not None and minutes > 0 else None
+    raw_time = item.get('cooking_time')
+    # Keep a time the parser did not understand ('overnight') as it was given
+    cooking_time = None if minutes is not None or not isinstance(raw_time, str) or not raw_time.strip() \
+        else raw_time.strip()
+    return Recipe(name, ingredients, instructions, minutes, _servings(item.get('servings')), cooking_time)
+
+
+# Every valid recipe in an LLM answer, recovering what it can from broken JSON
+def parse_response(text):
+    try:
+        data, outcome = loads(text)
+        items = _recipe_items(data)
+    except ValueError:
+        # Truncated or mangled beyond repair: keep the complete elements
+        outcome = 'partial'
+        text = strip_fences(text)
+        items = ResponsesStreamParser().feed(repair_json(text[max(_start(text), 0):]))
+    recipes, errors = [], []
+    for item in items:
+        try:
+            recipes.append(coerce_recipe(item))
+        except InvalidRecipe as e:
+            errors.append(str(e))
+    if errors:
+        logger.warning('Dropped %d invalid recipes: %s', len(errors), '; '.join(errors))
+        outcome = 'partial'
+    if not recipes:
+        outcome = 'failed'
+    metrics.inc('llm_parse_total', outcome=outcome)
+    return ParseResult(recipes, outcome, errors)
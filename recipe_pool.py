@@ -0,0 +1,213 @@
+# recipe_pool.py
+#
+# Pool of pre-generated random recipes for "Try Something New", which does
+# not depend on anything the user typed and so can be generated ahead of
+# time. The button pops a recipe from a deque in O(1); a background worker
+# refills the pool from OpenAI whenever it falls to the low watermark,
+# topping it up to the high one. Each refill asks for a spread of meal types
+# and cuisines, favouring the ones the pool has fewest of, and skips recipes
+# whose name is already pooled or was served recently. The pool is saved to
+# a JSON file after every change the worker sees and loaded again on start,
+# so a restart neither loses the pool nor pays to rebuild it.
+#
+#   RANDOM_POOL_LOW    refill when at most this many recipes are left (default 3)
+#   RANDOM_POOL_HIGH   fill up to this many (default 10; 0 disables the pool)
+#   RANDOM_POOL_PATH   where the pool is saved (default random_recipes.json)
+
+import atexit
+import collections
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+import metrics
+from recipe_parser import InvalidRecipe, coerce_recipe, parse_response
+
+logger = logging.getLogger(__name__)
+
+LOW_WATERMARK = int(os.getenv('RANDOM_POOL_LOW', '3'))
+HIGH_WATERMARK = int(os.getenv('RANDOM_POOL_HIGH', '10'))
+POOL_PATH = os.getenv('RANDOM_POOL_PATH', 'random_recipes.json')
+
+MEAL_TYPES = ('Breakfast', 'Lunch', 'Dinner')
+CUISINES = ('Indian', 'Thai', 'Italian', 'Mexican', 'Mediterranean', 'Japanese', 'Middle Eastern', 'American')
+# Names served recently are not pooled again
+RECENT_NAMES = 100
+
+
+def random_prompt(meal_type, cuisine):
+    return (f'Generate a random vegan {meal_type.lower()} recipe inspired by {cuisine} cuisine.\n'
+            'Return exactly one recipe in "responses".')
+
+
+class RecipePool:
+    """Bounded FIFO of random recipes, refilled by a background thread."""
+
+    def __init__(self, generation, system, options=None, low=LOW_WATERMARK, high=HIGH_WATERMARK,
+                 path=POOL_PATH, batch_size=4, name='recipe-pool'):
+        # generation is a generation_service.GenerationService
+        self.generation = generation
+        self.system = system
+        self.options = options
+        self.high = max(high, 0)
+        self.low = min(low, self.high)
+        self.path = path
+        self.batch_size = batch_size
+        # (meal type, cuisine) and recipe dict, oldest first
+        self._pool = collections.deque()
+        self._recent = collections.deque(maxlen=RECENT_NAMES)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._dirty = False
+        self._closed = False
+        self.served = 0
+        self.misses = 0
+        self.generated = 0
+        self.duplicates = 0
+        self.refills = 0
+        self.failures = 0
+        self._load()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        self._wake.set()
+        atexit.register(self.close)
+
+    def __len__(self):
+        return len(self._pool)
+
+    # The oldest pooled recipe, or None when the pool is empty
+    def pop(self):
+        with self._lock:
+            entry = self._pool.popleft() if self._pool else None
+            if entry is None:
+                self.misses += 1
+            else:
+                self.served += 1
+                self._recent.append(entry[1]['name'].casefold())
+                self._dirty = True
+        metrics.inc('random_pool_pops_total', result='miss' if entry is None else 'hit')
+        # The worker saves the pool and refills it when it is low
+        self._wake.set()
+        return entry[1] if entry else None
+
+    def _names(self):
+        return {recipe['name'].casefold() for _, recipe in self._pool} | set(self._recent)
+
+    # Meal type and cuisine pairs for the next n recipes, least pooled first
+    def _varieties(self, n):
+        counts = collections.Counter(variety for variety, _ in self._pool)
+        meals = collections.Counter(meal for meal, _ in counts.elements())
+        cuisines = collections.Counter(cuisine for _, cuisine in counts.elements())
+        chosen = []
+        for _ in range(n):
+            pairs = [(meal, cuisine) for meal in MEAL_TYPES for cuisine in CUISINES]
+            random.shuffle(pairs)
+            pair = min(pairs, key=lambda p: (meals[p[0]] + cuisines[p[1]], counts[p]))
+            chosen.append(pair)
+            counts[pair] += 1
+            meals[pair[0]] += 1
+            cuisines[pair[1]] += 1
+        return chosen
+
+    # Generate n recipes in parallel, one request per meal type and cuisine;
+    # returns how many were added
+    def _refill(self, n):
+        import asyncio
+        from generation_service import backoff_delay
+        self.refills += 1
+        requests = [(variety, asyncio.run_coroutine_threadsafe(
+            self.generation.agenerate(self.system, random_prompt(*variety), self.options), self.generation.loop))
+            for variety in self._varieties(n)]
+        failed = added = 0
+        for variety, future in requests:
+            try:
+                recipes = parse_response(future.result()).responses()
+            except Exception as e:
+                failed += 1
+                logger.warning('Random recipe request failed: %r', e)
+                continue
+            with self._lock:
+                for recipe in recipes[:1]:
+                    if recipe['name'].casefold() in self._names():
+                        self.duplicates += 1
+                        continue
+                    self._pool.append((variety, recipe))
+                    self.generated += 1
+                    added += 1
+                    self._dirty = True
+        if failed:
+            self.failures += failed
+            # Back off before the next refill, but wake up for close()
+            self._wake.wait(backoff_delay(min(self.failures, 6), base=1.0, max_delay=60.0))
+        return added
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait()
+            self._wake.clear()
+            if self._closed:
+                break
+            self._save()
+            if len(self._pool) > self.low:
+                continue
+            # Top up to the high watermark, a batch of parallel requests at a time
+            while not self._closed and len(self._pool) < self.high:
+                added = self._refill(min(self.batch_size, self.high - len(self._pool)))
+                self._save()
+                # Nothing usable came back; try again on the next pop rather than spin
+                if not added:
+                    break
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            logger.exception('Ignoring unreadable recipe pool %s', self.path)
+            return
+        for entry in saved.get('recipes', [])[:self.high]:
+            try:
+                recipe = coerce_recipe(entry['recipe']).as_dict()
+            except (InvalidRecipe, KeyError, TypeError):
+                continue
+            self._pool.append((tuple(entry.get('variety') or ('', '')), recipe))
+        self._recent.extend(saved.get('recent', []))
+
+    # Write the pool atomically when it changed since the last save
+    def _save(self):
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {'saved': time.time(), 'recent': list(self._recent),
+                    'recipes': [{'variety': list(variety), 'recipe': recipe} for variety, recipe in self._pool]}
+            self._dirty = False
+        tmp = f'{self.path}.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp, self.path)
+        except OSError:
+            logger.exception('Saving the recipe pool to %s failed', self.path)
+
+    # Stop the worker and save what is left; safe to call more than once
+    def close(self, timeout=10.0):
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self._thread.join(timeout)
+        self._save()
+
+    def stats(self):
+        return {'depth': len(self._pool), 'low': self.low, 'high': self.high, 'served': self.served,
+                'misses': self.misses, 'generated': self.generated, 'duplicates': self.duplicates,
+                'refills': self.refills, 'failures': self.failures,
+                'meal_types': len({variety[0] for variety, _ in self._pool}),
+                'cuisines': len({variety[1] for variety, _ in self._pool})}
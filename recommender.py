@@ -0,0 +1,118 @@
+# recommender.py
+#
+# TF-IDF recipe recommender that is fitted on the catalog once and then
+# answers each query with a single 1xN sparse dot product.
+
+import hashlib
+import os
+import pickle
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'recommender.pkl')
+
+
+# Turn the comma separated ingredient string into the text we vectorize
+def ingredients_to_text(ingredients):
+    return ingredients.replace(',', ' ')
+
+
+# Identify a catalog so a saved model can tell when it is out of date
+def catalog_fingerprint(recipe_names, ingredients):
+    digest = hashlib.sha1()
+    for name, ingredient in zip(recipe_names, ingredients):
+        digest.update(name.encode('utf-8') + b'\0' + ingredient.encode('utf-8') + b'\0')
+    return digest.hexdigest()
+
+
+# Pick the k best scores, highest first; ties keep catalog order like a stable sort
+def top_k(scores, k):
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        # Anything tied with the k-th score may belong in the result as well
+        cutoff = scores[candidates].min()
+        above = np.flatnonzero(scores > cutoff)
+        tied = np.flatnonzero(scores == cutoff)[:k - len(above)]
+        candidates = np.concatenate([above, tied])
+    else:
+        candidates = np.arange(len(scores))
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order][:k]
+
+
+class RecipeRecommender:
+    """Content based recommender over the recipe catalog."""
+
+    def __init__(self, stop_words='english'):
+        self.vectorizer = TfidfVectorizer(stop_words=stop_words)
+        self.recipe_names = []
+        self.recipe_matrix = None
+        self.fingerprint = None
+
+    def fit(self, recipe_names, ingredients):
+        self.recipe_names = list(recipe_names)
+        ingredients = list(ingredients)
+        self.fingerprint = catalog_fingerprint(self.recipe_names, ingredients)
+        texts = [ingredients_to_text(i) for i in ingredients]
+        # Rows are l2 normalised, so a dot product is the cosine similarity
+        self.recipe_matrix = self.vectorizer.fit_transform(texts).tocsr()
+        # The vectorizer leaves each row's terms in first-seen order; sorted,
+        # the dot product adds them in term order, as retrieval.py does
+        self.recipe_matrix.sort_indices()
+        return self
+
+    def __len__(self):
+        return len(self.recipe_names)
+
+    def transform_query(self, text):
+        return self.vectorizer.transform([text])
+
+    # Cosine similarity of the query against every recipe, as a dense 1-D array
+    def scores(self, text):
+        query = self.transform_query(text)
+        return (self.recipe_matrix @ query.T).toarray().ravel()
+
+    # Return [(recipe_index, score), ...] for the k most similar recipes.
+    # exclude is an optional boolean mask of recipes that must never be returned.
+    def recommend(self, text, k=5, exclude=None):
+        scores = self.scores(text)
+        if exclude is not None:
+            scores[exclude] = -np.inf
+        return [(int(i), float(scores[i])) for i in top_k(scores, k) if scores[i] > -np.inf]
+
+    def save(self, path=MODEL_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path=MODEL_PATH):
+        with open(path, 'rb') as f:
+            model = pickle.load(f)
+        # Models saved before fit sorted them
+        if model.recipe_matrix is not None:
+            model.recipe_matrix.sort_indices()
+        return model
+
+
+# Load the saved model, fitting and saving a new one if it is missing or stale
+def load_or_fit(recipe_names, ingredients, path=MODEL_PATH):
+    recipe_names = list(recipe_names)
+    ingredients = list(ingredients)
+    fingerprint = catalog_fingerprint(recipe_names, ingredients)
+    if os.path.exists(path):
+        try:
+            model = RecipeRecommender.load(path)
+            if model.fingerprint == fingerprint:
+                return model
+        except (OSError, pickle.UnpicklingError, AttributeError, EOFError):
+            pass
+    model = RecipeRecommender().fit(recipe_names, ingredients)
+    model.save(path)
+    return model
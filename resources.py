@@ -0,0 +1,117 @@
+# resources.py
+#
+# Process wide registry of long lived clients (the OpenAI service, the Deta
+# HTTP client, storage bases). Streamlit reruns the script for every
+# interaction, so anything built at module level would be rebuilt and lose
+# its keep-alive connections and TLS sessions; the registry builds each
+# resource once, hands the same instance to every session and thread, and
+# closes them all at interpreter exit.
+#
+# Pool limits for the HTTP clients:
+#   HTTP_MAX_CONNECTIONS    open connections per client (default 20)
+#   HTTP_MAX_KEEPALIVE      idle connections kept open (default 10)
+#   HTTP_KEEPALIVE_EXPIRY   seconds an idle connection is kept (default 60)
+
+import atexit
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+MAX_CONNECTIONS = int(os.getenv('HTTP_MAX_CONNECTIONS', '20'))
+MAX_KEEPALIVE = int(os.getenv('HTTP_MAX_KEEPALIVE', '10'))
+KEEPALIVE_EXPIRY = float(os.getenv('HTTP_KEEPALIVE_EXPIRY', '60'))
+
+
+class _Entry:
+    def __init__(self, value, close, stats):
+        self.value = value
+        self.close = close
+        self.stats = stats
+
+
+class ResourceRegistry:
+    """Creates each named resource once and closes them in reverse order."""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.RLock()
+        self._closed = False
+
+    # The resource called name, built with factory() the first time.
+    # close(value) and stats(value) are optional callbacks.
+    def get(self, name, factory, close=None, stats=None):
+        entry = self._entries.get(name)
+        if entry is not None:
+            return entry.value
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                if self._closed:
+                    raise RuntimeError('resource registry is closed')
+                entry = self._entries[name] = _Entry(factory(), close, stats)
+            return entry.value
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    def stats(self):
+        with self._lock:
+            entries = list(self._entries.items())
+        return {name: entry.stats(entry.value) for name, entry in entries if entry.stats}
+
+    # Close everything that has a close callback; later gets raise
+    def close(self):
+        with self._lock:
+            self._closed = True
+            entries = list(self._entries.items())
+            self._entries.clear()
+        for name, entry in reversed(entries):
+            if entry.close is None:
+                continue
+            try:
+                entry.close(entry.value)
+            except Exception:
+                logger.exception('Closing %s failed', name)
+
+
+registry = ResourceRegistry()
+# Registered when this module is first imported, so it runs after the
+# atexit handlers of write-behind queues created later and their final
+# flush still has open clients
+atexit.register(registry.close)
+
+
+def get(name, factory, close=None, stats=None):
+    return registry.get(name, factory, close, stats)
+
+
+def stats():
+    return registry.stats()
+
+
+def http_limits():
+    import httpx
+    return httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE,
+                        keepalive_expiry=KEEPALIVE_EXPIRY)
+
+
+# Connection counts of an httpx.Client or AsyncClient, read from its httpcore pool
+def pool_stats(client):
+    pool = getattr(getattr(client, '_transport', None), '_pool', None)
+    connections = list(getattr(pool, 'connections', []))
+    return {
+        'connections': len(connections),
+        'idle': sum(1 for c in connections if c.is_idle()),
+        'max_connections': MAX_CONNECTIONS,
+        'max_keepalive': MAX_KEEPALIVE,
+    }
+
+
+# Shared, thread safe httpx.Client with the tuned pool limits
+def http_client(name, base_url='', headers=None, timeout=10.0):
+    def build():
+        import httpx
+        return httpx.Client(base_url=base_url, headers=headers, timeout=timeout, limits=http_limits())
+    return registry.get(f'http:{name}', build, close=lambda client: client.close(), stats=pool_stats)
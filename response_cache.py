@@ -0,0 +1,149 @@
+# response_cache.py
+#
+# Cache for generated recipe responses keyed on the normalized form
+# fields rather than the prompt text, so "Oats, Banana" and "banana,oats"
+# share an entry. An in-memory LRU sits in front of an optional SQLite tier
+# that survives restarts; both honour a TTL and a size limit.
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Free text fields that hold comma separated lists
+LIST_FIELDS = ('dietary_preferences', 'restrictions', 'available_ingredients')
+
+
+def _normalize_text(value):
+    return ' '.join(str(value or '').casefold().split())
+
+
+def _normalize_list(value):
+    if isinstance(value, str):
+        value = value.split(',')
+    return sorted({_normalize_text(v) for v in value or [] if _normalize_text(v)})
+
+
+# Canonical form of the recipe generator inputs
+def normalize_request(fields):
+    normalized = {}
+    for name, value in fields.items():
+        if name in LIST_FIELDS or isinstance(value, (list, tuple, set)):
+            normalized[name] = _normalize_list(value)
+        elif isinstance(value, (int, float)):
+            normalized[name] = value
+        else:
+            normalized[name] = _normalize_text(value)
+    return normalized
+
+
+def request_key(fields):
+    canonical = json.dumps(normalize_request(fields), sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """Thread safe LRU + TTL cache with an optional SQLite tier."""
+
+    def __init__(self, max_entries=256, ttl=3600, max_value_bytes=64 * 1024,
+                 sqlite_path=None, max_disk_entries=10000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_value_bytes = max_value_bytes
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._db = None
+        if sqlite_path:
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('CREATE TABLE IF NOT EXISTS responses '
+                             '(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL, accessed REAL NOT NULL)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+            self._db.commit()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            row = self._disk_get(key, now)
+            if row is not None:
+                value, expires = row
+                self.disk_hits += 1
+                # Keeps the row's expiry; a disk hit does not restart the TTL
+                self._remember(key, value, expires)
+                return value
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        if len(value.encode('utf-8')) > self.max_value_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now + self.ttl)
+            self._disk_set(key, value, now)
+
+    def _remember(self, key, value, expires):
+        self._entries[key] = (expires, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    # (value, expires) of an unexpired row, or None
+    def _disk_get(self, key, now):
+        if self._db is None:
+            return None
+        row = self._db.execute('SELECT value, expires FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] <= now:
+            self._db.execute('DELETE FROM responses WHERE key = ?', (key,))
+            self._db.commit()
+            return None
+        self._db.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+        self._db.commit()
+        return row[0], row[1]
+
+    def _disk_set(self, key, value, now):
+        if self._db is None:
+            return
+        self._db.execute('INSERT OR REPLACE INTO responses (key, value, expires, accessed) VALUES (?, ?, ?, ?)',
+                         (key, value, now + self.ttl, now))
+        # Drop expired rows, then the least recently used ones over the limit
+        self._db.execute('DELETE FROM responses WHERE expires <= ?', (now,))
+        self._db.execute('DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed DESC '
+                         'LIMIT -1 OFFSET ?)', (self.max_disk_entries,))
+        self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute('DELETE FROM responses')
+                self._db.commit()
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_ratio': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            'entries': len(self._entries),
+        }
@@ -0,0 +1,154 @@
+# retrieval.py
+#
+# Inverted index over the recipe Ingredients terms. A query only reads the
+# postings of its own terms: they are gathered with numpy and summed per
+# recipe with np.bincount, in ascending term order, which is the order the
+# sparse dot product of RecipeRecommender.scores adds them in. The scores
+# are therefore bit-for-bit the scan's, and top_k breaks ties by catalog
+# order, so search returns exactly what RecipeRecommender.recommend does.
+#
+# On disk the index is a directory of .npy arrays that are opened with
+# mmap_mode='r', so several server processes share one copy through the
+# page cache. Files are never rewritten in place while another process may
+# have them mapped: every save writes a new version directory, renames it
+# into place, and then atomically points CURRENT at it.
+#
+#   CURRENT         name of the version directory to load
+#   <version>/
+#     indptr.npy    postings offsets per term (int64, n_terms + 1)
+#     docs.npy      document ids of every posting, ascending per term (int32)
+#     weights.npy   tf-idf weight of every posting (float64)
+#     query.pkl     fitted vectorizer used to turn the query into term weights
+#     meta.json     number of documents and the catalog fingerprint
+
+import json
+import os
+import pickle
+import secrets
+import shutil
+import time
+
+import numpy as np
+
+from recommender import MODEL_PATH, top_k
+
+INDEX_PATH = os.path.join(os.path.dirname(MODEL_PATH), 'ingredient_index')
+# Replaced versions are deleted once they are this old; a process that still
+# has one mapped keeps its pages, and a concurrent save has time to finish
+STALE_VERSION_SECONDS = 600
+
+
+class InvertedIndex:
+    """Term -> postings index answering top-k cosine queries."""
+
+    def __init__(self, vectorizer, indptr, docs, weights, n_docs, fingerprint=None):
+        self.vectorizer = vectorizer
+        self.indptr = indptr
+        self.docs = docs
+        self.weights = weights
+        self.n_docs = n_docs
+        self.fingerprint = fingerprint
+        # Counts postings read by the last search, useful when profiling
+        self.postings_touched = 0
+
+    @classmethod
+    def from_recommender(cls, recommender):
+        matrix = recommender.recipe_matrix.tocsc()
+        matrix.sort_indices()
+        return cls(recommender.vectorizer, matrix.indptr.astype(np.int64), matrix.indices.astype(np.int32),
+                   matrix.data.astype(np.float64), matrix.shape[0], recommender.fingerprint)
+
+    def __len__(self):
+        return self.n_docs
+
+    # Cosine similarity of the query against every recipe, as a dense 1-D array
+    def scores(self, text):
+        query = self.vectorizer.transform([text]).tocsr()
+        query.sort_indices()
+        docs, weights = [], []
+        for term, query_weight in zip(query.indices, query.data):
+            start, end = self.indptr[term], self.indptr[term + 1]
+            docs.append(self.docs[start:end])
+            # weight * query_weight, the product the dot product takes
+            weights.append(self.weights[start:end] * query_weight)
+        if not docs:
+            self.postings_touched = 0
+            return np.zeros(self.n_docs)
+        docs = np.concatenate(docs)
+        self.postings_touched = len(docs)
+        return np.bincount(docs, weights=np.concatenate(weights), minlength=self.n_docs)
+
+    # Return [(recipe_index, score), ...] for the k most similar recipes.
+    # exclude is an optional boolean mask of recipes that must never be returned.
+    def search(self, text, k=5, exclude=None):
+        scores = self.scores(text)
+        if exclude is not None:
+            scores[exclude] = -np.inf
+        return [(int(i), float(scores[i])) for i in top_k(scores, k) if scores[i] > -np.inf]
+
+    # Write a new version directory and make it the current one; returns its name
+    def save(self, path=INDEX_PATH):
+        os.makedirs(path, exist_ok=True)
+        version = f"{time.time_ns()}-{(self.fingerprint or '')[:12]}-{secrets.token_hex(2)}"
+        tmp = os.path.join(path, f'.tmp-{version}')
+        os.makedirs(tmp)
+        np.save(os.path.join(tmp, 'indptr.npy'), self.indptr)
+        np.save(os.path.join(tmp, 'docs.npy'), self.docs)
+        np.save(os.path.join(tmp, 'weights.npy'), self.weights)
+        with open(os.path.join(tmp, 'query.pkl'), 'wb') as f:
+            pickle.dump(self.vectorizer, f, protocol=pickle.HIGHEST_PROTOCOL)
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump({'n_docs': self.n_docs, 'fingerprint': self.fingerprint}, f)
+        os.replace(tmp, os.path.join(path, version))
+        current = os.path.join(path, f'.CURRENT-{version}')
+        with open(current, 'w') as f:
+            f.write(version)
+        os.replace(current, os.path.join(path, 'CURRENT'))
+        _remove_stale_versions(path, version)
+        return version
+
+    @classmethod
+    def load(cls, path=INDEX_PATH, mmap=True):
+        mode = 'r' if mmap else None
+        with open(os.path.join(path, 'CURRENT')) as f:
+            path = os.path.join(path, f.read().strip())
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        with open(os.path.join(path, 'query.pkl'), 'rb') as f:
+            vectorizer = pickle.load(f)
+        return cls(vectorizer,
+                   np.load(os.path.join(path, 'indptr.npy'), mmap_mode=mode),
+                   np.load(os.path.join(path, 'docs.npy'), mmap_mode=mode),
+                   np.load(os.path.join(path, 'weights.npy'), mmap_mode=mode),
+                   meta['n_docs'], meta.get('fingerprint'))
+
+
+# Delete old versions and leftovers of failed saves, along with the files
+# of the unversioned layout; errors (a file still open on Windows) are ignored
+def _remove_stale_versions(path, current):
+    cutoff = time.time() - STALE_VERSION_SECONDS
+    for name in os.listdir(path):
+        full = os.path.join(path, name)
+        if name in (current, 'CURRENT'):
+            continue
+        try:
+            if os.path.isdir(full):
+                if os.path.getmtime(full) < cutoff:
+                    shutil.rmtree(full)
+            elif name.endswith(('.npy', '.pkl', '.json')):
+                os.remove(full)
+        except OSError:
+            pass
+
+
+# Open the saved index for this recommender, rebuilding it if it is missing or stale
+def load_or_build(recommender, path=INDEX_PATH):
+    try:
+        index = InvertedIndex.load(path)
+        if index.fingerprint == recommender.fingerprint:
+            return index
+    except (OSError, ValueError, pickle.UnpicklingError, KeyError):
+        pass
+    index = InvertedIndex.from_recommender(recommender)
+    index.save(path)
+    return InvertedIndex.load(path)
@@ -0,0 +1,267 @@
+# search_index.py
+#
+# Full-text search over the community recipes. An in-memory inverted index
+# over title, ingredients and recipe text ranks matches with BM25, with
+# title and ingredient terms weighted above the instructions. It is built
+# once from the recipes base and then updated on every upload, so a search
+# only reads the postings of its own terms and never fetches the base.
+#
+# Query syntax: plain words must match exactly (after lowercasing); a word
+# ending in '*' matches every term with that prefix, and with prefix=True
+# the last word does too (search as you type). Results can be restricted to
+# one username and to a timestamp range.
+
+import bisect
+import datetime
+import re
+import threading
+from array import array
+
+import numpy as np
+
+from durations import parse_minutes
+from ingredients import TABLE, parse_ingredients, singular
+
+# Weight of a term occurrence in each field
+FIELD_WEIGHTS = {'title': 3.0, 'ingredients': 2.0, 'recipe': 1.0}
+
+# Most frequent matching terms a prefix expands to
+MAX_PREFIX_TERMS = 64
+
+_TOKEN = re.compile(r'[a-z0-9]+')
+
+STOP_WORDS = frozenset('''
+a an and are as at be by for from in into is it of on or the then to with
+'''.split())
+
+
+# Words are singularized the way ingredient names are, so 'tomatoes' finds 'tomato'
+def tokenize(text):
+    return [singular(t) for t in _TOKEN.findall(str(text or '').lower()) if t not in STOP_WORDS]
+
+
+# Minutes a recipe takes: its cooking_time when it has one, otherwise the
+# sum of the times in its steps ('Simmer 20 minutes'); NaN when neither says
+def recipe_minutes(recipe):
+    minutes = parse_minutes(recipe.get('cooking_time'))
+    if minutes is None:
+        minutes = parse_minutes(recipe.get('recipe') or recipe.get('instructions'))
+    return float('nan') if minutes is None or minutes <= 0 else minutes
+
+
+def _timestamp(value):
+    if isinstance(value, datetime.datetime):
+        return value.timestamp()
+    try:
+        return datetime.datetime.fromisoformat(str(value)).timestamp()
+    except ValueError:
+        return float('nan')
+
+
+class _Postings:
+    __slots__ = ('docs', 'weights')
+
+    def __init__(self):
+        self.docs = array('i')
+        self.weights = array('f')
+
+
+class RecipeSearchIndex:
+    """BM25 ranked inverted index with prefix terms and username/date filters."""
+
+    def __init__(self, k1=1.2, b=0.75, field_weights=FIELD_WEIGHTS):
+        self.k1 = k1
+        self.b = b
+        self.field_weights = field_weights
+        self.postings = {}
+        # Sorted vocabulary for prefix lookups
+        self.terms = []
+        self.keys = []
+        self.doc_ids = {}
+        self.recipes = []
+        # Canonical ingredient ids of each document
+        self.ingredients = []
+        self.lengths = array('f')
+        self.timestamps = array('d')
+        self.minutes = array('f')
+        self.alive = array('b')
+        self.by_username = {}
+        self.total_length = 0.0
+        self.live_docs = 0
+        # Postings arrays are appended to in place, so readers take the lock too
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.live_docs
+
+    def __contains__(self, key):
+        return key in self.doc_ids
+
+    def get(self, key):
+        doc = self.doc_ids.get(key)
+        return None if doc is None else self.recipes[doc]
+
+    def ingredient_ids(self, key):
+        doc = self.doc_ids.get(key)
+        return () if doc is None else self.ingredients[doc]
+
+    # Minutes the recipe takes, or None when it does not say
+    def recipe_minutes(self, key):
+        doc = self.doc_ids.get(key)
+        if doc is None or np.isnan(self.minutes[doc]):
+            return None
+        return float(self.minutes[doc])
+
+    # Ingredients are indexed by their canonical names, without quantities and units
+    def _weighted_counts(self, recipe, ingredient_ids):
+        counts = {}
+        for field, weight in self.field_weights.items():
+            if field == 'ingredients':
+                text = ' '.join(TABLE.name(i) for i in ingredient_ids)
+            else:
+                text = recipe.get(field)
+            for token in tokenize(text):
+                counts[token] = counts.get(token, 0.0) + weight
+        return counts
+
+    # Index one recipe dict; a recipe whose key is already indexed replaces it
+    def add(self, recipe):
+        self.add_many([recipe])
+
+    def add_many(self, recipes):
+        with self._lock:
+            for recipe in recipes:
+                self._add(recipe)
+
+    def _add(self, recipe):
+        key = recipe['key']
+        if key in self.doc_ids:
+            self._remove(key)
+        doc = len(self.keys)
+        ingredient_ids = tuple(i.ingredient_id for i in parse_ingredients(recipe.get('ingredients')))
+        counts = self._weighted_counts(recipe, ingredient_ids)
+        for term, weight in counts.items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = _Postings()
+                bisect.insort(self.terms, term)
+            postings.docs.append(doc)
+            postings.weights.append(weight)
+        length = sum(counts.values())
+        self.keys.append(key)
+        self.doc_ids[key] = doc
+        self.recipes.append(recipe)
+        self.ingredients.append(ingredient_ids)
+        self.lengths.append(length)
+        self.timestamps.append(_timestamp(recipe.get('timestamp')))
+        self.minutes.append(recipe_minutes(recipe))
+        self.alive.append(1)
+        self.by_username.setdefault(recipe.get('username'), array('i')).append(doc)
+        self.total_length += length
+        self.live_docs += 1
+
+    def remove(self, key):
+        with self._lock:
+            self._remove(key)
+
+    # Removed documents stay in the postings and are masked out at query time
+    def _remove(self, key):
+        doc = self.doc_ids.pop(key, None)
+        if doc is None:
+            return
+        self.alive[doc] = 0
+        self.recipes[doc] = None
+        self.ingredients[doc] = ()
+        self.total_length -= self.lengths[doc]
+        self.live_docs -= 1
+
+    # Exact term, or the most frequent terms starting with the prefix
+    def _expand(self, term, prefix):
+        if not prefix:
+            return [term] if term in self.postings else []
+        start = bisect.bisect_left(self.terms, term)
+        end = bisect.bisect_left(self.terms, term + '\uffff')
+        matches = self.terms[start:end]
+        if len(matches) > MAX_PREFIX_TERMS:
+            matches = sorted(matches, key=lambda t: len(self.postings[t].docs), reverse=True)[:MAX_PREFIX_TERMS]
+        return matches
+
+    def _query_terms(self, query, prefix):
+        parsed = []
+        for word in str(query or '').lower().split():
+            is_prefix = word.endswith('*')
+            tokens = _TOKEN.findall(word)
+            parsed.extend([singular(token), False] for token in tokens[:-1] if token not in STOP_WORDS)
+            if tokens and (is_prefix or tokens[-1] not in STOP_WORDS):
+                parsed.append([singular(tokens[-1]), is_prefix])
+        if parsed and prefix and not str(query).endswith(' '):
+            parsed[-1][1] = True
+        return parsed
+
+    def _filter_mask(self, n_docs, username, since, until):
+        mask = np.frombuffer(self.alive, dtype=np.int8)[:n_docs].astype(bool)
+        if username is not None:
+            allowed = np.zeros(n_docs, dtype=bool)
+            docs = self.by_username.get(username)
+            if docs is not None:
+                allowed[np.frombuffer(docs, dtype=np.int32)] = True
+            mask &= allowed
+        if since is not None or until is not None:
+            timestamps = np.frombuffer(self.timestamps, dtype=np.float64)[:n_docs]
+            if since is not None:
+                mask &= timestamps >= _timestamp(since)
+            if until is not None:
+                mask &= timestamps < _timestamp(until)
+        return mask
+
+    # [(key, score), ...] best first. With no query terms, the recipes that
+    # pass the filters are returned newest first with a score of 0.
+    def search(self, query='', k=20, username=None, since=None, until=None, prefix=False):
+        with self._lock:
+            n_docs = len(self.keys)
+            if not n_docs or not self.live_docs:
+                return []
+            mask = self._filter_mask(n_docs, username, since, until)
+            terms = self._query_terms(query, prefix)
+            if not terms:
+                candidates = np.flatnonzero(mask)
+                newest = np.argsort(-np.nan_to_num(np.frombuffer(self.timestamps, dtype=np.float64)[candidates],
+                                                   nan=-np.inf), kind='stable')[:k]
+                return [(self.keys[i], 0.0) for i in candidates[newest]]
+
+            lengths = np.frombuffer(self.lengths, dtype=np.float32)[:n_docs]
+            average_length = self.total_length / self.live_docs
+            scores = np.zeros(n_docs, dtype=np.float64)
+            for term, is_prefix in terms:
+                # Prefix expansions of one word share its BM25 contribution through the best match
+                best = np.zeros(n_docs, dtype=np.float64)
+                for expanded in self._expand(term, is_prefix):
+                    postings = self.postings[expanded]
+                    docs = np.frombuffer(postings.docs, dtype=np.int32)
+                    tf = np.frombuffer(postings.weights, dtype=np.float32)
+                    df = len(docs)
+                    idf = np.log(1 + (self.live_docs - df + 0.5) / (df + 0.5))
+                    norm = self.k1 * (1 - self.b + self.b * lengths[docs] / average_length)
+                    # A document appears at most once per postings list
+                    best[docs] = np.maximum(best[docs], idf * tf * (self.k1 + 1) / (tf + norm))
+                scores += best
+            scores[~mask] = 0
+            hits = np.flatnonzero(scores > 0)
+            if len(hits) > k:
+                hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+            hits = hits[np.lexsort((hits, -scores[hits]))]
+            return [(self.keys[i], float(scores[i])) for i in hits]
+
+    def search_recipes(self, query='', k=20, **filters):
+        return [self.get(key) for key, _ in self.search(query, k, **filters)]
+
+
+# Build the index from every recipe in a storage base, one page at a time
+def build_from_base(base, page_size=1000):
+    index = RecipeSearchIndex()
+    response = base.fetch(limit=page_size)
+    index.add_many(response.items)
+    while response.last:
+        response = base.fetch(limit=page_size, last=response.last)
+        index.add_many(response.items)
+    return index
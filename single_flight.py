@@ -0,0 +1,164 @@
+# single_flight.py
+#
+# Request coalescing for identical generation requests. When several
+# sessions submit the same request (a popular preset, a double click) while
+# it is still running, only the first one, the leader, calls upstream; the
+# others join its flight and read the same results as they arrive. Results
+# are kept per flight, so a caller that joins late still sees everything
+# produced so far. An upstream error is raised in every caller, and the
+# upstream call is cancelled only once every caller has stopped reading.
+#
+#   flights = SingleFlight()
+#   with flights.join(key, start) as results:   # start(flight) runs only for the leader
+#       for item in results:
+#           ...
+
+import threading
+
+import metrics
+
+
+class Flight:
+    """Results of one upstream call, readable by any number of callers."""
+
+    def __init__(self, key):
+        self.key = key
+        self.items = []
+        self.done = False
+        self.cancelled = False
+        self.error = None
+        self.readers = 0
+        # Set by the leader's start(); stops the upstream call
+        self.cancel = None
+        self._cond = threading.Condition()
+        self._on_done = []
+
+    # Producer side: called from whatever thread runs the upstream call
+    def publish(self, item):
+        with self._cond:
+            self.items.append(item)
+            self._cond.notify_all()
+
+    def finish(self, error=None):
+        with self._cond:
+            if self.done:
+                return
+            self.done = True
+            self.error = error
+            self._cond.notify_all()
+            callbacks, self._on_done = self._on_done, []
+        for callback in callbacks:
+            callback(self)
+
+    # A new reader, or None once the flight is finished or cancelled
+    def _register(self):
+        with self._cond:
+            if self.done or self.cancelled:
+                return None
+            self.readers += 1
+        return Reader(self)
+
+    def _leave(self):
+        with self._cond:
+            self.readers -= 1
+            abandoned = self.readers == 0 and not self.done
+            if abandoned:
+                self.cancelled = True
+        if abandoned and self.cancel is not None:
+            self.cancel()
+
+
+class Reader:
+    """One caller's iterator over a flight's results.
+
+    Every result from the first, blocking until the next one arrives; the
+    upstream error, if any, is raised after the results before it. The
+    reader counts towards the flight from the moment it is created until it
+    is exhausted or closed, by close(), a with block or garbage collection,
+    so a caller that never iterates still lets the flight be cancelled.
+    """
+
+    __slots__ = ('flight', 'index', 'closed', '__weakref__')
+
+    def __init__(self, flight):
+        self.flight = flight
+        self.index = 0
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.closed:
+            raise StopIteration
+        flight = self.flight
+        with flight._cond:
+            while self.index >= len(flight.items) and not flight.done:
+                flight._cond.wait()
+            if self.index < len(flight.items):
+                item = flight.items[self.index]
+                self.index += 1
+                return item
+            error = flight.error
+        self.close()
+        if error is not None:
+            raise error
+        raise StopIteration
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.flight._leave()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+
+class SingleFlight:
+    """In-flight calls by key, shared by every thread of the process."""
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.deduplicated = 0
+
+    # A Reader of the running flight for key, or of a new one started with
+    # start(flight), which returns a function that cancels the upstream call.
+    # The reader is registered before the lock is released, so the flight
+    # cannot be cancelled between joining it and reading it.
+    def join(self, key, start):
+        with self._lock:
+            flight = self._flights.get(key)
+            reader = flight._register() if flight is not None else None
+            leader = reader is None
+            if leader:
+                flight = self._flights[key] = Flight(key)
+                flight._on_done.append(self._forget)
+                reader = flight._register()
+                self.calls += 1
+            else:
+                self.deduplicated += 1
+        metrics.inc('single_flight_total', role='leader' if leader else 'follower')
+        if leader:
+            try:
+                flight.cancel = start(flight)
+            except Exception as e:
+                flight.finish(e)
+        return reader
+
+    def _forget(self, flight):
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+
+    def stats(self):
+        with self._lock:
+            in_flight = len(self._flights)
+        return {'calls': self.calls, 'deduplicated': self.deduplicated, 'in_flight': in_flight}
@@ -0,0 +1,353 @@
+# storage.py
+#
+# Storage backends for the `user` and `recipes` bases. Both implement the
+# subset of the Deta Base API the app uses (get, put, put_many, fetch,
+# update, delete), so app code does not care which one it talks to:
+#
+#   DetaStorage    the hosted Deta Base, over its HTTP API
+#   SQLiteStorage  a local SQLite file in WAL mode, for single-server
+#                  deployments, offline development and load testing
+
+import functools
+import json
+import os
+import secrets
+import sqlite3
+import sys
+import threading
+import time
+from urllib.parse import quote
+
+import metrics
+import resources
+
+# Same limit Deta enforces for put_many
+PUT_MANY_LIMIT = 25
+
+# Point at another Deta compatible server, e.g. benchmarks/fake_servers.py
+DETA_BASE_URL = os.getenv('DETA_BASE_URL', 'https://database.deta.sh/v1')
+
+# Fields stored in their own indexed columns
+INDEXED_FIELDS = ('username', 'timestamp')
+
+
+class _Trim:
+    def __repr__(self):
+        return 'TRIM'
+
+
+# Update value that removes the field, like deta's base.util.trim()
+TRIM = _Trim()
+
+
+# Whether a failed storage call may succeed if tried again: a locked or busy
+# SQLite database, a network error, or a 429/5xx from Deta. httpx is only
+# checked once something has imported it, so this never loads it.
+def is_transient(error):
+    if isinstance(error, sqlite3.OperationalError):
+        message = str(error).lower()
+        return 'locked' in message or 'busy' in message
+    httpx = sys.modules.get('httpx')
+    if httpx is not None:
+        if isinstance(error, httpx.TransportError):
+            return True
+        if isinstance(error, httpx.HTTPStatusError):
+            status = error.response.status_code
+            return status == 429 or status >= 500
+    return False
+
+
+class FetchResponse:
+    """Result page of a fetch, shaped like deta.base.FetchResponse."""
+
+    def __init__(self, items, last=None):
+        self.items = items
+        self.count = len(items)
+        self.last = last
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+# Time a storage call into the db_seconds histogram by backend, base and operation
+def _timed(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with metrics.timed('db_seconds', backend=self.backend, base=self.name, op=method.__name__):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class Storage:
+    """Interface shared by the storage backends."""
+
+    backend = None
+
+    def get(self, key):
+        raise NotImplementedError
+
+    # expire_in is in seconds; expired items are no longer returned
+    def put(self, data, key=None, expire_in=None):
+        raise NotImplementedError
+
+    def put_many(self, items, expire_in=None):
+        raise NotImplementedError
+
+    def fetch(self, query=None, limit=1000, last=None):
+        raise NotImplementedError
+
+    # Set the given top level fields of an existing item; fields set to TRIM are removed
+    def update(self, updates, key):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+
+class DetaStorage(Storage):
+    """A Deta Base spoken to over its HTTP API.
+
+    Every base shares one pooled, keep-alive httpx client per project
+    (see deta_client), which unlike the SDK's per-base connection is safe
+    to use from several sessions at once.
+    """
+
+    backend = 'deta'
+
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def _path(self, key=None):
+        if key is None:
+            return f'{self.name}/items'
+        return f'{self.name}/items/{quote(key, safe="")}'
+
+    @staticmethod
+    def _item(data, key=None, expire_in=None):
+        item = dict(data)
+        if key:
+            item['key'] = key
+        if expire_in is not None:
+            item['__expires'] = int(time.time() + expire_in)
+        return item
+
+    @_timed
+    def get(self, key):
+        response = self.client.get(self._path(key))
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()
+
+    # Timed as its put_many call
+    def put(self, data, key=None, expire_in=None):
+        processed = self.put_many([self._item(data, key)], expire_in=expire_in)
+        items = processed.get('processed', {}).get('items', [])
+        return items[0] if items else None
+
+    @_timed
+    def put_many(self, items, expire_in=None):
+        if len(items) > PUT_MANY_LIMIT:
+            raise ValueError(f'put_many takes at most {PUT_MANY_LIMIT} items')
+        response = self.client.put(self._path(),
+                                   json={'items': [self._item(i, expire_in=expire_in) for i in items]})
+        response.raise_for_status()
+        return response.json()
+
+    @_timed
+    def fetch(self, query=None, limit=1000, last=None):
+        body = {'limit': limit}
+        if query:
+            body['query'] = query if isinstance(query, list) else [query]
+        if last:
+            body['last'] = last
+        response = self.client.post(f'{self.name}/query', json=body)
+        response.raise_for_status()
+        result = response.json()
+        return FetchResponse(result.get('items', []), result.get('paging', {}).get('last'))
+
+    @_timed
+    def update(self, updates, key):
+        body = {'set': {field: value for field, value in updates.items() if value is not TRIM}}
+        trimmed = [field for field, value in updates.items() if value is TRIM]
+        if trimmed:
+            body['delete'] = trimmed
+        self.client.patch(self._path(key), json=body).raise_for_status()
+
+    @_timed
+    def delete(self, key):
+        self.client.delete(self._path(key)).raise_for_status()
+
+
+# Deta query operators that SQLiteStorage understands
+_OPERATORS = {'lt': '<', 'lte': '<=', 'gt': '>', 'gte': '>=', 'ne': '!='}
+
+
+class SQLiteStorage(Storage):
+    """One table per base; items are JSON documents keyed by `key`.
+
+    Expiring items carry an `__expires` unix time like Deta items do.
+    """
+
+    backend = 'sqlite'
+
+    def __init__(self, path, name):
+        if not name.isidentifier():
+            raise ValueError(f'Invalid base name: {name!r}')
+        self.path = path
+        self.name = name
+        self.table = f'base_{name}'
+        self._local = threading.local()
+        # Statements are constant strings, so sqlite3 compiles each one once
+        # per connection and reuses it from its statement cache
+        self._get_sql = f'SELECT data FROM {self.table} WHERE key = ? AND {self._live}'
+        self._put_sql = f'INSERT OR REPLACE INTO {self.table} (key, username, timestamp, data) VALUES (?, ?, ?, ?)'
+        self._delete_sql = f'DELETE FROM {self.table} WHERE key = ?'
+        self._prune_sql = f'DELETE FROM {self.table} WHERE NOT {self._live}'
+        conn = self._conn()
+        with conn:
+            conn.execute(f'CREATE TABLE IF NOT EXISTS {self.table} '
+                         '(key TEXT PRIMARY KEY, username TEXT, timestamp TEXT, data TEXT NOT NULL)')
+            for field in INDEXED_FIELDS:
+                conn.execute(f'CREATE INDEX IF NOT EXISTS {self.table}_{field} ON {self.table} ({field})')
+
+    # One connection per thread; WAL lets readers run alongside the writer
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, cached_statements=256)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    # SQL condition that is true for items that have not expired
+    _live = ("(json_extract(data, '$.__expires') IS NULL OR "
+             "json_extract(data, '$.__expires') > CAST(strftime('%s', 'now') AS INTEGER))")
+
+    def _row(self, data, key, expire_in=None):
+        item = dict(data)
+        item['key'] = key or item.get('key') or secrets.token_hex(6)
+        if expire_in is not None:
+            item['__expires'] = int(time.time() + expire_in)
+        return item, (item['key'], item.get('username'), item.get('timestamp'), json.dumps(item))
+
+    @_timed
+    def get(self, key):
+        row = self._conn().execute(self._get_sql, (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    @_timed
+    def put(self, data, key=None, expire_in=None):
+        item, row = self._row(data, key, expire_in)
+        with self._conn() as conn:
+            conn.execute(self._put_sql, row)
+        return item
+
+    @_timed
+    def put_many(self, items, expire_in=None):
+        if len(items) > PUT_MANY_LIMIT:
+            raise ValueError(f"Can't put more than {PUT_MANY_LIMIT} items at a time")
+        rows = [self._row(item, None, expire_in) for item in items]
+        with self._conn() as conn:
+            conn.executemany(self._put_sql, [row for _, row in rows])
+        return {'processed': {'items': [item for item, _ in rows]}}
+
+    @_timed
+    def update(self, updates, key):
+        conn = self._conn()
+        with conn:
+            # Take the write lock before reading so concurrent updates do not interleave
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(self._get_sql, (key,)).fetchone()
+            if row is None:
+                raise KeyError(key)
+            item = json.loads(row[0])
+            for field, value in updates.items():
+                if value is TRIM:
+                    item.pop(field, None)
+                else:
+                    item[field] = value
+            conn.execute(self._put_sql, self._row(item, key)[1])
+
+    # Names of the bases in this database file that start with prefix
+    def list_bases(self, prefix=''):
+        rows = self._conn().execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()
+        return sorted(name[len('base_'):] for name, in rows
+                      if name.startswith('base_' + prefix))
+
+    # Delete expired items; Deta does this by itself
+    def prune_expired(self):
+        with self._conn() as conn:
+            return conn.execute(self._prune_sql).rowcount
+
+    @_timed
+    def delete(self, key):
+        with self._conn() as conn:
+            conn.execute(self._delete_sql, (key,))
+
+    @staticmethod
+    def _condition(field, value):
+        field, _, op = field.partition('?')
+        column = field if field in INDEXED_FIELDS + ('key',) else f"json_extract(data, '$.{field}')"
+        if op == 'pfx':
+            return f'{column} LIKE ? ESCAPE ?', [value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%', '\\']
+        if op:
+            return f'{column} {_OPERATORS[op]} ?', [value]
+        return f'{column} = ?', [value]
+
+    # Deta style query: a dict of conditions ANDed, or a list of such dicts ORed
+    def _where(self, query):
+        if not query:
+            return '', []
+        groups = query if isinstance(query, list) else [query]
+        clauses, params = [], []
+        for group in groups:
+            parts = []
+            for field, value in group.items():
+                if not all(part.isidentifier() for part in field.partition('?')[0].split('.')):
+                    raise ValueError(f'Invalid query field: {field!r}')
+                sql, values = self._condition(field, value)
+                parts.append(sql)
+                params.extend(values)
+            clauses.append('(' + ' AND '.join(parts or ['1']) + ')')
+        return ' OR '.join(clauses), params
+
+    # Items in ascending key order; `last` is set when more items remain
+    @_timed
+    def fetch(self, query=None, limit=1000, last=None):
+        where, params = self._where(query)
+        conditions = [self._live] + ([f'({where})'] if where else [])
+        if last is not None:
+            conditions.append('key > ?')
+            params.append(last)
+        sql = f'SELECT data FROM {self.table} WHERE ' + ' AND '.join(conditions) + ' ORDER BY key LIMIT ?'
+        rows = self._conn().execute(sql, params + [limit + 1]).fetchall()
+        items = [json.loads(row[0]) for row in rows[:limit]]
+        return FetchResponse(items, items[-1]['key'] if len(rows) > limit else None)
+
+
+# Pooled HTTP client for a Deta project, shared by all of its bases
+def deta_client(deta_key):
+    if not deta_key:
+        raise ValueError('DETA_KEY is not set')
+    project_id = deta_key.split('_')[0]
+    return resources.http_client(f'deta-{project_id}', base_url=f'{DETA_BASE_URL}/{project_id}/',
+                                 headers={'X-API-Key': deta_key})
+
+
+# Open a base on the configured backend ('deta' or 'sqlite')
+def open_base(name, backend='deta', deta_key=None, sqlite_path='nutriveg.db'):
+    if backend == 'sqlite':
+        return SQLiteStorage(sqlite_path, name)
+    if backend == 'deta':
+        return DetaStorage(deta_client(deta_key), name)
+    raise ValueError(f'Unknown storage backend: {backend!r}')
+
+
+# The process wide handle for a base, opened on first use
+def shared_base(name, backend='deta', deta_key=None, sqlite_path='nutriveg.db'):
+    location = sqlite_path if backend == 'sqlite' else None
+    return resources.get(f'base:{backend}:{location}:{name}',
+                         lambda: open_base(name, backend, deta_key=deta_key, sqlite_path=sqlite_path))
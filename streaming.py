@@ -0,0 +1,84 @@
+# streaming.py
+#
+# Incremental parser for streamed recipe responses. Text is fed in as it
+# arrives from the OpenAI stream and every element of the "responses" array
+# is returned as soon as its closing brace is seen, so the first recipe can
+# be rendered while the rest are still being generated.
+
+import json
+
+
+class ResponsesStreamParser:
+    """Emit each complete object of the top level "responses" array."""
+
+    def __init__(self, array_key='responses'):
+        self.array_key = array_key
+        self.text = ''
+        self._pos = 0
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_string = None
+        self._key = None
+        self._array_depth = None
+        self._element_start = None
+        self.emitted = 0
+
+    # Consume a chunk of text and return the recipes it completed
+    def feed(self, chunk):
+        self.text += chunk
+        completed = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            char = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._last_string = text[self._string_start:i]
+                continue
+            if char == '"':
+                if self._stack:
+                    self._in_string = True
+                    self._string_start = i + 1
+            elif char == ':':
+                # A string followed by ':' directly inside the outer object is a key
+                if len(self._stack) == 1:
+                    self._key = self._last_string
+            elif char in '{[':
+                if char == '{' and self._array_depth is not None and len(self._stack) == self._array_depth:
+                    self._element_start = i
+                self._stack.append(char)
+                if char == '[' and len(self._stack) == 2 and self._key == self.array_key:
+                    self._array_depth = len(self._stack)
+            elif char in '}]':
+                if not self._stack:
+                    continue
+                self._stack.pop()
+                if self._element_start is not None and len(self._stack) == self._array_depth:
+                    element = self._decode(text[self._element_start:i + 1])
+                    self._element_start = None
+                    if element is not None:
+                        completed.append(element)
+                elif char == ']' and len(self._stack) == 1:
+                    self._array_depth = None
+        self._pos = len(text)
+        self.emitted += len(completed)
+        return completed
+
+    # Elements with trailing commas and the like are repaired by recipe_parser
+    @staticmethod
+    def _decode(text):
+        try:
+            return json.loads(text, strict=False)
+        except json.JSONDecodeError:
+            pass
+        from recipe_parser import loads
+        try:
+            return loads(text)[0]
+        except ValueError:
+            return None
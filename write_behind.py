@@ -0,0 +1,144 @@
+# write_behind.py
+#
+# Background writer that takes puts and updates off the request path. Writes
+# are buffered in a bounded queue and flushed by a worker thread with
+# put_many, once a batch is full or the oldest write has waited
+# flush_interval seconds. A full queue blocks the caller (backpressure),
+# flushes that fail with a transient error are retried with backoff while
+# any other error drops the batch at once, and close() drains everything at
+# shutdown.
+
+import atexit
+import logging
+import queue
+import random
+import threading
+import time
+
+from storage import PUT_MANY_LIMIT, TRIM, is_transient
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class WriteBehindQueue:
+    """Batches writes to one storage base on a background thread."""
+
+    def __init__(self, base, batch_size=PUT_MANY_LIMIT, flush_interval=1.0, max_pending=1000,
+                 max_retries=5, expire_in=None, name='write-behind'):
+        self.base = base
+        self.batch_size = min(batch_size, PUT_MANY_LIMIT)
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.expire_in = expire_in
+        self._queue = queue.Queue(maxsize=max_pending)
+        self.written = 0
+        self.retries = 0
+        self.dropped = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+    # Queue an item for put_many; blocks while the queue is full
+    def put(self, item, timeout=None):
+        if self._closed:
+            raise RuntimeError('write-behind queue is closed')
+        self._queue.put(('put', item), timeout=timeout)
+        return item
+
+    # Queue an update of some fields of an existing item
+    def update(self, updates, key, timeout=None):
+        if self._closed:
+            raise RuntimeError('write-behind queue is closed')
+        self._queue.put(('update', key, updates), timeout=timeout)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            op = self._queue.get()
+            if op is _STOP:
+                break
+            batch = [op]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    op = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if op is _STOP:
+                    stopping = True
+                    break
+                batch.append(op)
+            self._write(batch)
+        # Drain whatever was queued before close()
+        rest = []
+        while True:
+            try:
+                op = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if op is not _STOP:
+                rest.append(op)
+        for start in range(0, len(rest), self.batch_size):
+            self._write(rest[start:start + self.batch_size])
+
+    def _write(self, batch):
+        # Later writes to the same key win; updates to one key are merged
+        puts, updates = {}, {}
+        for op in batch:
+            if op[0] == 'put':
+                item = op[1]
+                puts[item['key']] = item
+                updates.pop(item['key'], None)
+            else:
+                _, key, fields = op
+                if key in puts:
+                    item = dict(puts[key], **fields)
+                    puts[key] = {k: v for k, v in item.items() if v is not TRIM}
+                else:
+                    updates.setdefault(key, {}).update(fields)
+        if puts:
+            items = list(puts.values())
+            self._with_retries(lambda: self.base.put_many(items, expire_in=self.expire_in), len(items))
+        for key, fields in updates.items():
+            self._with_retries(lambda: self.base.update(fields, key), 1)
+
+    def _with_retries(self, write, count):
+        for attempt in range(self.max_retries + 1):
+            try:
+                write()
+                self.written += count
+                return
+            except Exception as e:
+                # A permanent error (a missing key, a bad item) would only
+                # stall every write queued behind it
+                if not is_transient(e):
+                    self.dropped += count
+                    logger.exception('Dropping %d writes after a permanent error', count)
+                    return
+                if attempt == self.max_retries:
+                    self.dropped += count
+                    logger.exception('Dropping %d writes after %d attempts', count, attempt + 1)
+                    return
+                self.retries += 1
+                time.sleep(random.uniform(0, min(30.0, 0.2 * 2 ** attempt)))
+
+    # Flush everything and stop the worker; safe to call more than once
+    def close(self, timeout=30.0):
+        if self._closed:
+            return
+        self._closed = True
+        # A closed queue has nothing left to flush at exit
+        atexit.unregister(self.close)
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def stats(self):
+        return {'pending': self.pending, 'written': self.written, 'retries': self.retries,
+                'dropped': self.dropped}